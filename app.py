@@ -3,9 +3,10 @@ import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
+import io
 import secrets
 import time
 import threading
@@ -15,18 +16,39 @@ from filesystem import FileSystem
 from process_manager import ProcessManager
 from memory_manager import MemoryManager
 from shell import Shell
+from jobs import JobScheduler
+from streaming import OutputStream
 from users import UserManager
 from devices import DeviceManager
 from systemd import SystemD
 from network import NetworkManager
 from package_manager import PackageManager
+from session_manager import SessionManager
+from worker_pool import WorkerPool
+from host_metrics import host_metrics
+from storage import open_storage
+from procfs import proc_fs, sys_fs
+from snapshot import SnapshotError, dump_delta, dump_filesystem, load_delta, load_filesystem
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secrets.token_hex(32)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
-sessions = {}
+COMMAND_TIME_LIMIT = float(os.environ.get('PYLINUX_COMMAND_TIME_LIMIT', 10))
+COMMAND_ITERATION_LIMIT = int(os.environ.get('PYLINUX_COMMAND_ITERATION_LIMIT', 5000000))
+SESSION_QUOTA = {
+    'bytes': int(os.environ.get('PYLINUX_QUOTA_BYTES', 64 * 1024 * 1024)),
+    'inodes': int(os.environ.get('PYLINUX_QUOTA_INODES', 65536)),
+}
+USER_QUOTA = {
+    'bytes': int(os.environ.get('PYLINUX_USER_QUOTA_BYTES', 0)),
+    'inodes': int(os.environ.get('PYLINUX_USER_QUOTA_INODES', 0)),
+}
+STORAGE = open_storage(os.environ.get('PYLINUX_STORAGE', 'memory'))
+INDEXING = os.environ.get('PYLINUX_INDEXING', '1') != '0'
+JOB_TIME_LIMIT = float(os.environ.get('PYLINUX_JOB_TIME_LIMIT', 600))
+MAX_JOBS = int(os.environ.get('PYLINUX_MAX_JOBS', 16))
 
 class LinuxSystem:
     def __init__(self, session_id):
@@ -35,7 +57,10 @@ class LinuxSystem:
         self.state = 'off'
         self.runlevel = 0
         self.memory_manager = MemoryManager()
-        self.filesystem = FileSystem()
+        self.filesystem = FileSystem(STORAGE, session_id)
+        self.filesystem.quota.update(SESSION_QUOTA)
+        self.filesystem.user_quota.update(USER_QUOTA)
+        self.filesystem.indexing = INDEXING
         self.user_manager = UserManager(self.filesystem)
         self.device_manager = DeviceManager()
         self.process_manager = ProcessManager()
@@ -44,6 +69,8 @@ class LinuxSystem:
         self.package_manager = PackageManager(self.filesystem)
         self.shell = Shell(self)
         self.kernel = Kernel(self)
+        self.filesystem.mount_virtual('/proc', proc_fs(self))
+        self.filesystem.mount_virtual('/sys', sys_fs(self))
         self.current_user = None
         self.hostname = 'localhost'
         self.environment = {
@@ -71,8 +98,21 @@ class LinuxSystem:
             'h': 'history',
             'grep': 'grep --color=auto',
         }
-        self.jobs = []
+        self.jobs = JobScheduler(self)
+        self.jobs.time_limit = JOB_TIME_LIMIT
+        self.jobs.max_jobs = MAX_JOBS
         self.last_exit_code = 0
+        self.limits = {'time': COMMAND_TIME_LIMIT, 'iterations': COMMAND_ITERATION_LIMIT}
+        self.busy = 0
+        self.busy_lock = threading.Lock()
+
+    def pin(self):
+        with self.busy_lock:
+            self.busy += 1
+
+    def unpin(self):
+        with self.busy_lock:
+            self.busy -= 1
 
     def boot(self, callback):
         if self.state == 'running':
@@ -89,8 +129,10 @@ class LinuxSystem:
             callback("[WARN] System not running\n")
             return
         self.state = 'shutting_down'
+        self.jobs.kill_all()
         self.systemd.stop_all_services(callback)
         self.kernel.shutdown(callback, reboot)
+        self.filesystem.flush()
         if reboot:
             self.state = 'off'
             time.sleep(0.5)
@@ -104,12 +146,19 @@ class LinuxSystem:
             return 0
         return time.time() - self.boot_time
 
-    def execute_command(self, command):
+    def execute_command(self, command, stream=None):
         if self.state != 'running':
             return "System not running. Boot first.\n"
         if command.strip():
             self.history.append(command)
-        return self.shell.execute(command)
+        self.pin()
+        try:
+            with self.jobs.foreground:
+                output = self.shell.execute(command, stream)
+            return output + self.jobs.drain()
+        finally:
+            self.filesystem.flush()
+            self.unpin()
 
     def get_prompt(self):
         if self.state != 'running':
@@ -122,11 +171,105 @@ class LinuxSystem:
             return f"{user}@{self.hostname}:{cwd}# "
         return f"{user}@{self.hostname}:{cwd}$ "
 
+    def snapshot(self):
+        return {
+            'session_id': self.session_id,
+            'state': self.state,
+            'boot_time': self.boot_time,
+            'runlevel': self.runlevel,
+            'current_user': self.current_user,
+            'hostname': self.hostname,
+            'environment': self.environment,
+            'history': self.history,
+            'aliases': self.aliases,
+            'last_exit_code': self.last_exit_code,
+            'limits': self.limits,
+            'user_quotas': self.filesystem.user_quotas,
+            'filesystem': self.filesystem_snapshot(),
+            'cwd': self.filesystem.cwd,
+            'kernel_modules': self.kernel.modules,
+            'dmesg': self.kernel.dmesg_buffer,
+            'services': self.systemd.services,
+            'packages': self.package_manager.installed,
+            'users': self.user_manager.users,
+            'groups': self.user_manager.groups,
+            'next_uid': self.user_manager.next_uid,
+            'next_gid': self.user_manager.next_gid,
+        }
 
-def get_system(session_id):
-    if session_id not in sessions:
-        sessions[session_id] = LinuxSystem(session_id)
-    return sessions[session_id]
+    def filesystem_snapshot(self):
+        if self.filesystem.persistent:
+            self.filesystem.flush()
+            return {'epoch': self.filesystem.epoch, 'changed': {}, 'deleted': []}
+        return self.filesystem.changes_since()
+
+    @classmethod
+    def from_snapshot(cls, data):
+        system = cls(data['session_id'])
+        system.state = data['state']
+        system.boot_time = data['boot_time']
+        system.runlevel = data['runlevel']
+        system.current_user = data['current_user']
+        system.hostname = data['hostname']
+        system.environment = data['environment']
+        system.history = data['history']
+        system.aliases = data['aliases']
+        system.last_exit_code = data['last_exit_code']
+        system.limits.update(data.get('limits', {}))
+        system.filesystem.user = data['current_user'] or 'root'
+        system.filesystem.user_quotas.update(data.get('user_quotas', {}))
+        system.filesystem.initialize()
+        system.filesystem.apply_delta(data['filesystem'])
+        system.filesystem.epoch = data['filesystem']['epoch']
+        system.filesystem.journal_floor = system.filesystem.version
+        system.filesystem.cwd = data['cwd']
+        system.kernel.modules = data['kernel_modules']
+        system.kernel.dmesg_buffer = data['dmesg']
+        system.systemd.services = data['services']
+        system.package_manager.installed = data['packages']
+        system.user_manager.users = data['users']
+        system.user_manager.groups = data['groups']
+        system.user_manager.next_uid = data['next_uid']
+        system.user_manager.next_gid = data['next_gid']
+        if system.state == 'running':
+            system.process_manager.create_init_processes()
+            system.device_manager.initialize()
+            system.network_manager.initialize()
+        return system
+
+
+sessions = SessionManager(
+    LinuxSystem,
+    LinuxSystem.from_snapshot,
+    max_sessions=int(os.environ.get('PYLINUX_MAX_SESSIONS', 200)),
+    idle_timeout=int(os.environ.get('PYLINUX_SESSION_IDLE_TIMEOUT', 900)),
+    storage_dir=os.environ.get('PYLINUX_SESSION_DIR'),
+)
+sessions.start_reaper(int(os.environ.get('PYLINUX_SESSION_REAP_INTERVAL', 60)))
+host_metrics.interval = float(os.environ.get('PYLINUX_METRICS_INTERVAL', 2))
+host_metrics.start()
+workers = WorkerPool(
+    max_workers=int(os.environ.get('PYLINUX_WORKERS', 32)),
+    max_session_queue=int(os.environ.get('PYLINUX_SESSION_QUEUE', 16)),
+    max_pending=int(os.environ.get('PYLINUX_MAX_PENDING', 1024)),
+)
+
+
+def get_system(session_id, pin=False):
+    return sessions.get(session_id, pin)
+
+
+def dispatch(session_id, system, task):
+    def run():
+        try:
+            task()
+        finally:
+            system.unpin()
+    
+    if workers.submit(session_id, run):
+        return True
+    system.unpin()
+    return False
 
 
 @app.route('/')
@@ -142,11 +285,30 @@ def status(session_id):
         'uptime': system.get_uptime(),
         'memory': system.memory_manager.get_stats(),
         'processes': system.process_manager.get_count(),
+        'disk': system.filesystem.usage(),
+        'quota': system.filesystem.user_usage(system.current_user or 'root'),
         'hostname': system.hostname,
         'user': system.current_user or 'root'
     })
 
 
+@app.route('/api/backup/<session_id>')
+def backup(session_id):
+    system = get_system(session_id)
+    out = io.BytesIO()
+    dump_filesystem(system.filesystem, out)
+    return Response(out.getvalue(), mimetype='application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename="pylinux-{session_id[:16]}.plfs"'})
+
+
+@app.route('/api/sessions')
+def session_stats():
+    stats = sessions.get_stats()
+    stats['workers'] = workers.get_stats()
+    stats['storage'] = STORAGE.get_stats()
+    return jsonify(stats)
+
+
 @socketio.on('connect')
 def handle_connect():
     session_id = request.args.get('session_id', secrets.token_hex(16))
@@ -173,43 +335,92 @@ def handle_boot(data):
 def handle_command(data):
     session_id = data.get('session_id')
     command = data.get('command', '')
-    system = get_system(session_id)
+    system = get_system(session_id, pin=True)
+    sid = request.sid
     
-    if command.strip().lower() in ['shutdown', 'poweroff', 'halt']:
-        def callback(msg):
-            emit('output', {'data': msg})
-            socketio.sleep(0.02)
-        system.shutdown(callback)
-        emit('shutdown_complete', {})
-        return
+    def callback(msg):
+        socketio.emit('output', {'data': msg}, room=sid)
+        socketio.sleep(0.02)
     
-    if command.strip().lower() == 'reboot':
-        def callback(msg):
-            emit('output', {'data': msg})
-            socketio.sleep(0.02)
-        system.shutdown(callback, reboot=True)
-        emit('boot_complete', {'prompt': system.get_prompt()})
-        return
+    def deliver(text):
+        socketio.emit('output', {'data': text}, room=sid)
     
-    output = system.execute_command(command)
-    emit('output', {'data': output, 'prompt': system.get_prompt()})
+    def task():
+        system.jobs.listener = deliver
+        if command.strip().lower() in ['shutdown', 'poweroff', 'halt']:
+            system.shutdown(callback)
+            socketio.emit('shutdown_complete', {}, room=sid)
+            return
+        
+        if command.strip().lower() == 'reboot':
+            system.shutdown(callback, reboot=True)
+            socketio.emit('boot_complete', {'prompt': system.get_prompt()}, room=sid)
+            return
+        
+        stream = OutputStream(lambda text, ack: socketio.emit('output', {'data': text}, room=sid, callback=ack))
+        output = system.execute_command(command, stream)
+        socketio.emit('output', {'data': stream.close() + output, 'prompt': system.get_prompt()}, room=sid)
+    
+    if not dispatch(session_id, system, task):
+        emit('output', {'data': "-bash: fork: retry: Resource temporarily unavailable\n", 'prompt': system.get_prompt()})
+
+
+def encode_delta(delta, request_data):
+    if request_data.get('format') != 'binary':
+        return delta
+    out = io.BytesIO()
+    dump_delta(delta, out)
+    return out.getvalue()
 
 
 @socketio.on('sync_fs')
 def handle_sync_fs(data):
     session_id = data.get('session_id')
     fs_data = data.get('filesystem')
-    system = get_system(session_id)
-    if fs_data:
-        system.filesystem.load_from_dict(fs_data)
-    emit('sync_complete', {'filesystem': system.filesystem.to_dict()})
+    system = get_system(session_id, pin=True)
+    sid = request.sid
+    
+    def task():
+        filesystem = system.filesystem
+        epoch = None
+        version = 0
+        received = fs_data
+        with system.jobs.foreground:
+            try:
+                if isinstance(data.get('snapshot'), bytes):
+                    load_filesystem(filesystem, io.BytesIO(data['snapshot']))
+                if isinstance(received, bytes):
+                    received = load_delta(io.BytesIO(received))
+            except SnapshotError as e:
+                socketio.emit('output', {'data': f"sync: {e}\n"}, room=sid)
+                return
+            if received:
+                if 'root' in received:
+                    filesystem.load_from_dict(received)
+                elif received.get('epoch') != filesystem.epoch:
+                    filesystem.apply_delta(received)
+                else:
+                    epoch = received['epoch']
+                    version = received.get('version', 0)
+            filesystem.flush()
+            delta = filesystem.changes_since(version, epoch)
+        socketio.emit('sync_complete', {'delta': encode_delta(delta, data)}, room=sid)
+    
+    dispatch(session_id, system, task)
 
 
 @socketio.on('get_fs')
 def handle_get_fs(data):
     session_id = data.get('session_id')
-    system = get_system(session_id)
-    emit('filesystem_data', {'filesystem': system.filesystem.to_dict()})
+    system = get_system(session_id, pin=True)
+    sid = request.sid
+    
+    def task():
+        with system.jobs.foreground:
+            delta = system.filesystem.changes_since(data.get('version', 0), data.get('epoch'))
+        socketio.emit('filesystem_data', {'delta': encode_delta(delta, data)}, room=sid)
+    
+    dispatch(session_id, system, task)
 
 
 @socketio.on('tab_complete')
@@ -217,7 +428,8 @@ def handle_tab_complete(data):
     session_id = data.get('session_id')
     partial = data.get('partial', '')
     system = get_system(session_id)
-    completions = system.shell.tab_complete(partial)
+    with system.jobs.foreground:
+        completions = system.shell.tab_complete(partial)
     emit('completions', {'completions': completions})
 
 
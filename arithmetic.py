@@ -0,0 +1,133 @@
+import ast
+import operator
+import re
+from functools import lru_cache
+
+MAX_LENGTH = 4096
+LOGICAL = re.compile(r'&&|\|\||!(?!=)')
+OCTAL = re.compile(r'(?<![\w.])0([0-7]+)\b')
+WORDS = {'&&': ' and ', '||': ' or ', '!': ' not '}
+UNSUPPORTED = re.compile(r'(\+\+|--)\s*[A-Za-z_]|[A-Za-z_]\w*\s*(\+\+|--)|(<<=|>>=|[-+*/%&|^]=|(?<![=!<>])=(?!=)|[?:,])')
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def _wrap(value):
+    value &= (1 << 64) - 1
+    return value - (1 << 64) if value >> 63 else value
+
+
+def _divide(a, b):
+    if b == 0:
+        raise ExpressionError('division by 0')
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+def _power(a, b):
+    if b < 0:
+        raise ExpressionError('exponent less than 0')
+    return pow(a, b, 1 << 64)
+
+
+BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: _divide,
+    ast.FloorDiv: _divide,
+    ast.Mod: lambda a, b: a - b * _divide(a, b),
+    ast.Pow: _power,
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+    ast.BitXor: operator.xor,
+    ast.LShift: lambda a, b: a << (b & 63),
+    ast.RShift: lambda a, b: a >> (b & 63),
+}
+UNARY = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Invert: operator.invert,
+    ast.Not: lambda a: int(not a),
+}
+COMPARE = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+
+def _number(value):
+    value = (value or '').strip()
+    if not value:
+        return 0
+    for base in (0, 10):
+        try:
+            return _wrap(int(value, base))
+        except ValueError:
+            pass
+    return 0
+
+
+def _unsupported(expression):
+    found = []
+    for match in UNSUPPORTED.finditer(expression):
+        op = next(group for group in match.groups() if group)
+        op = '?:' if op in '?:' else op
+        if op not in found:
+            found.append(op)
+    return found
+
+
+@lru_cache(maxsize=512)
+def compile_expression(expression):
+    if len(expression) > MAX_LENGTH:
+        raise ExpressionError('expression too long')
+    unsupported = _unsupported(expression)
+    if unsupported:
+        raise ExpressionError(f"{expression.strip()}: syntax error in expression (unsupported operator: {' '.join(unsupported)})")
+    source = LOGICAL.sub(lambda m: WORDS[m.group()], expression)
+    source = OCTAL.sub(r'0o\1', source).strip() or '0'
+    try:
+        return source, ast.parse(source, mode='eval')
+    except SyntaxError:
+        raise ExpressionError(f'{expression.strip()}: syntax error in expression')
+
+
+def evaluate(expression, lookup):
+    source, tree = compile_expression(expression)
+
+    def value(node):
+        if isinstance(node, ast.Constant) and type(node.value) is int:
+            return _wrap(node.value)
+        if isinstance(node, ast.Name):
+            return _number(lookup(node.id))
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY:
+            left, right = value(node.left), value(node.right)
+            try:
+                return _wrap(BINARY[type(node.op)](left, right))
+            except ExpressionError as e:
+                token = ast.get_source_segment(source, node.right)
+                raise ExpressionError(f'{expression.strip()}: {e} (error token is "{token}")')
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY:
+            return _wrap(UNARY[type(node.op)](value(node.operand)))
+        if isinstance(node, ast.BoolOp):
+            if isinstance(node.op, ast.And):
+                return int(all(value(v) for v in node.values))
+            return int(any(value(v) for v in node.values))
+        if isinstance(node, ast.Compare):
+            result = value(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                if type(op) not in COMPARE:
+                    break
+                result = int(COMPARE[type(op)](result, value(comparator)))
+            else:
+                return result
+        raise ExpressionError(f'{expression.strip()}: syntax error in expression')
+
+    return value(tree.body)
@@ -0,0 +1,75 @@
+import threading
+import time
+from contextlib import nullcontext
+
+
+class CommandCancelled(Exception):
+    def __init__(self, message, exit_code):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+
+class CancelToken:
+    def __init__(self, time_limit=None, iteration_limit=None):
+        self.time_limit = time_limit or None
+        self.iteration_limit = iteration_limit or None
+        self.started = time.monotonic()
+        self.deadline = self.started + time_limit if time_limit else None
+        self.iterations = 0
+        self.event = threading.Event()
+        self.scheduler = None
+        self.reported = False
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def expired(self):
+        if self.event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            return True
+        return self.iteration_limit is not None and self.iterations > self.iteration_limit
+
+    def check(self, count=1):
+        if self.scheduler is not None:
+            self.scheduler.preempt()
+        self.iterations += count
+        if self.event.is_set():
+            raise CommandCancelled('interrupted', 130)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.time_exceeded()
+        if self.iteration_limit is not None and self.iterations > self.iteration_limit:
+            raise CommandCancelled(f'iteration limit exceeded ({self.iteration_limit})', 124)
+
+    def time_exceeded(self):
+        raise CommandCancelled(f'time limit exceeded ({self.time_limit:g}s)', 124)
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def idle(self):
+        return self.scheduler.idle() if self.scheduler is not None else nullcontext()
+
+    def sleep(self, seconds):
+        remaining = self.remaining()
+        limited = remaining is not None and seconds > remaining
+        with self.idle():
+            woken = self.event.wait(remaining if limited else seconds)
+        if not woken:
+            if limited:
+                self.time_exceeded()
+            return
+        self.check(0)
+
+    def wait_for(self, event, interval=0.05):
+        with self.idle():
+            while not event.is_set() and not self.expired():
+                event.wait(interval)
+        if not event.is_set():
+            self.check(0)
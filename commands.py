@@ -1,72 +1,108 @@
 import time
 import os
 import re
-import psutil
 import socket
 import hashlib
 import base64
 import random
 import datetime
 import calendar
+import fnmatch
+import itertools
+from cancellation import CancelToken, CommandCancelled
+from content_index import literal_branches
+from filesystem import FileSystemError, decode_content, encode_content
+from host_metrics import host_metrics
+from jobs import SIGNALS
+
+TEST_COMPARISONS = {
+    '-eq': lambda a, b: a == b,
+    '-ne': lambda a, b: a != b,
+    '-lt': lambda a, b: a < b,
+    '-le': lambda a, b: a <= b,
+    '-gt': lambda a, b: a > b,
+    '-ge': lambda a, b: a >= b,
+}
+
+
+class CommandSpec:
+    def __init__(self, name, handler, builtin=False, stdin=False, streams=False, limit=None):
+        self.name = name
+        self.handler = handler
+        self.builtin = builtin
+        self.stdin = stdin
+        self.streams = streams
+        self.limit = limit
+
+
+def command(*names, builtin=False, stdin=False, streams=False, limit=None):
+    def decorator(func):
+        func._command_names = names
+        func._command_options = {'builtin': builtin, 'stdin': stdin, 'streams': streams, 'limit': limit}
+        return func
+    return decorator
+
+
+def iter_lines(chunks):
+    pending = ''
+    if chunks is not None:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            yield from lines
+    yield pending
 
 
 class CommandExecutor:
-    def __init__(self, system):
+    registry = {}
+    max_sleep = 5
+
+    def __init__(self, system, shell=None):
         self.system = system
+        self.shell = shell
+        self.token = CancelToken()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.registry = cls._build_registry()
+
+    @classmethod
+    def _build_registry(cls):
+        registry = {}
+        for klass in reversed(cls.__mro__):
+            for func in vars(klass).values():
+                for name in getattr(func, '_command_names', ()):
+                    registry[name] = CommandSpec(name, func, **func._command_options)
+        return registry
+
+    @classmethod
+    def get_spec(cls, name):
+        return cls.registry.get(name)
+
+    @classmethod
+    def command_names(cls):
+        return list(cls.registry.keys())
+
+    @classmethod
+    def builtin_names(cls):
+        return [name for name, spec in cls.registry.items() if spec.builtin]
 
     def execute(self, cmd, args, stdin=None):
-        commands = {
-            'ls': self.cmd_ls, 'cat': self.cmd_cat, 'echo': self.cmd_echo,
-            'pwd': self.cmd_pwd, 'cd': self.cmd_cd, 'mkdir': self.cmd_mkdir,
-            'rmdir': self.cmd_rmdir, 'rm': self.cmd_rm, 'cp': self.cmd_cp,
-            'mv': self.cmd_mv, 'touch': self.cmd_touch, 'chmod': self.cmd_chmod,
-            'chown': self.cmd_chown, 'head': self.cmd_head, 'tail': self.cmd_tail,
-            'wc': self.cmd_wc, 'grep': self.cmd_grep, 'find': self.cmd_find,
-            'sort': self.cmd_sort, 'uniq': self.cmd_uniq, 'cut': self.cmd_cut,
-            'tr': self.cmd_tr, 'sed': self.cmd_sed, 'ps': self.cmd_ps,
-            'top': self.cmd_top, 'kill': self.cmd_kill, 'killall': self.cmd_killall,
-            'df': self.cmd_df, 'du': self.cmd_du, 'free': self.cmd_free,
-            'uptime': self.cmd_uptime, 'uname': self.cmd_uname,
-            'hostname': self.cmd_hostname, 'date': self.cmd_date, 'cal': self.cmd_cal,
-            'whoami': self.cmd_whoami, 'id': self.cmd_id, 'who': self.cmd_who,
-            'w': self.cmd_w, 'ifconfig': self.cmd_ifconfig, 'ip': self.cmd_ip,
-            'ping': self.cmd_ping, 'netstat': self.cmd_netstat,
-            'env': self.cmd_env, 'export': self.cmd_export, 'printenv': self.cmd_env,
-            'alias': self.cmd_alias, 'unalias': self.cmd_unalias,
-            'history': self.cmd_history, 'clear': self.cmd_clear,
-            'dmesg': self.cmd_dmesg, 'lsmod': self.cmd_lsmod,
-            'systemctl': self.cmd_systemctl, 'service': self.cmd_service,
-            'apt': self.cmd_apt, 'apt-get': self.cmd_apt, 'dpkg': self.cmd_dpkg,
-            'man': self.cmd_man, 'help': self.cmd_help, 'which': self.cmd_which,
-            'whereis': self.cmd_whereis, 'type': self.cmd_type,
-            'file': self.cmd_file, 'stat': self.cmd_stat,
-            'su': self.cmd_su, 'sudo': self.cmd_sudo, 'passwd': self.cmd_passwd,
-            'useradd': self.cmd_useradd, 'userdel': self.cmd_userdel,
-            'groupadd': self.cmd_groupadd, 'mount': self.cmd_mount,
-            'umount': self.cmd_umount, 'ln': self.cmd_ln,
-            'basename': self.cmd_basename, 'dirname': self.cmd_dirname,
-            'md5sum': self.cmd_md5sum, 'sha256sum': self.cmd_sha256sum,
-            'base64': self.cmd_base64, 'tee': self.cmd_tee,
-            'xargs': self.cmd_xargs, 'yes': self.cmd_yes,
-            'true': self.cmd_true, 'false': self.cmd_false,
-            'test': self.cmd_test, '[': self.cmd_test,
-            'expr': self.cmd_expr, 'seq': self.cmd_seq,
-            'sleep': self.cmd_sleep, 'exit': self.cmd_exit,
-            'logout': self.cmd_exit, 'source': self.cmd_source,
-            'set': self.cmd_set, 'unset': self.cmd_unset,
-            'lscpu': self.cmd_lscpu, 'lsblk': self.cmd_lsblk,
-            'blkid': self.cmd_blkid, 'curl': self.cmd_curl, 'wget': self.cmd_wget,
-            'nslookup': self.cmd_nslookup, 'dig': self.cmd_dig,
-            'tac': self.cmd_tac, 'rev': self.cmd_rev, 'nl': self.cmd_nl,
-            'reboot': lambda a, s: 'reboot\n',
-            'shutdown': lambda a, s: 'shutdown\n',
-            'poweroff': lambda a, s: 'poweroff\n',
-            'halt': lambda a, s: 'halt\n',
-        }
-        
-        if cmd in commands:
+        spec = self.registry.get(cmd)
+        if spec is not None:
             try:
-                return commands[cmd](args, stdin)
+                if spec.streams:
+                    chunks = spec.handler(self, args, iter((stdin,)) if stdin else None)
+                    if spec.limit is not None:
+                        chunks = itertools.islice(chunks, spec.limit)
+                    return ''.join(chunks)
+                return spec.handler(self, args, stdin)
+            except CommandCancelled as e:
+                return self._cancelled(cmd, e)
+            except FileSystemError as e:
+                return self._filesystem_error(cmd, e)
             except Exception as e:
                 return f"-bash: {cmd}: {str(e)}\n"
         
@@ -74,48 +110,103 @@ class CommandExecutor:
             return f"{cmd}: command executed\n"
         return f"-bash: {cmd}: command not found\n"
 
+    def execute_stream(self, cmd, args, stdin=None, bounded=False):
+        spec = self.registry.get(cmd)
+        if spec is not None and spec.streams:
+            chunks = spec.handler(self, args, stdin)
+            if bounded and spec.limit is not None:
+                chunks = itertools.islice(chunks, spec.limit)
+            try:
+                for chunk in chunks:
+                    self.tick()
+                    yield chunk
+            except CommandCancelled as e:
+                yield self._cancelled(cmd, e)
+            except FileSystemError as e:
+                yield self._filesystem_error(cmd, e)
+            except Exception as e:
+                yield f"-bash: {cmd}: {str(e)}\n"
+            return
+        yield self.execute(cmd, args, ''.join(stdin) if stdin is not None else None)
+
+    def tick(self, count=1):
+        self.token.check(count)
+
+    def _cancelled(self, cmd, error):
+        self.system.last_exit_code = error.exit_code
+        if error.exit_code == 130 or self.token.reported:
+            return ''
+        self.token.reported = True
+        message = f"-bash: {cmd}: {error}\n" if cmd else f"-bash: {error}\n"
+        if self.shell is None:
+            return message
+        self.shell.report(message)
+        return ''
+
+    def _filesystem_error(self, cmd, error):
+        self.system.last_exit_code = 1
+        return f"{cmd}: {error}\n"
+
+    @command('ls')
     def cmd_ls(self, args, stdin):
-        show_all = '-a' in args or '-la' in args or '-al' in args
-        long_fmt = '-l' in args or '-la' in args or '-al' in args
-        human = '-h' in args
+        flags = ''.join(a[1:] for a in args if a.startswith('-') and not a.startswith('--'))
+        show_all = 'a' in flags
+        long_fmt = 'l' in flags
+        human = 'h' in flags
+        recursive = 'R' in flags
         paths = [a for a in args if not a.startswith('-')] or ['.']
+        fs = self.system.filesystem
         output = []
         
         for path in paths:
-            resolved = self.system.filesystem.resolve_path(path)
-            if not self.system.filesystem.exists(resolved):
+            resolved = fs.resolve_path(path)
+            node = fs.get_node(resolved)
+            if node is None:
                 output.append(f"ls: cannot access '{path}': No such file or directory")
                 continue
             
-            if self.system.filesystem.is_file(resolved):
-                info = self.system.filesystem.get_file_info(resolved)
+            if not node.is_dir:
+                info = fs.node_info(node, resolved.rpartition('/')[2] or '/')
                 if long_fmt:
                     output.append(self._format_ls_long(info, human))
                 else:
                     output.append(info['name'])
                 continue
             
-            files = self.system.filesystem.list_dir(resolved) or []
-            if not show_all:
-                files = [f for f in files if not f.startswith('.')]
+            if recursive:
+                base = resolved.rstrip('/')
+                for dir_path, dir_node, depth in fs.walk(resolved):
+                    if not dir_node.is_dir:
+                        continue
+                    if depth > 0 and not show_all and dir_path.rpartition('/')[2].startswith('.'):
+                        continue
+                    if output:
+                        output.append('')
+                    output.append(f"{path.rstrip('/')}{dir_path[len(base):]}:")
+                    output.extend(self._ls_dir(dir_node, show_all, long_fmt, human))
+                continue
             
             if len(paths) > 1:
                 output.append(f"{path}:")
-            
-            if long_fmt:
-                output.append(f"total {len(files) * 4}")
-                for f in sorted(files):
-                    fp = f"{resolved}/{f}" if resolved != '/' else f"/{f}"
-                    info = self.system.filesystem.get_file_info(fp)
-                    if info:
-                        output.append(self._format_ls_long(info, human))
-            else:
-                output.append('  '.join(sorted(files)))
+            output.extend(self._ls_dir(node, show_all, long_fmt, human))
         
         return '\n'.join(output) + '\n' if output else ''
 
+    def _ls_dir(self, node, show_all, long_fmt, human):
+        entries = sorted(self.system.filesystem.iter_dir(node))
+        if not show_all:
+            entries = [(name, child) for name, child in entries if not name.startswith('.')]
+        if not long_fmt:
+            return ['  '.join(name for name, child in entries)]
+        lines = [f"total {len(entries) * 4}"]
+        for name, child in entries:
+            info = self.system.filesystem.node_info(child)
+            info['name'] = name
+            lines.append(self._format_ls_long(info, human))
+        return lines
+
     def _format_ls_long(self, info, human=False):
-        mode = 'd' if info['is_dir'] else '-'
+        mode = 'd' if info['is_dir'] else 'l' if info['is_symlink'] else '-'
         for i in range(3):
             shift = 6 - i * 3
             mode += 'r' if info['permissions'] & (4 << shift) else '-'
@@ -134,29 +225,38 @@ class CommandExecutor:
             size_str = str(size)
         
         mtime = time.strftime('%b %d %H:%M', time.localtime(info['modified']))
-        return f"{mode} {info['links']:>3} {info['owner']:<8} {info['group']:<8} {size_str:>8} {mtime} {info['name']}"
+        name = info['name']
+        if info['is_symlink']:
+            name += f" -> {info['symlink_target']}"
+        return f"{mode} {info['links']:>3} {info['owner']:<8} {info['group']:<8} {size_str:>8} {mtime} {name}"
 
+    @command('cat', stdin=True, streams=True)
     def cmd_cat(self, args, stdin):
-        if stdin and not args:
-            return stdin
+        if stdin is not None and not args:
+            yield from stdin
+            return
         show_line_numbers = '-n' in args
-        output = []
         line_num = 1
+        first = True
         
         for f in [a for a in args if not a.startswith('-')]:
             content = self.system.filesystem.read_file(f)
             if content is None:
-                output.append(f"cat: {f}: No such file or directory")
+                pieces = [f"cat: {f}: No such file or directory"]
+            elif show_line_numbers:
+                pieces = []
+                for line in content.split('\n'):
+                    pieces.append(f"{line_num:>6}\t{line}")
+                    line_num += 1
             else:
-                if show_line_numbers:
-                    for line in content.split('\n'):
-                        output.append(f"{line_num:>6}\t{line}")
-                        line_num += 1
-                else:
-                    output.append(content)
-        
-        return '\n'.join(output) if output else ''
-
+                pieces = [content]
+            for piece in pieces:
+                if not first:
+                    yield '\n'
+                first = False
+                yield piece
+
+    @command('tac', stdin=True)
     def cmd_tac(self, args, stdin):
         content = stdin or ''
         files = [a for a in args if not a.startswith('-')]
@@ -165,6 +265,7 @@ class CommandExecutor:
         lines = content.strip().split('\n')
         return '\n'.join(reversed(lines)) + '\n'
 
+    @command('echo', builtin=True)
     def cmd_echo(self, args, stdin):
         newline = True
         interpret = False
@@ -181,9 +282,11 @@ class CommandExecutor:
             result = result.replace('\\n', '\n').replace('\\t', '\t').replace('\\\\', '\\')
         return result + ('\n' if newline else '')
 
+    @command('pwd', builtin=True)
     def cmd_pwd(self, args, stdin):
         return self.system.filesystem.cwd + '\n'
 
+    @command('cd', builtin=True)
     def cmd_cd(self, args, stdin):
         target = args[0] if args else self.system.environment.get('HOME', '/root')
         if target == '-':
@@ -198,6 +301,7 @@ class CommandExecutor:
         self.system.environment['PWD'] = resolved
         return ''
 
+    @command('mkdir')
     def cmd_mkdir(self, args, stdin):
         parents = '-p' in args
         verbose = '-v' in args
@@ -212,6 +316,7 @@ class CommandExecutor:
                     output.append(f"mkdir: cannot create directory '{d}'")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('rmdir')
     def cmd_rmdir(self, args, stdin):
         output = []
         for d in [a for a in args if not a.startswith('-')]:
@@ -227,6 +332,7 @@ class CommandExecutor:
                 self.system.filesystem.delete(d)
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('rm')
     def cmd_rm(self, args, stdin):
         recursive = '-r' in args or '-R' in args or '-rf' in args or '-fr' in args
         force = '-f' in args or '-rf' in args or '-fr' in args
@@ -235,11 +341,12 @@ class CommandExecutor:
         output = []
         
         for f in files:
-            if not self.system.filesystem.exists(f):
+            node = self.system.filesystem.get_node(f, follow=False)
+            if node is None:
                 if not force:
                     output.append(f"rm: cannot remove '{f}': No such file or directory")
                 continue
-            if self.system.filesystem.is_dir(f) and not recursive:
+            if node.is_dir and not recursive:
                 output.append(f"rm: cannot remove '{f}': Is a directory")
                 continue
             if self.system.filesystem.delete(f, recursive=recursive):
@@ -248,16 +355,16 @@ class CommandExecutor:
         
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('touch')
     def cmd_touch(self, args, stdin):
         for f in [a for a in args if not a.startswith('-')]:
             if not self.system.filesystem.exists(f):
                 self.system.filesystem.write_file(f, '')
             else:
-                node = self.system.filesystem._get_node(self.system.filesystem.resolve_path(f))
-                if node:
-                    node.modified = time.time()
+                self.system.filesystem.touch(f)
         return ''
 
+    @command('cp')
     def cmd_cp(self, args, stdin):
         recursive = '-r' in args or '-R' in args
         verbose = '-v' in args
@@ -278,6 +385,7 @@ class CommandExecutor:
                     output.append(f"'{src}' -> '{dst}'")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('mv')
     def cmd_mv(self, args, stdin):
         verbose = '-v' in args
         files = [a for a in args if not a.startswith('-')]
@@ -292,8 +400,11 @@ class CommandExecutor:
             if self.system.filesystem.move(src, dst):
                 if verbose:
                     output.append(f"renamed '{src}' -> '{dst}'")
+            else:
+                output.append(f"mv: cannot move '{src}' to '{dst}'")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('chmod')
     def cmd_chmod(self, args, stdin):
         if len(args) < 2:
             return "chmod: missing operand\n"
@@ -316,6 +427,7 @@ class CommandExecutor:
             self.system.filesystem.chmod(f, mode)
         return ''
 
+    @command('chown')
     def cmd_chown(self, args, stdin):
         if len(args) < 2:
             return "chown: missing operand\n"
@@ -326,14 +438,22 @@ class CommandExecutor:
             self.system.filesystem.chown(f, owner, group)
         return ''
 
+    @command('head', stdin=True, streams=True)
     def cmd_head(self, args, stdin):
         lines = 10
+        size = None
         files = []
         i = 0
         while i < len(args):
             if args[i] == '-n' and i + 1 < len(args):
                 lines = int(args[i + 1])
                 i += 2
+            elif args[i] == '-c' and i + 1 < len(args):
+                size = int(args[i + 1])
+                i += 2
+            elif args[i].startswith('-c') and args[i][2:].isdigit():
+                size = int(args[i][2:])
+                i += 1
             elif args[i].startswith('-') and args[i][1:].isdigit():
                 lines = int(args[i][1:])
                 i += 1
@@ -343,11 +463,36 @@ class CommandExecutor:
             else:
                 i += 1
         
-        content = stdin if stdin and not files else ''
+        if size is not None:
+            if files:
+                data = self._read_bytes(files[0], size)
+                if data is None:
+                    yield f"head: cannot open '{files[0]}' for reading: No such file or directory\n"
+                    return
+            else:
+                data = bytearray()
+                for chunk in stdin or ():
+                    data += encode_content(chunk)
+                    if 0 <= size <= len(data):
+                        break
+            yield decode_content(data[:size])
+            return
+        
         if files:
-            content = self.system.filesystem.read_file(files[0]) or ''
-        return '\n'.join(content.split('\n')[:lines]) + '\n'
-
+            source = iter((self.system.filesystem.read_file(files[0]) or '').split('\n'))
+        else:
+            source = iter_lines(stdin)
+        if lines < 0:
+            source = iter(list(source)[:lines])
+            lines = None
+        emitted = 0
+        for line in itertools.islice(source, lines):
+            emitted += 1
+            yield line + '\n'
+        if not emitted:
+            yield '\n'
+
+    @command('tail', stdin=True)
     def cmd_tail(self, args, stdin):
         lines = 10
         files = []
@@ -370,6 +515,7 @@ class CommandExecutor:
             content = self.system.filesystem.read_file(files[0]) or ''
         return '\n'.join(content.strip().split('\n')[-lines:]) + '\n'
 
+    @command('wc', stdin=True, streams=True)
     def cmd_wc(self, args, stdin):
         show_lines = '-l' in args
         show_words = '-w' in args
@@ -377,14 +523,24 @@ class CommandExecutor:
         if not any([show_lines, show_words, show_chars]):
             show_lines = show_words = show_chars = True
         
-        content = stdin or ''
         files = [a for a in args if not a.startswith('-')]
+        data = None
         if files:
-            content = self.system.filesystem.read_file(files[0]) or ''
+            data = self._read_bytes(files[0]) or b''
+            source = iter(decode_content(data).split('\n')) if show_lines or show_words else iter(())
+        else:
+            source = iter_lines(stdin)
         
-        lines = content.count('\n')
-        words = len(content.split())
-        chars = len(content)
+        lines = -1
+        words = 0
+        chars = -1
+        for line in source:
+            lines += 1
+            words += len(line.split())
+            chars += len(encode_content(line)) + 1
+        if data is not None:
+            lines = max(lines, 0)
+            chars = len(data)
         fname = files[0] if files else ''
         
         parts = []
@@ -394,104 +550,454 @@ class CommandExecutor:
             parts.append(f"{words:>8}")
         if show_chars:
             parts.append(f"{chars:>8}")
-        return ''.join(parts) + f" {fname}\n"
+        yield ''.join(parts) + f" {fname}\n"
 
+    @command('grep', stdin=True, streams=True)
     def cmd_grep(self, args, stdin):
-        ignore_case = '-i' in args
-        invert = '-v' in args
-        count_only = '-c' in args
-        line_nums = '-n' in args
+        opts = set()
         pattern = None
         files = []
         
         for a in args:
-            if a.startswith('-') or a == '--color=auto':
+            if a.startswith('--'):
                 continue
-            if pattern is None:
+            if a.startswith('-') and len(a) > 1:
+                opts.update(a[1:])
+            elif pattern is None:
                 pattern = a
             else:
                 files.append(a)
         
         if not pattern:
-            return "grep: missing pattern\n"
-        
-        content = stdin if stdin and not files else ''
-        if files:
-            content = self.system.filesystem.read_file(files[0]) or ''
+            self.system.last_exit_code = 2
+            yield "grep: missing pattern\n"
+            return
         
-        flags = re.IGNORECASE if ignore_case else 0
+        ignore_case = 'i' in opts
+        invert = 'v' in opts
+        recursive = 'r' in opts or 'R' in opts
+        source = re.escape(pattern) if 'F' in opts else pattern
+        expr = rf"\b(?:{source})\b" if 'w' in opts else source
         try:
-            regex = re.compile(pattern, flags)
-        except:
-            return f"grep: Invalid regex\n"
+            regex = re.compile(expr, re.IGNORECASE if ignore_case else 0)
+        except re.error:
+            self.system.last_exit_code = 2
+            yield f"grep: Invalid regex\n"
+            return
         
-        output = []
-        count = 0
-        for i, line in enumerate(content.split('\n'), 1):
-            match = bool(regex.search(line)) != invert
-            if match:
-                count += 1
-                if not count_only:
-                    prefix = f"{i}:" if line_nums else ""
-                    output.append(f"{prefix}{line}")
+        if not files and not recursive:
+            count = 0
+            for i, line in enumerate(iter_lines(stdin), 1):
+                self.tick()
+                if bool(regex.search(line)) != invert:
+                    count += 1
+                    if 'c' not in opts and 'q' not in opts:
+                        prefix = f"{i}:" if 'n' in opts else ""
+                        yield f"{prefix}{line}\n"
+            if 'c' in opts:
+                yield f"{count}\n"
+            self.system.last_exit_code = 0 if count else 1
+            return
         
-        if count_only:
-            return f"{count}\n"
-        return '\n'.join(output) + '\n' if output else ''
-
+        fs = self.system.filesystem
+        show_names = 'h' not in opts and ('H' in opts or recursive or len(files) > 1)
+        matched = False
+        errors = False
+        for target in files or ['.']:
+            resolved = fs.resolve_path(target)
+            node = fs.get_node(resolved)
+            if node is None:
+                errors = True
+                if 's' not in opts:
+                    yield f"grep: {target}: No such file or directory\n"
+                continue
+            if not node.is_dir:
+                paths = [(target, resolved)]
+            elif recursive:
+                display = '' if not files else target.rstrip('/') or '/'
+                paths = self._grep_tree(display, resolved, regex, source, opts)
+            else:
+                errors = True
+                if 's' not in opts:
+                    yield f"grep: {target}: Is a directory\n"
+                continue
+            for display, path in paths:
+                self.tick()
+                text = fs.read_file(path)
+                if text is None:
+                    continue
+                lines = text.split('\n')
+                if lines[-1] == '':
+                    lines.pop()
+                count = 0
+                for i, line in enumerate(lines, 1):
+                    if bool(regex.search(line)) == invert:
+                        continue
+                    count += 1
+                    if 'l' in opts or 'q' in opts:
+                        break
+                    if 'c' not in opts:
+                        prefix = f"{display}:" if show_names else ""
+                        if 'n' in opts:
+                            prefix += f"{i}:"
+                        yield f"{prefix}{line}\n"
+                if count:
+                    matched = True
+                    if 'q' in opts:
+                        self.system.last_exit_code = 0
+                        return
+                    if 'l' in opts:
+                        yield f"{display}\n"
+                if 'c' in opts:
+                    yield f"{display}:{count}\n" if show_names else f"{count}\n"
+        self.system.last_exit_code = 2 if errors else 0 if matched else 1
+
+    def _grep_tree(self, display, resolved, regex, source, opts, seen=None):
+        fs = self.system.filesystem
+        follow = 'R' in opts
+        seen = seen if seen is not None else {fs.realpath(resolved)}
+        base = resolved.rstrip('/')
+
+        def shown(path):
+            rel = path[len(base):].lstrip('/')
+            return f"{display}/{rel}" if display not in ('', '/') else f"{display}{rel}"
+
+        real = fs.realpath(resolved)
+        index = fs.get_content_index() if 'v' not in opts and not fs.is_virtual(real) else None
+        found = None
+        if index is not None:
+            found = index.search(real, literal_branches(source, bool(regex.flags & re.IGNORECASE)))
+        if found is None:
+            files, links = [], []
+            for path, node, depth in fs.walk(resolved):
+                self.tick()
+                if node.is_symlink:
+                    links.append(path)
+                elif not node.is_dir:
+                    files.append(path)
+        else:
+            real = real.rstrip('/')
+            files, links = [[base + p[len(real):] for p in paths] for paths in found]
+        
+        results = [(shown(path), path) for path in files]
+        if follow:
+            for link in links:
+                target = fs.realpath(link)
+                node = fs.get_node(target) if target is not None else None
+                if node is None:
+                    continue
+                if not node.is_dir:
+                    results.append((shown(link), link))
+                elif target not in seen:
+                    seen.add(target)
+                    results.extend(self._grep_tree(shown(link), link, regex, source, opts, seen))
+        return sorted(results, key=lambda item: item[0].split('/'))
+
+    @command('find', streams=True)
     def cmd_find(self, args, stdin):
+        fs = self.system.filesystem
         paths = []
-        name_pattern = None
-        type_filter = None
+        i = 0
+        while i < len(args) and not args[i].startswith('-') and args[i] not in ('!', '(', ')'):
+            paths.append(args[i])
+            i += 1
+        options = {'maxdepth': None, 'mindepth': 0, 'names': [], 'prune': False, 'print': False}
+        try:
+            test = self._find_expression(args[i:], options)
+        except ValueError as e:
+            self.system.last_exit_code = 1
+            yield f"find: {e}\n"
+            return
+        maxdepth = options['maxdepth']
+        mindepth = options['mindepth']
+        state = {'prune': False, 'output': []}
+        errors = False
+        
+        for start in paths or ['.']:
+            resolved = fs.resolve_path(start)
+            node = fs.get_node(resolved)
+            if node is None:
+                errors = True
+                yield f"find: '{start}': No such file or directory\n"
+                continue
+            real = fs.realpath(resolved)
+            index = None
+            if options['names'] and not options['prune'] and not fs.is_virtual(real):
+                index = fs.get_name_index()
+            if index is not None:
+                base = real.rstrip('/')
+                root = fs.get_node(real)
+                positions = {}
+
+                def walk_order(rel):
+                    # Sibling positions along the path, so index hits come
+                    # out in the same order the tree walk would print them.
+                    key = []
+                    current = root
+                    for name in rel.split('/')[1:]:
+                        order = positions.get(id(current))
+                        if order is None:
+                            order = positions[id(current)] = {child: i for i, (child, _) in enumerate(fs.iter_dir(current))}
+                        key.append(order.get(name, -1))
+                        current = current.children.get(name)
+                        if current is None:
+                            break
+                    return key
+
+                entries = []
+                for path in index.search(real, options['names']):
+                    rel = path[len(base):]
+                    depth = rel.count('/')
+                    if depth < mindepth or (maxdepth is not None and depth > maxdepth):
+                        continue
+                    entries.append((walk_order(rel), start.rstrip('/') + rel if rel else start, fs.get_node(path, follow=False), depth))
+                entries.sort(key=lambda entry: entry[0], reverse=True)
+                entries = [entry[1:] for entry in entries]
+            else:
+                entries = None
+            stack = [(start, node, 0)]
+            while stack if entries is None else entries:
+                display, node, depth = (stack if entries is None else entries).pop()
+                self.tick()
+                if node is None:
+                    continue
+                state['prune'] = False
+                if depth >= mindepth:
+                    matched = test(display, node, state)
+                    if state['output']:
+                        for line in state['output']:
+                            yield line + '\n'
+                        state['output'] = []
+                    elif matched and not options['print']:
+                        yield display + '\n'
+                if entries is None and node.is_dir and not state['prune'] and (maxdepth is None or depth < maxdepth):
+                    prefix = display if display.endswith('/') else display + '/'
+                    for name, child in reversed(list(fs.iter_dir(node))):
+                        stack.append((prefix + name, child, depth + 1))
+        self.system.last_exit_code = 1 if errors else 0
+
+    def _find_expression(self, tokens, options):
+        fs = self.system.filesystem
+        now = time.time()
+        units = {'c': 1, 'w': 2, 'b': 512, 'k': 1024, 'M': 1024**2, 'G': 1024**3}
+        pos = [0]
+
+        def peek():
+            return tokens[pos[0]] if pos[0] < len(tokens) else None
+
+        def take(primary=None):
+            token = peek()
+            if token is None:
+                raise ValueError(f"missing argument to `{primary}'")
+            pos[0] += 1
+            return token
+
+        def numeric(primary, value):
+            sign = value[:1] if value[:1] in '+-' else ''
+            try:
+                number = int(value[len(sign):])
+            except ValueError:
+                raise ValueError(f"invalid argument `{value}' to `{primary}'")
+            if sign == '+':
+                return lambda n: n > number
+            if sign == '-':
+                return lambda n: n < number
+            return lambda n: n == number
+
+        def reference(path):
+            node = fs.get_node(path)
+            if node is None:
+                raise ValueError(f"'{path}': No such file or directory")
+            return node
+
+        def primary(top):
+            token = take()
+            if token in ('-maxdepth', '-mindepth'):
+                value = take(token)
+                if not value.isdigit():
+                    raise ValueError(f"Expected a positive decimal integer argument to {token}, but got `{value}'")
+                options[token[1:]] = int(value)
+                return lambda path, node, state: True
+            if token in ('-name', '-iname'):
+                pattern = take(token)
+                fold = token == '-iname'
+                if top:
+                    options['names'].append((pattern, fold))
+                if fold:
+                    return lambda path, node, state: fnmatch.fnmatchcase(path.rpartition('/')[2].lower(), pattern.lower())
+                return lambda path, node, state: fnmatch.fnmatchcase(path.rpartition('/')[2], pattern)
+            if token in ('-path', '-wholename'):
+                pattern = take(token)
+                return lambda path, node, state: fnmatch.fnmatchcase(path, pattern)
+            if token == '-type':
+                kind = take(token)
+                if kind not in ('f', 'd', 'l'):
+                    raise ValueError(f"Unknown argument to -type: {kind}")
+                return lambda path, node, state: ('d' if node.is_dir else 'l' if node.is_symlink else 'f') == kind
+            if token == '-size':
+                value = take(token)
+                unit = units.get(value[-1:])
+                compare = numeric(token, value[:-1] if unit else value)
+                unit = unit or 512
+                return lambda path, node, state: compare(-(-node.size // unit))
+            if token in ('-mtime', '-mmin'):
+                compare = numeric(token, take(token))
+                period = 86400 if token == '-mtime' else 60
+                return lambda path, node, state: compare(int((now - node.modified) // period))
+            if token == '-newer':
+                ref = reference(take(token))
+                return lambda path, node, state: node.modified > ref.modified
+            if token == '-user':
+                user = take(token)
+                return lambda path, node, state: node.owner == user
+            if token == '-group':
+                group = take(token)
+                return lambda path, node, state: node.group == group
+            if token == '-perm':
+                value = take(token)
+                mode = value[1:] if value[:1] in '-/' else value
+                try:
+                    mode = int(mode, 8)
+                except ValueError:
+                    raise ValueError(f"invalid mode `{value}'")
+                if value.startswith('-'):
+                    return lambda path, node, state: node.permissions & mode == mode
+                if value.startswith('/'):
+                    return lambda path, node, state: not mode or bool(node.permissions & mode)
+                return lambda path, node, state: node.permissions & 0o7777 == mode
+            if token == '-empty':
+                return lambda path, node, state: (next(fs.iter_dir(node), None) is None) if node.is_dir else node.size == 0
+            if token == '-prune':
+                options['prune'] = True
+
+                def prune(path, node, state):
+                    state['prune'] = True
+                    return True
+                return prune
+            if token == '-print':
+                options['print'] = True
+
+                def output(path, node, state):
+                    state['output'].append(path)
+                    return True
+                return output
+            if token in ('-true', '-false'):
+                return lambda path, node, state: token == '-true'
+            raise ValueError(f"unknown predicate `{token}'")
+
+        def unary(top):
+            token = peek()
+            if token in ('!', '-not'):
+                take()
+                inner = unary(False)
+                return lambda path, node, state: not inner(path, node, state)
+            if token == '(':
+                take()
+                inner = disjunction(False)
+                if take('(') != ')':
+                    raise ValueError("invalid expression; I was expecting to find a ')' somewhere but did not see one.")
+                return inner
+            return primary(top)
+
+        def conjunction(top):
+            tests = [unary(top)]
+            while peek() not in (None, '-o', '-or', ')'):
+                if peek() in ('-a', '-and'):
+                    take()
+                tests.append(unary(top))
+            if len(tests) == 1:
+                return tests[0]
+            return lambda path, node, state: all(test(path, node, state) for test in tests)
+
+        def disjunction(top):
+            tests = [conjunction(top)]
+            while peek() in ('-o', '-or'):
+                take()
+                tests.append(conjunction(False))
+            if len(tests) > 1 and top:
+                options['names'].clear()
+            if len(tests) == 1:
+                return tests[0]
+            return lambda path, node, state: any(test(path, node, state) for test in tests)
+
+        if not tokens:
+            return lambda path, node, state: True
+        test = disjunction(True)
+        if peek() is not None:
+            raise ValueError(f"paths must precede expression: `{peek()}'")
+        return test
+
+    @command('locate', streams=True)
+    def cmd_locate(self, args, stdin):
+        fs = self.system.filesystem
+        ignore_case = False
+        basename = False
+        count_only = False
+        limit = None
+        patterns = []
         i = 0
         while i < len(args):
-            if args[i] == '-name' and i + 1 < len(args):
-                name_pattern = args[i + 1]
+            a = args[i]
+            if a in ('-l', '-n', '--limit') and i + 1 < len(args):
+                limit = int(args[i + 1]) if args[i + 1].isdigit() else None
                 i += 2
-            elif args[i] == '-type' and i + 1 < len(args):
-                type_filter = args[i + 1]
-                i += 2
-            elif not args[i].startswith('-'):
-                paths.append(args[i])
-                i += 1
-            else:
-                i += 1
-        
-        if not paths:
-            paths = ['.']
-        
-        results = []
-        import fnmatch
-        
-        def search(path, depth=0):
-            resolved = self.system.filesystem.resolve_path(path)
-            info = self.system.filesystem.get_file_info(resolved)
-            if not info:
-                return
-            
-            match = True
-            if name_pattern:
-                if not fnmatch.fnmatch(info['name'], name_pattern):
-                    match = False
-            if type_filter:
-                if type_filter == 'f' and info['is_dir']:
-                    match = False
-                if type_filter == 'd' and not info['is_dir']:
-                    match = False
-            
-            if match:
-                results.append(resolved)
-            
-            if info['is_dir']:
-                files = self.system.filesystem.list_dir(resolved) or []
-                for f in files:
-                    child = f"{resolved}/{f}" if resolved != '/' else f"/{f}"
-                    search(child, depth + 1)
+                continue
+            if a in ('-i', '--ignore-case'):
+                ignore_case = True
+            elif a in ('-b', '--basename'):
+                basename = True
+            elif a in ('-c', '--count'):
+                count_only = True
+            elif not a.startswith('-'):
+                patterns.append(a.lower() if ignore_case else a)
+            i += 1
+        if not patterns:
+            self.system.last_exit_code = 1
+            yield "locate: no pattern to search for specified\n"
+            return
         
-        for p in paths:
-            search(p)
-        return '\n'.join(results) + '\n' if results else ''
+        index = fs.get_name_index()
+        if index is not None:
+            if basename:
+                paths = sorted((p for name in index.names for p in index.names[name]
+                                if self._locate_match(name, patterns, ignore_case)), key=lambda p: p.split('/'))
+            else:
+                paths = sorted((p for p in index.paths if self._locate_match(p, patterns, ignore_case)),
+                               key=lambda p: p.split('/'))
+        else:
+            paths = [p for p, node, depth in fs.walk('/') if p != '/'
+                     and self._locate_match(p.rpartition('/')[2] if basename else p, patterns, ignore_case)]
+        if limit is not None:
+            paths = paths[:limit]
+        self.system.last_exit_code = 0 if paths else 1
+        if count_only:
+            yield f"{len(paths)}\n"
+            return
+        for path in paths:
+            self.tick()
+            yield path + '\n'
+
+    def _locate_match(self, text, patterns, ignore_case):
+        if ignore_case:
+            text = text.lower()
+        for pattern in patterns:
+            if any(c in pattern for c in '*?['):
+                if fnmatch.fnmatchcase(text, pattern):
+                    return True
+            elif pattern in text:
+                return True
+        return False
+
+    @command('updatedb')
+    def cmd_updatedb(self, args, stdin):
+        if (self.system.current_user or 'root') != 'root':
+            return "updatedb: can not open a temporary file for `/var/lib/mlocate/mlocate.db'\n"
+        index = self.system.filesystem.get_name_index()
+        if index is not None:
+            index.rebuild()
+        return ''
 
+    @command('sort', stdin=True)
     def cmd_sort(self, args, stdin):
         reverse = '-r' in args
         numeric = '-n' in args
@@ -502,6 +1008,7 @@ class CommandExecutor:
             content = self.system.filesystem.read_file(files[0]) or ''
         
         lines = content.strip().split('\n') if content.strip() else []
+        self.tick(len(lines))
         if numeric:
             def key(x):
                 try:
@@ -516,6 +1023,7 @@ class CommandExecutor:
             lines = list(dict.fromkeys(lines))
         return '\n'.join(lines) + '\n' if lines else ''
 
+    @command('uniq', stdin=True)
     def cmd_uniq(self, args, stdin):
         count = '-c' in args
         content = stdin or ''
@@ -548,6 +1056,7 @@ class CommandExecutor:
         
         return '\n'.join(result) + '\n' if result else ''
 
+    @command('cut', stdin=True)
     def cmd_cut(self, args, stdin):
         delimiter = '\t'
         fields = None
@@ -586,6 +1095,7 @@ class CommandExecutor:
                 output.append(line)
         return '\n'.join(output)
 
+    @command('tr', stdin=True)
     def cmd_tr(self, args, stdin):
         if len(args) < 1:
             return "tr: missing operand\n"
@@ -606,6 +1116,7 @@ class CommandExecutor:
             content = content.translate(trans)
         return content
 
+    @command('sed', stdin=True)
     def cmd_sed(self, args, stdin):
         script = None
         files = []
@@ -638,40 +1149,153 @@ class CommandExecutor:
                     pass
         return content
 
+    @command('ps')
     def cmd_ps(self, args, stdin):
         aux = 'aux' in ''.join(args) or '-ef' in args
         return self.system.process_manager.format_ps_output(aux=aux) + '\n'
 
+    @command('top')
     def cmd_top(self, args, stdin):
         return self.system.process_manager.format_top_output() + '\n'
 
+    @command('kill', builtin=True)
     def cmd_kill(self, args, stdin):
         signal = 15
-        pids = []
-        for a in args:
+        targets = []
+        i = 0
+        while i < len(args):
+            a = args[i]
             if a == '-l':
-                return "1) SIGHUP  2) SIGINT  9) SIGKILL  15) SIGTERM  19) SIGSTOP\n"
-            elif a.startswith('-'):
-                try:
-                    signal = int(a[1:])
-                except:
-                    if a[1:].upper() == 'KILL':
-                        signal = 9
-                    elif a[1:].upper() == 'TERM':
-                        signal = 15
+                return "1) SIGHUP  2) SIGINT  9) SIGKILL  15) SIGTERM  18) SIGCONT  19) SIGSTOP  20) SIGTSTP\n"
+            elif a == '-s' and i + 1 < len(args):
+                i += 1
+                signal = self._signal_number(args[i])
+            elif a.startswith('-') and len(a) > 1:
+                signal = self._signal_number(a[1:])
             else:
-                try:
-                    pids.append(int(a))
-                except:
-                    pass
+                targets.append(a)
+            if signal is None:
+                return f"-bash: kill: {args[i].lstrip('-')}: invalid signal specification\n"
+            i += 1
         
         output = []
-        for pid in pids:
+        for target in targets:
+            if target.startswith('%'):
+                job = self.system.jobs.find(target)
+                if job is None:
+                    output.append(f"-bash: kill: {target}: no such job")
+                else:
+                    job.send(signal)
+                continue
+            try:
+                pid = int(target)
+            except ValueError:
+                output.append(f"-bash: kill: {target}: arguments must be process or job IDs")
+                continue
+            job = self.system.jobs.by_pid(pid)
+            if job is not None:
+                job.send(signal)
+                continue
             success, msg = self.system.process_manager.kill_process(pid, signal)
             if not success:
                 output.append(f"kill: ({pid}) - {msg}")
         return '\n'.join(output) + '\n' if output else ''
 
+    def _signal_number(self, name):
+        if name.isdigit():
+            return int(name)
+        name = name.upper()
+        return SIGNALS.get(name[3:] if name.startswith('SIG') else name)
+
+    @command('jobs', builtin=True)
+    def cmd_jobs(self, args, stdin):
+        flags = ''.join(a[1:] for a in args if a.startswith('-'))
+        jobs = self.system.jobs
+        output = []
+        for job, mark in jobs.listing():
+            if ('r' in flags and job.status != 'Running') or ('s' in flags and job.status != 'Stopped'):
+                continue
+            if 'p' in flags:
+                output.append(str(job.pid))
+            else:
+                output.append(jobs.format(job, mark, pid='l' in flags))
+        return '\n'.join(output) + '\n' if output else ''
+
+    def _job_spec(self, name, args):
+        spec = args[0] if args else '%+'
+        job = self.system.jobs.find(spec if spec.startswith('%') else '%' + spec)
+        if job is None:
+            self.system.last_exit_code = 1
+            return None, f"-bash: {name}: {spec if args else 'current'}: no such job\n"
+        return job, None
+
+    @command('fg', builtin=True)
+    def cmd_fg(self, args, stdin):
+        job, error = self._job_spec('fg', args)
+        if error is not None:
+            return error
+        jobs = self.system.jobs
+        if not jobs.claim(job):
+            self.system.last_exit_code = 1
+            return "-bash: fg: job has terminated\n"
+        job.cont()
+        try:
+            self.token.wait_for(job.done)
+        except CommandCancelled as e:
+            if e.exit_code == 130:
+                job.kill(2)
+                raise
+            if jobs.release(job):
+                raise
+            job.done.wait()
+        self.system.last_exit_code = job.exit_code
+        return job.text + '\n' + job.output
+
+    @command('bg', builtin=True)
+    def cmd_bg(self, args, stdin):
+        job, error = self._job_spec('bg', args)
+        if error is not None:
+            return error
+        if job.status == 'Running':
+            return f"-bash: bg: job {job.number} already in background\n"
+        job.cont()
+        return f"[{job.number}]+ {job.text} &\n"
+
+    @command('wait', builtin=True)
+    def cmd_wait(self, args, stdin):
+        jobs = self.system.jobs
+        if not args:
+            for job, mark in jobs.listing():
+                if job.status != 'Stopped':
+                    self.token.wait_for(job.done)
+            self.system.last_exit_code = 0
+            return ''
+        code = 0
+        for arg in args:
+            if arg.startswith('%'):
+                job = jobs.find(arg)
+                if job is None:
+                    self.system.last_exit_code = 127
+                    return f"-bash: wait: {arg}: no such job\n"
+            else:
+                try:
+                    pid = int(arg)
+                except ValueError:
+                    self.system.last_exit_code = 2
+                    return f"-bash: wait: `{arg}': not a pid or valid job spec\n"
+                job = jobs.by_pid(pid)
+                if job is None:
+                    if pid not in jobs.statuses:
+                        self.system.last_exit_code = 127
+                        return f"-bash: wait: pid {pid} is not a child of this shell\n"
+                    code = jobs.statuses[pid]
+                    continue
+            self.token.wait_for(job.done)
+            code = job.exit_code
+        self.system.last_exit_code = code
+        return ''
+
+    @command('killall')
     def cmd_killall(self, args, stdin):
         signal = 15
         names = []
@@ -693,10 +1317,16 @@ class CommandExecutor:
                 self.system.process_manager.kill_process(proc.pid, signal)
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('df')
     def cmd_df(self, args, stdin):
         human = '-h' in args
-        disk = psutil.disk_usage('/')
-        
+        usage = self.system.filesystem.usage()
+
+        if '-i' in args:
+            percent = usage['inodes_used'] * 100.0 / usage['inodes'] if usage['inodes'] else 0.0
+            output = "Filesystem      Inodes  IUsed   IFree IUse% Mounted on\n"
+            output += f"/dev/sda1      {usage['inodes']:>7} {usage['inodes_used']:>6} {usage['inodes_free']:>7} {percent:>4.0f}% /\n"
+            return output
         if human:
             def fmt(n):
                 if n >= 1024**3:
@@ -705,21 +1335,24 @@ class CommandExecutor:
                     return f"{n/1024**2:.1f}M"
                 return f"{n/1024:.1f}K"
             output = "Filesystem      Size  Used Avail Use% Mounted on\n"
-            output += f"/dev/sda1       {fmt(disk.total):>4}  {fmt(disk.used):>4}  {fmt(disk.free):>4}  {disk.percent:>2.0f}% /\n"
+            output += f"/dev/sda1       {fmt(usage['total']):>4}  {fmt(usage['used']):>4}  {fmt(usage['free']):>4}  {usage['percent']:>2.0f}% /\n"
         else:
             output = "Filesystem     1K-blocks    Used Available Use% Mounted on\n"
-            output += f"/dev/sda1      {disk.total//1024:>10} {disk.used//1024:>7} {disk.free//1024:>9} {disk.percent:>2.0f}% /\n"
+            output += f"/dev/sda1      {usage['total']//1024:>10} {usage['used']//1024:>7} {usage['free']//1024:>9} {usage['percent']:>2.0f}% /\n"
         return output
 
+    @command('du')
     def cmd_du(self, args, stdin):
         human = '-h' in args
-        summary = '-s' in args
         paths = [a for a in args if not a.startswith('-')] or ['.']
         
         output = []
         for path in paths:
-            resolved = self.system.filesystem.resolve_path(path)
-            size = self._calc_size(resolved)
+            node = self.system.filesystem.get_node(path)
+            if node is None:
+                output.append(f"du: cannot access '{path}': No such file or directory")
+                continue
+            size = node.total_bytes
             if human:
                 if size >= 1024**2:
                     size_str = f"{size/1024**2:.1f}M"
@@ -732,40 +1365,28 @@ class CommandExecutor:
             output.append(f"{size_str}\t{path}")
         return '\n'.join(output) + '\n' if output else ''
 
-    def _calc_size(self, path):
-        node = self.system.filesystem._get_node(path)
-        if not node:
-            return 0
-        if not node.is_dir:
-            return node.size
-        total = 4096
-        if node.children:
-            for name in node.children:
-                child_path = f"{path}/{name}" if path != '/' else f"/{name}"
-                total += self._calc_size(child_path)
-        return total
-
+    @command('free')
     def cmd_free(self, args, stdin):
         human = '-h' in args
         return self.system.memory_manager.format_free_output(human) + '\n'
 
+    @command('uptime')
     def cmd_uptime(self, args, stdin):
         uptime_secs = self.system.get_uptime()
         hours = int(uptime_secs // 3600)
         minutes = int((uptime_secs % 3600) // 60)
-        try:
-            load = psutil.getloadavg()
-            load_str = f"{load[0]:.2f}, {load[1]:.2f}, {load[2]:.2f}"
-        except:
-            load_str = "0.00, 0.00, 0.00"
+        load = host_metrics.current()['load']
+        load_str = f"{load[0]:.2f}, {load[1]:.2f}, {load[2]:.2f}"
         return f" {time.strftime('%H:%M:%S')} up {hours}:{minutes:02d},  1 user,  load average: {load_str}\n"
 
+    @command('uname')
     def cmd_uname(self, args, stdin):
         if not args:
             return "Linux\n"
         options = ''.join(args).replace('-', '')
         return self.system.kernel.get_uname(options) + '\n'
 
+    @command('hostname')
     def cmd_hostname(self, args, stdin):
         if args and not args[0].startswith('-'):
             self.system.hostname = args[0]
@@ -773,6 +1394,7 @@ class CommandExecutor:
             return ''
         return f"{self.system.hostname}\n"
 
+    @command('date')
     def cmd_date(self, args, stdin):
         if not args:
             return time.strftime('%a %b %d %H:%M:%S %Z %Y') + '\n'
@@ -782,6 +1404,7 @@ class CommandExecutor:
                 return time.strftime(fmt.replace('%', '%%').replace('%%Y', '%Y').replace('%%m', '%m').replace('%%d', '%d').replace('%%H', '%H').replace('%%M', '%M').replace('%%S', '%S')) + '\n'
         return time.strftime('%a %b %d %H:%M:%S %Z %Y') + '\n'
 
+    @command('cal')
     def cmd_cal(self, args, stdin):
         now = datetime.datetime.now()
         year = now.year
@@ -796,38 +1419,42 @@ class CommandExecutor:
                     month = int(arg)
         return calendar.month(year, month)
 
+    @command('whoami')
     def cmd_whoami(self, args, stdin):
         return f"{self.system.current_user or 'root'}\n"
 
+    @command('id')
     def cmd_id(self, args, stdin):
         user = args[0] if args and not args[0].startswith('-') else (self.system.current_user or 'root')
         if user == 'root':
             return "uid=0(root) gid=0(root) groups=0(root)\n"
         return f"uid=1000({user}) gid=1000({user}) groups=1000({user}),27(sudo)\n"
 
+    @command('who')
     def cmd_who(self, args, stdin):
         return f"root     tty1         {time.strftime('%Y-%m-%d %H:%M')}\n"
 
+    @command('w')
     def cmd_w(self, args, stdin):
         uptime_secs = self.system.get_uptime()
         hours = int(uptime_secs // 3600)
         minutes = int((uptime_secs % 3600) // 60)
-        try:
-            load = psutil.getloadavg()
-            load_str = f"{load[0]:.2f}, {load[1]:.2f}, {load[2]:.2f}"
-        except:
-            load_str = "0.00, 0.00, 0.00"
+        load = host_metrics.current()['load']
+        load_str = f"{load[0]:.2f}, {load[1]:.2f}, {load[2]:.2f}"
         output = f" {time.strftime('%H:%M:%S')} up {hours}:{minutes:02d},  1 user,  load average: {load_str}\n"
         output += "USER     TTY      FROM             LOGIN@   IDLE   JCPU   PCPU WHAT\n"
         output += f"root     tty1     -                {time.strftime('%H:%M')}    0.00s  0.01s  0.00s -bash\n"
         return output
 
+    @command('ifconfig')
     def cmd_ifconfig(self, args, stdin):
         return self.system.network_manager.ifconfig(args)
 
+    @command('ip')
     def cmd_ip(self, args, stdin):
         return self.system.network_manager.ip_command(args)
 
+    @command('ping')
     def cmd_ping(self, args, stdin):
         count = 4
         host = None
@@ -845,15 +1472,18 @@ class CommandExecutor:
             return "ping: missing host\n"
         return self.system.network_manager.ping(host, count)
 
+    @command('netstat')
     def cmd_netstat(self, args, stdin):
         return self.system.network_manager.netstat(args)
 
+    @command('env', 'printenv')
     def cmd_env(self, args, stdin):
         output = []
         for key, value in sorted(self.system.environment.items()):
             output.append(f"{key}={value}")
         return '\n'.join(output) + '\n'
 
+    @command('export', builtin=True)
     def cmd_export(self, args, stdin):
         if not args:
             output = []
@@ -869,17 +1499,22 @@ class CommandExecutor:
                     self.system.environment[arg] = ''
         return ''
 
+    @command('set', builtin=True)
     def cmd_set(self, args, stdin):
         if not args:
             return self.cmd_env(args, stdin)
+        if args[0] == '--':
+            self.shell.positional = args[1:]
         return ''
 
+    @command('unset', builtin=True)
     def cmd_unset(self, args, stdin):
         for arg in args:
             if arg in self.system.environment:
                 del self.system.environment[arg]
         return ''
 
+    @command('alias', builtin=True)
     def cmd_alias(self, args, stdin):
         if not args:
             output = []
@@ -895,6 +1530,7 @@ class CommandExecutor:
                     return f"alias {arg}='{self.system.aliases[arg]}'\n"
         return ''
 
+    @command('unalias', builtin=True)
     def cmd_unalias(self, args, stdin):
         for arg in args:
             if arg == '-a':
@@ -903,18 +1539,22 @@ class CommandExecutor:
                 del self.system.aliases[arg]
         return ''
 
+    @command('history', builtin=True)
     def cmd_history(self, args, stdin):
         output = []
         for i, cmd in enumerate(self.system.history, 1):
             output.append(f"  {i:>4}  {cmd}")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('clear')
     def cmd_clear(self, args, stdin):
         return '\033[2J\033[H'
 
+    @command('dmesg')
     def cmd_dmesg(self, args, stdin):
         return self.system.kernel.get_dmesg() + '\n'
 
+    @command('lsmod')
     def cmd_lsmod(self, args, stdin):
         output = "Module                  Size  Used by\n"
         for mod in self.system.kernel.modules:
@@ -922,46 +1562,59 @@ class CommandExecutor:
             output += f"{mod:<24}{size:>6}  0\n"
         return output
 
+    @command('systemctl')
     def cmd_systemctl(self, args, stdin):
         return self.system.systemd.systemctl(args)
 
+    @command('service')
     def cmd_service(self, args, stdin):
         if len(args) < 2:
             return "Usage: service <service> <action>\n"
         return self.system.systemd.systemctl([args[1], args[0]])
 
+    @command('apt', 'apt-get')
     def cmd_apt(self, args, stdin):
         return self.system.package_manager.apt(args)
 
+    @command('dpkg')
     def cmd_dpkg(self, args, stdin):
         return self.system.package_manager.dpkg(args)
 
+    @command('man')
     def cmd_man(self, args, stdin):
         if not args:
             return "What manual page do you want?\n"
         cmd = args[0]
         return f"{cmd.upper()}(1)\n\nNAME\n       {cmd} - {cmd} command\n\nSYNOPSIS\n       {cmd} [OPTIONS]...\n\nDESCRIPTION\n       Manual page for {cmd}.\n"
 
+    @command('help', builtin=True)
     def cmd_help(self, args, stdin):
         if not args:
-            return "GNU bash, version 5.1.0\n\nShell commands: alias, bg, cd, echo, exit, export, fg, help, history, jobs, kill, pwd, set, type, unalias, unset\n"
+            return "GNU bash, version 5.1.0\n\nShell commands: alias, bg, break, case, cd, continue, echo, exit, export, fg, for, function, help, history, if, jobs, kill, local, pwd, read, return, set, shift, source, type, ulimit, unalias, unset, until, wait, while\n"
         return f"-bash: help: no help topics match '{args[0]}'\n"
 
+    @command('which')
     def cmd_which(self, args, stdin):
         output = []
-        paths = self.system.environment.get('PATH', '').split(':')
         for cmd in [a for a in args if not a.startswith('-')]:
-            found = False
-            for path in paths:
-                full_path = f"{path}/{cmd}"
-                if self.system.filesystem.exists(full_path):
-                    output.append(full_path)
-                    found = True
-                    break
-            if not found:
+            full_path = self._find_in_path(cmd)
+            if full_path:
+                output.append(full_path)
+            else:
                 output.append(f"{cmd} not found")
         return '\n'.join(output) + '\n' if output else ''
 
+    def _find_in_path(self, cmd):
+        for path in self.system.environment.get('PATH', '').split(':'):
+            full_path = f"{path}/{cmd}"
+            if self.system.filesystem.exists(full_path):
+                return full_path
+        spec = self.registry.get(cmd)
+        if spec is not None and not spec.builtin:
+            return f"/usr/bin/{cmd}"
+        return None
+
+    @command('whereis')
     def cmd_whereis(self, args, stdin):
         output = []
         for cmd in [a for a in args if not a.startswith('-')]:
@@ -973,24 +1626,26 @@ class CommandExecutor:
             output.append(f"{cmd}: {' '.join(locs)}")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('type', builtin=True)
     def cmd_type(self, args, stdin):
-        builtins = ['cd', 'pwd', 'echo', 'export', 'alias', 'history', 'exit', 'source', 'set', 'unset', 'type']
         output = []
         for cmd in [a for a in args if not a.startswith('-')]:
-            if cmd in builtins:
+            spec = self.registry.get(cmd)
+            if cmd in self.shell.functions:
+                output.append(f"{cmd} is a function")
+            elif spec is not None and spec.builtin:
                 output.append(f"{cmd} is a shell builtin")
             elif cmd in self.system.aliases:
                 output.append(f"{cmd} is aliased to '{self.system.aliases[cmd]}'")
             else:
-                for path in self.system.environment.get('PATH', '').split(':'):
-                    full_path = f"{path}/{cmd}"
-                    if self.system.filesystem.exists(full_path):
-                        output.append(f"{cmd} is {full_path}")
-                        break
+                full_path = self._find_in_path(cmd)
+                if full_path:
+                    output.append(f"{cmd} is {full_path}")
                 else:
                     output.append(f"-bash: type: {cmd}: not found")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('file')
     def cmd_file(self, args, stdin):
         output = []
         for f in [a for a in args if not a.startswith('-')]:
@@ -1008,14 +1663,17 @@ class CommandExecutor:
                     output.append(f"{f}: ASCII text")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('stat')
     def cmd_stat(self, args, stdin):
         output = []
         for f in [a for a in args if not a.startswith('-')]:
-            info = self.system.filesystem.get_file_info(self.system.filesystem.resolve_path(f))
+            info = self.system.filesystem.node_info(self.system.filesystem.get_node(f, follow=False))
             if not info:
                 output.append(f"stat: cannot stat '{f}': No such file")
                 continue
-            ftype = 'directory' if info['is_dir'] else 'regular file'
+            ftype = 'directory' if info['is_dir'] else 'symbolic link' if info['is_symlink'] else 'regular file'
+            if info['is_symlink']:
+                f += f" -> {info['symlink_target']}"
             mtime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['modified']))
             output.append(f"  File: {f}")
             output.append(f"  Size: {info['size']}\tBlocks: {info['size']//512}\tIO Block: 4096\t{ftype}")
@@ -1024,6 +1682,7 @@ class CommandExecutor:
             output.append(f"Modify: {mtime}")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('su')
     def cmd_su(self, args, stdin):
         user = 'root'
         for arg in args:
@@ -1031,25 +1690,36 @@ class CommandExecutor:
                 user = arg
                 break
         self.system.current_user = user
+        self.system.filesystem.user = user
         self.system.environment['USER'] = user
         self.system.environment['HOME'] = '/root' if user == 'root' else f'/home/{user}'
         return ''
 
+    @command('sudo')
     def cmd_sudo(self, args, stdin):
         if not args:
             return "usage: sudo command\n"
         if args[0] == '-i':
             self.system.current_user = 'root'
+            self.system.filesystem.user = 'root'
             self.system.environment['USER'] = 'root'
             self.system.environment['HOME'] = '/root'
             self.system.filesystem.cwd = '/root'
             return ''
-        return self.system.shell.execute(' '.join(args))
+        fs = self.system.filesystem
+        user = fs.user
+        fs.user = 'root'
+        try:
+            return self.shell.execute(' '.join(args))
+        finally:
+            fs.user = user
 
+    @command('passwd')
     def cmd_passwd(self, args, stdin):
         user = args[0] if args else (self.system.current_user or 'root')
         return f"passwd: password for {user} updated successfully\n"
 
+    @command('useradd')
     def cmd_useradd(self, args, stdin):
         username = None
         for a in args:
@@ -1060,6 +1730,7 @@ class CommandExecutor:
             return "useradd: missing username\n"
         return self.system.user_manager.add_user(username)
 
+    @command('userdel')
     def cmd_userdel(self, args, stdin):
         username = None
         remove_home = '-r' in args
@@ -1071,6 +1742,7 @@ class CommandExecutor:
             return "userdel: missing username\n"
         return self.system.user_manager.del_user(username, remove_home)
 
+    @command('groupadd')
     def cmd_groupadd(self, args, stdin):
         groupname = None
         for a in args:
@@ -1081,6 +1753,7 @@ class CommandExecutor:
             return "groupadd: missing group name\n"
         return self.system.user_manager.add_group(groupname)
 
+    @command('mount')
     def cmd_mount(self, args, stdin):
         if not args:
             output = ""
@@ -1089,16 +1762,66 @@ class CommandExecutor:
             return output
         return "mount: operation not supported\n"
 
+    @command('umount')
     def cmd_umount(self, args, stdin):
         return "umount: operation not supported\n"
 
+    @command('ln')
     def cmd_ln(self, args, stdin):
-        symbolic = '-s' in args
+        flags = ''.join(a[1:] for a in args if a.startswith('-'))
+        symbolic = 's' in flags
+        force = 'f' in flags
         files = [a for a in args if not a.startswith('-')]
-        if len(files) < 2:
-            return "ln: missing destination\n"
-        return f"ln: created {'symbolic ' if symbolic else ''}link '{files[-1]}' -> '{files[0]}'\n"
+        if not files:
+            return "ln: missing file operand\n"
+        fs = self.system.filesystem
+        target = files[0]
+        dst = files[1] if len(files) > 1 else target.rstrip('/').split('/')[-1]
+        if fs.is_dir(dst):
+            dst = dst.rstrip('/') + '/' + target.rstrip('/').split('/')[-1]
+        if fs.get_node(dst, follow=False) is not None:
+            if not force:
+                kind = 'symbolic link' if symbolic else 'hard link'
+                return f"ln: failed to create {kind} '{dst}': File exists\n"
+            fs.delete(dst)
+        if symbolic:
+            if not fs.symlink(target, dst):
+                return f"ln: failed to create symbolic link '{dst}': No such file or directory\n"
+            return ''
+        node = fs.get_node(target)
+        if node is None:
+            return f"ln: failed to access '{target}': No such file or directory\n"
+        if node.is_dir:
+            return f"ln: {target}: hard link not allowed for directory\n"
+        if not fs.link(target, dst):
+            return f"ln: failed to create hard link '{dst}': No such file or directory\n"
+        return ''
+
+    @command('readlink')
+    def cmd_readlink(self, args, stdin):
+        canonical = '-f' in args or '-e' in args
+        fs = self.system.filesystem
+        output = []
+        for f in [a for a in args if not a.startswith('-')]:
+            path = fs.realpath(f) if canonical else fs.readlink(f)
+            if path is None:
+                self.system.last_exit_code = 1
+                continue
+            output.append(path)
+        return '\n'.join(output) + '\n' if output else ''
+
+    @command('realpath')
+    def cmd_realpath(self, args, stdin):
+        output = []
+        for f in [a for a in args if not a.startswith('-')]:
+            path = self.system.filesystem.realpath(f)
+            if path is None:
+                output.append(f"realpath: {f}: No such file or directory")
+                continue
+            output.append(path)
+        return '\n'.join(output) + '\n' if output else ''
 
+    @command('basename')
     def cmd_basename(self, args, stdin):
         if not args:
             return "basename: missing operand\n"
@@ -1109,6 +1832,7 @@ class CommandExecutor:
             name = name[:-len(suffix)]
         return name + '\n'
 
+    @command('dirname')
     def cmd_dirname(self, args, stdin):
         if not args:
             return "dirname: missing operand\n"
@@ -1117,77 +1841,99 @@ class CommandExecutor:
             return '.\n'
         return '/'.join(path.split('/')[:-1]) or '/' + '\n'
 
+    def _read_bytes(self, path, size=None):
+        resolved = self.system.filesystem.resolve_path(path)
+        if resolved in ('/dev/null', '/dev/zero', '/dev/random', '/dev/urandom'):
+            return self.system.device_manager.read_device(resolved[5:], size or 0)
+        return self.system.filesystem.read_bytes(resolved)
+
+    @command('md5sum', stdin=True)
     def cmd_md5sum(self, args, stdin):
         output = []
         if stdin and not args:
-            h = hashlib.md5(stdin.encode()).hexdigest()
+            h = hashlib.md5(encode_content(stdin)).hexdigest()
             output.append(f"{h}  -")
         else:
             for f in [a for a in args if not a.startswith('-')]:
-                content = self.system.filesystem.read_file(f)
-                if content is None:
+                data = self._read_bytes(f)
+                if data is None:
                     output.append(f"md5sum: {f}: No such file")
                 else:
-                    h = hashlib.md5(content.encode()).hexdigest()
+                    h = hashlib.md5(data).hexdigest()
                     output.append(f"{h}  {f}")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('sha256sum', stdin=True)
     def cmd_sha256sum(self, args, stdin):
         output = []
         if stdin and not args:
-            h = hashlib.sha256(stdin.encode()).hexdigest()
+            h = hashlib.sha256(encode_content(stdin)).hexdigest()
             output.append(f"{h}  -")
         else:
             for f in [a for a in args if not a.startswith('-')]:
-                content = self.system.filesystem.read_file(f)
-                if content is None:
+                data = self._read_bytes(f)
+                if data is None:
                     output.append(f"sha256sum: {f}: No such file")
                 else:
-                    h = hashlib.sha256(content.encode()).hexdigest()
+                    h = hashlib.sha256(data).hexdigest()
                     output.append(f"{h}  {f}")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('base64', stdin=True)
     def cmd_base64(self, args, stdin):
         decode = '-d' in args or '--decode' in args
-        content = stdin or ''
+        data = encode_content(stdin or '')
         files = [a for a in args if not a.startswith('-')]
         if files:
-            content = self.system.filesystem.read_file(files[0]) or ''
+            data = self._read_bytes(files[0]) or b''
         try:
             if decode:
-                return base64.b64decode(content.strip()).decode('utf-8') + '\n'
+                return decode_content(base64.b64decode(data))
             else:
-                return base64.b64encode(content.encode()).decode('utf-8') + '\n'
+                return base64.b64encode(data).decode('ascii') + '\n'
         except:
             return "base64: invalid input\n"
 
+    @command('tee', stdin=True, streams=True)
     def cmd_tee(self, args, stdin):
         append = '-a' in args
         files = [a for a in args if not a.startswith('-')]
-        content = stdin or ''
-        for f in files:
-            self.system.filesystem.write_file(f, content, append=append)
-        return content
-
+        first = True
+        for chunk in stdin if stdin is not None else iter(('',)):
+            for f in files:
+                self.system.filesystem.write_file(f, chunk, append=append or not first)
+            first = False
+            yield chunk
+        if first:
+            for f in files:
+                self.system.filesystem.write_file(f, '', append=append)
+
+    @command('xargs', stdin=True)
     def cmd_xargs(self, args, stdin):
         if not stdin:
             return ''
         cmd = args if args else ['echo']
         items = stdin.split()
-        return self.system.shell.execute(' '.join(cmd + items))
+        self.tick(len(items))
+        return self.shell.execute(' '.join(cmd + items))
 
+    @command('yes', streams=True, limit=10)
     def cmd_yes(self, args, stdin):
-        text = args[0] if args else 'y'
-        return '\n'.join([text] * 10) + '\n'
+        line = (args[0] if args else 'y') + '\n'
+        while True:
+            yield line
 
+    @command('true', ':', builtin=True)
     def cmd_true(self, args, stdin):
         self.system.last_exit_code = 0
         return ''
 
+    @command('false', builtin=True)
     def cmd_false(self, args, stdin):
         self.system.last_exit_code = 1
         return ''
 
+    @command('test', '[', builtin=True)
     def cmd_test(self, args, stdin):
         if not args:
             self.system.last_exit_code = 1
@@ -1209,34 +1955,32 @@ class CommandExecutor:
                 self.system.last_exit_code = 0 if self.system.filesystem.is_file(arg) else 1
             elif op == '-d':
                 self.system.last_exit_code = 0 if self.system.filesystem.is_dir(arg) else 1
+            elif op == '!':
+                self.system.last_exit_code = 1 if arg else 0
+            elif op in ('-s', '-x'):
+                node = self.system.filesystem.get_node(arg)
+                if op == '-s':
+                    self.system.last_exit_code = 0 if node is not None and node.size > 0 else 1
+                else:
+                    self.system.last_exit_code = 0 if node is not None and node.permissions & 0o111 else 1
         elif len(args) == 3:
             left, op, right = args
             if op == '=' or op == '==':
                 self.system.last_exit_code = 0 if left == right else 1
             elif op == '!=':
                 self.system.last_exit_code = 0 if left != right else 1
-            elif op == '-eq':
-                try:
-                    self.system.last_exit_code = 0 if int(left) == int(right) else 1
-                except:
-                    self.system.last_exit_code = 1
-            elif op == '-ne':
+            elif op in TEST_COMPARISONS:
                 try:
-                    self.system.last_exit_code = 0 if int(left) != int(right) else 1
-                except:
-                    self.system.last_exit_code = 1
-            elif op == '-lt':
-                try:
-                    self.system.last_exit_code = 0 if int(left) < int(right) else 1
-                except:
-                    self.system.last_exit_code = 1
-            elif op == '-gt':
-                try:
-                    self.system.last_exit_code = 0 if int(left) > int(right) else 1
-                except:
-                    self.system.last_exit_code = 1
+                    self.system.last_exit_code = 0 if TEST_COMPARISONS[op](int(left), int(right)) else 1
+                except ValueError:
+                    self.system.last_exit_code = 2
+                    return f"-bash: test: {left if not left.lstrip('-').isdigit() else right}: integer expression expected\n"
+            else:
+                self.system.last_exit_code = 2
+                return f"-bash: test: {op}: binary operator expected\n"
         return ''
 
+    @command('expr')
     def cmd_expr(self, args, stdin):
         if not args:
             return ''
@@ -1257,30 +2001,38 @@ class CommandExecutor:
             pass
         return '0\n'
 
+    @command('seq', streams=True)
     def cmd_seq(self, args, stdin):
         if not args:
-            return ''
+            return
         try:
             if len(args) == 1:
-                return '\n'.join(map(str, range(1, int(args[0]) + 1))) + '\n'
+                numbers = range(1, int(args[0]) + 1)
             elif len(args) == 2:
-                return '\n'.join(map(str, range(int(args[0]), int(args[1]) + 1))) + '\n'
-            elif len(args) >= 3:
-                return '\n'.join(map(str, range(int(args[0]), int(args[2]) + 1, int(args[1])))) + '\n'
+                numbers = range(int(args[0]), int(args[1]) + 1)
+            else:
+                numbers = range(int(args[0]), int(args[2]) + 1, int(args[1]))
         except:
-            pass
-        return ''
-
+            return
+        if not numbers:
+            yield '\n'
+            return
+        for start in range(0, len(numbers), 1024):
+            self.tick(len(numbers[start:start + 1024]))
+            yield '\n'.join(map(str, numbers[start:start + 1024])) + '\n'
+
+    @command('sleep')
     def cmd_sleep(self, args, stdin):
         if not args:
             return "sleep: missing operand\n"
         try:
             duration = float(args[0].rstrip('smhd'))
-            time.sleep(min(duration, 5))
         except:
             return f"sleep: invalid time '{args[0]}'\n"
+        self.token.sleep(duration if self.max_sleep is None else min(duration, self.max_sleep))
         return ''
 
+    @command('exit', 'logout', builtin=True)
     def cmd_exit(self, args, stdin):
         code = 0
         if args:
@@ -1288,42 +2040,227 @@ class CommandExecutor:
                 code = int(args[0])
             except:
                 pass
+        shell = self.shell
+        if shell.script_depth or shell.job is not None:
+            shell.control = ('exit', 1)
+            self.system.last_exit_code = code & 255
+            return ''
         return f"exit {code}\n"
 
+    @command('source', '.', builtin=True)
     def cmd_source(self, args, stdin):
         if not args:
-            return "source: missing file\n"
-        content = self.system.filesystem.read_file(args[0])
-        if content is None:
-            return f"-bash: {args[0]}: No such file\n"
+            self.system.last_exit_code = 2
+            return "-bash: source: filename argument required\n"
+        return self.shell.source(args[0], args[1:])
+
+    @command('bash', 'sh')
+    def cmd_bash(self, args, stdin):
+        shell = self.shell
+        if args[:1] == ['-c']:
+            if len(args) < 2:
+                self.system.last_exit_code = 2
+                return "bash: -c: option requires an argument\n"
+            return shell.run_string(args[1], args[2] if len(args) > 2 else 'bash', args[3:], stdin)
+        while args and args[0].startswith('-') and args[0] != '-':
+            args = args[1:]
+        if not args or args[0] == '-':
+            return shell.run_string(stdin, 'bash', args[1:]) if stdin else ''
+        if not self.system.filesystem.is_file(args[0]):
+            self.system.last_exit_code = 127
+            return f"bash: {args[0]}: No such file or directory\n"
+        return shell.run_script(args[0], args[1:], stdin, interpreted=False)
+
+    @command('break', builtin=True)
+    def cmd_break(self, args, stdin):
+        return self._loop_control('break', args)
+
+    @command('continue', builtin=True)
+    def cmd_continue(self, args, stdin):
+        return self._loop_control('continue', args)
+
+    def _loop_control(self, keyword, args):
+        shell = self.shell
+        try:
+            count = int(args[0]) if args else 1
+        except ValueError:
+            self.system.last_exit_code = 1
+            return f"-bash: {keyword}: {args[0]}: numeric argument required\n"
+        if count < 1:
+            self.system.last_exit_code = 1
+            return f"-bash: {keyword}: {count}: loop count out of range\n"
+        if shell.loop_depth:
+            shell.control = (keyword, min(count, shell.loop_depth))
+        self.system.last_exit_code = 0
+        return ''
+
+    @command('return', builtin=True)
+    def cmd_return(self, args, stdin):
+        shell = self.shell
+        if not shell.frames and not shell.script_depth:
+            self.system.last_exit_code = 1
+            return "-bash: return: can only `return' from a function or sourced script\n"
+        code = shell.previous_status or 0
+        if args:
+            try:
+                code = int(args[0]) & 255
+            except ValueError:
+                self.system.last_exit_code = 2
+                shell.control = ('return', 1)
+                return f"-bash: return: {args[0]}: numeric argument required\n"
+        shell.control = ('return', 1)
+        self.system.last_exit_code = code
+        return ''
+
+    @command('local', builtin=True)
+    def cmd_local(self, args, stdin):
+        shell = self.shell
+        if not shell.frames:
+            self.system.last_exit_code = 1
+            return "-bash: local: can only be used in a function\n"
+        frame = shell.frames[-1]
+        for arg in args:
+            name, _, value = arg.partition('=')
+            if name not in frame:
+                frame[name] = self.system.environment.get(name)
+            self.system.environment[name] = value
+        return ''
+
+    @command('shift', builtin=True)
+    def cmd_shift(self, args, stdin):
+        shell = self.shell
+        try:
+            count = int(args[0]) if args else 1
+        except ValueError:
+            self.system.last_exit_code = 1
+            return f"-bash: shift: {args[0]}: numeric argument required\n"
+        if count < 0 or count > len(shell.positional):
+            self.system.last_exit_code = 1
+            return ''
+        shell.positional = shell.positional[count:]
+        return ''
+
+    @command('read', builtin=True, stdin=True)
+    def cmd_read(self, args, stdin):
+        shell = self.shell
+        raw = False
+        names = []
+        i = 0
+        while i < len(args):
+            if args[i] == '-r':
+                raw = True
+            elif args[i] in ('-p', '-t', '-n', '-d', '-u'):
+                i += 1
+            elif not args[i].startswith('-'):
+                names.append(args[i])
+            i += 1
+        if stdin is not None:
+            line = stdin.split('\n', 1)[0] if stdin else None
+        elif shell.input is not None:
+            line = next(shell.input, None)
+        else:
+            line = None
+        if line is None:
+            self.system.last_exit_code = 1
+            return ''
+        if not raw:
+            line = re.sub(r'\\(.)', r'\1', line)
+        if not names:
+            self.system.environment['REPLY'] = line
+            return ''
+        fields = line.strip().split(None, len(names) - 1)
+        for index, name in enumerate(names):
+            self.system.environment[name] = fields[index] if index < len(fields) else ''
+        return ''
+
+    @command('ulimit', builtin=True)
+    def cmd_ulimit(self, args, stdin):
+        limits = self.system.limits
+        if '-a' in args:
+            cpu = limits.get('time') or 'unlimited'
+            return f"""core file size          (blocks, -c) 0
+cpu time               (seconds, -t) {cpu if cpu == 'unlimited' else f'{cpu:g}'}
+file size               (blocks, -f) unlimited
+max user processes              (-u) 4096
+open files                      (-n) 1024
+stack size              (kbytes, -s) 8192
+"""
+        if not args or args[0] != '-t':
+            return "unlimited\n"
+        if len(args) == 1:
+            return f"{limits['time']:g}\n" if limits.get('time') else "unlimited\n"
+        if args[1] == 'unlimited':
+            limits['time'] = None
+            return ''
+        try:
+            value = float(args[1])
+        except ValueError:
+            return f"-bash: ulimit: {args[1]}: invalid number\n"
+        if value <= 0:
+            return f"-bash: ulimit: {args[1]}: invalid number\n"
+        limits['time'] = value
+        return ''
+
+    @command('quota')
+    def cmd_quota(self, args, stdin):
+        fs = self.system.filesystem
+        users = [a for a in args if not a.startswith('-')] or [self.system.current_user or 'root']
         output = []
-        for line in content.split('\n'):
-            line = line.strip()
-            if line and not line.startswith('#'):
-                result = self.system.shell.execute(line)
-                if result:
-                    output.append(result.rstrip())
+        for user in users:
+            usage = fs.user_usage(user)
+            uid = self.system.user_manager.users.get(user, {}).get('uid', 0 if user == 'root' else '?')
+            limit = usage['limit'] // 1024 if usage['limit'] else 0
+            inode_limit = usage['inode_limit'] or 0
+            if '-q' in args:
+                if usage['limit'] and usage['used'] >= usage['limit']:
+                    output.append("Block limit reached on /dev/sda1")
+                if inode_limit and usage['inodes_used'] >= inode_limit:
+                    output.append("File limit reached on /dev/sda1")
+                continue
+            output.append(f"Disk quotas for user {user} (uid {uid}): ")
+            output.append("     Filesystem  blocks   quota   limit   grace   files   quota   limit   grace")
+            output.append(f"      /dev/sda1 {usage['used'] // 1024:>7} {0:>7} {limit:>7}         {usage['inodes_used']:>7} {0:>7} {inode_limit:>7}")
         return '\n'.join(output) + '\n' if output else ''
 
+    @command('setquota')
+    def cmd_setquota(self, args, stdin):
+        fs = self.system.filesystem
+        if (self.system.current_user or 'root') != 'root':
+            return "setquota: Cannot set quota for user: Operation not permitted\n"
+        values = [a for a in args if not a.startswith('-')]
+        if len(values) < 5:
+            return "setquota: Bad number of arguments.\n"
+        user = values[0]
+        try:
+            limit, inode_limit = int(values[2]), int(values[4])
+        except ValueError:
+            return "setquota: Bad number of arguments.\n"
+        fs.user_quotas[user] = {'bytes': limit * 1024 or None, 'inodes': inode_limit or None}
+        return ''
+
+    @command('lscpu')
     def cmd_lscpu(self, args, stdin):
-        freq = psutil.cpu_freq()
+        metrics = host_metrics.current()
         return f"""Architecture:            x86_64
-CPU(s):                  {psutil.cpu_count()}
+CPU(s):                  {metrics['cpu_count']}
 Model name:              Virtual CPU
-CPU MHz:                 {freq.current if freq else 2400:.3f}
+CPU MHz:                 {metrics['cpu_freq']:.3f}
 """
 
+    @command('lsblk')
     def cmd_lsblk(self, args, stdin):
-        disk = psutil.disk_usage('/')
+        disk = host_metrics.current()['disk']
         return f"""NAME   MAJ:MIN RM   SIZE RO TYPE MOUNTPOINT
-sda      8:0    0   {disk.total / (1024**3):.1f}G  0 disk 
-├─sda1   8:1    0   {(disk.total - 1024**3) / (1024**3):.1f}G  0 part /
+sda      8:0    0   {disk['total'] / (1024**3):.1f}G  0 disk 
+├─sda1   8:1    0   {(disk['total'] - 1024**3) / (1024**3):.1f}G  0 part /
 └─sda2   8:2    0     1G  0 part [SWAP]
 """
 
+    @command('blkid')
     def cmd_blkid(self, args, stdin):
         return '/dev/sda1: UUID="12345678-1234-1234-1234-123456789abc" TYPE="ext4"\n'
 
+    @command('curl')
     def cmd_curl(self, args, stdin):
         url = None
         for a in args:
@@ -1334,6 +2271,7 @@ sda      8:0    0   {disk.total / (1024**3):.1f}G  0 disk
             return "curl: missing URL\n"
         return self.system.network_manager.curl(url)
 
+    @command('wget')
     def cmd_wget(self, args, stdin):
         url = None
         for a in args:
@@ -1344,16 +2282,19 @@ sda      8:0    0   {disk.total / (1024**3):.1f}G  0 disk
             return "wget: missing URL\n"
         return self.system.network_manager.wget(url)
 
+    @command('nslookup')
     def cmd_nslookup(self, args, stdin):
         if not args:
             return "nslookup: missing host\n"
         return self.system.network_manager.nslookup(args[0])
 
+    @command('dig')
     def cmd_dig(self, args, stdin):
         if not args:
             return "dig: missing host\n"
         return self.system.network_manager.dig(args[0])
 
+    @command('rev', stdin=True)
     def cmd_rev(self, args, stdin):
         content = stdin or ''
         files = [a for a in args if not a.startswith('-')]
@@ -1362,6 +2303,7 @@ sda      8:0    0   {disk.total / (1024**3):.1f}G  0 disk
         lines = content.split('\n')
         return '\n'.join(line[::-1] for line in lines)
 
+    @command('nl', stdin=True)
     def cmd_nl(self, args, stdin):
         content = stdin or ''
         files = [a for a in args if not a.startswith('-')]
@@ -1374,3 +2316,22 @@ sda      8:0    0   {disk.total / (1024**3):.1f}G  0 disk
             else:
                 output.append(line)
         return '\n'.join(output)
+
+    @command('reboot')
+    def cmd_reboot(self, args, stdin):
+        return 'reboot\n'
+
+    @command('shutdown')
+    def cmd_shutdown(self, args, stdin):
+        return 'shutdown\n'
+
+    @command('poweroff')
+    def cmd_poweroff(self, args, stdin):
+        return 'poweroff\n'
+
+    @command('halt')
+    def cmd_halt(self, args, stdin):
+        return 'halt\n'
+
+
+CommandExecutor.registry = CommandExecutor._build_registry()
@@ -0,0 +1,208 @@
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+
+OPERATORS = re.compile(r'\|\||&&|[|;&(]')
+ASSIGNMENT = re.compile(r'[A-Za-z_][A-Za-z0-9_]*=')
+
+
+def _units(system):
+    return system.systemd.services
+
+
+def _packages(system):
+    return system.package_manager.available
+
+
+def _installed(system):
+    return system.package_manager.installed
+
+
+APT = {
+    'subcommands': ['install', 'list', 'remove', 'search', 'show', 'update', 'upgrade'],
+    'arguments': {'install': _packages, 'remove': _installed, 'show': _packages},
+    'options': {'list': ['--installed']},
+}
+COMMAND_SPECS = {
+    'systemctl': {
+        'subcommands': ['daemon-reload', 'disable', 'enable', 'list-units', 'restart', 'start', 'status', 'stop'],
+        'arguments': {name: _units for name in ('disable', 'enable', 'restart', 'start', 'status', 'stop')},
+    },
+    'apt': APT,
+    'apt-get': APT,
+    'ip': {
+        'subcommands': ['address', 'addr', 'link', 'route'],
+    },
+    'dpkg': {
+        'options': {None: ['--list', '--listfiles', '--status', '-L', '-l', '-s']},
+        'arguments': {option: _installed for option in ('--listfiles', '--status', '-L', '-s')},
+    },
+}
+
+
+class PrefixTrie:
+    def __init__(self, words=()):
+        self.root = {}
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        node = self.root
+        for c in word:
+            node = node.setdefault(c, {})
+        if None not in node:
+            node[None] = True
+            self.size += 1
+
+    def remove(self, word):
+        path = []
+        node = self.root
+        for c in word:
+            child = node.get(c)
+            if child is None:
+                return False
+            path.append((node, c))
+            node = child
+        if None not in node:
+            return False
+        del node[None]
+        self.size -= 1
+        for parent, c in reversed(path):
+            if parent[c]:
+                break
+            del parent[c]
+        return True
+
+    def complete(self, prefix, limit=None):
+        node = self.root
+        for c in prefix:
+            node = node.get(c)
+            if node is None:
+                return []
+        result = []
+        stack = [(prefix, node)]
+        while stack:
+            word, node = stack.pop()
+            if None in node:
+                result.append(word)
+                if limit is not None and len(result) >= limit:
+                    break
+            for c in sorted((k for k in node if k is not None), reverse=True):
+                stack.append((word + c, node[c]))
+        return result
+
+
+_command_trie = None
+
+
+def command_trie(executor):
+    global _command_trie
+    if _command_trie is None:
+        _command_trie = PrefixTrie(executor.command_names())
+    return _command_trie
+
+
+class Completer:
+    max_completions = 1000
+    listing_cache_size = 32
+
+    def __init__(self, system, executor):
+        self.system = system
+        self.executor = executor
+        self.aliases = PrefixTrie()
+        self.alias_names = set()
+        self.listings = OrderedDict()
+
+    def complete(self, partial):
+        segment = OPERATORS.split(partial)[-1]
+        words = segment.split()
+        current = '' if not words or segment[-1:].isspace() else words.pop()
+        while words and ASSIGNMENT.match(words[0]):
+            words.pop(0)
+        if words[:1] == ['sudo']:
+            words = [w for w in words[1:] if not w.startswith('-')] if len(words) > 1 else []
+
+        if current.startswith('$'):
+            return self.complete_variable(current)
+        if not words and '/' not in current:
+            return self.complete_command(current)
+        spec = COMMAND_SPECS.get(words[0]) if words else None
+        if spec is not None:
+            result = self.complete_argument(spec, words[1:], current)
+            if result is not None:
+                return result
+        return self.complete_path(current)
+
+    def complete_command(self, prefix):
+        names = self.system.aliases.keys()
+        if names != self.alias_names:
+            for name in self.alias_names - names:
+                self.aliases.remove(name)
+            for name in names - self.alias_names:
+                self.aliases.add(name)
+            self.alias_names = set(names)
+        found = command_trie(self.executor).complete(prefix, self.max_completions)
+        found += self.aliases.complete(prefix, self.max_completions)
+        return sorted(set(found))
+
+    def complete_variable(self, current):
+        braced = current.startswith('${')
+        prefix = current[2:] if braced else current[1:]
+        names = [name for name in self.system.environment if name.startswith(prefix)]
+        names += [name for name in ('HOME', 'PWD', 'USER', 'HOSTNAME') if name.startswith(prefix)]
+        return sorted({f"${{{name}}}" if braced else f"${name}" for name in names})
+
+    def complete_argument(self, spec, args, current):
+        args = [a for a in args if not a.startswith('-') or a in spec.get('arguments', {})]
+        subcommand = args[0] if args else None
+        if current.startswith('-'):
+            options = spec.get('options', {}).get(subcommand if 'subcommands' in spec else None, ())
+            return sorted(option for option in options if option.startswith(current))
+        if 'subcommands' in spec and subcommand is None:
+            return [name for name in spec['subcommands'] if name.startswith(current)]
+        provider = spec.get('arguments', {}).get(subcommand)
+        if provider is None:
+            return [] if 'subcommands' in spec and len(args) else None
+        return sorted(name for name in provider(self.system) if name.startswith(current))
+
+    def listing(self, node):
+        fs = self.system.filesystem
+        entry = self.listings.get(id(node))
+        if entry is not None and entry[0] is node and entry[1] == node.generation:
+            self.listings.move_to_end(id(node))
+            return entry[2], entry[3]
+        children = dict(fs.iter_dir(node))
+        names = sorted(children)
+        self.listings[id(node)] = (node, node.generation, names, children)
+        if len(self.listings) > self.listing_cache_size:
+            self.listings.popitem(last=False)
+        return names, children
+
+    def complete_path(self, current):
+        fs = self.system.filesystem
+        directory, _, prefix = current.rpartition('/')
+        if '/' in current:
+            lookup = directory or '/'
+            if lookup == '~' or lookup.startswith('~/'):
+                lookup = self.system.environment.get('HOME', '/root') + lookup[1:]
+            head = directory + '/'
+        else:
+            lookup = fs.cwd
+            head = ''
+        node = fs.get_node(lookup)
+        if node is None or not node.is_dir:
+            return []
+        names, children = self.listing(node)
+        result = []
+        for i in range(bisect_left(names, prefix), len(names)):
+            name = names[i]
+            if not name.startswith(prefix) or len(result) >= self.max_completions:
+                break
+            if name.startswith('.') and not prefix.startswith('.'):
+                continue
+            child = children[name]
+            if child.is_symlink:
+                child = fs.get_node(f"{lookup.rstrip('/')}/{name}") or child
+            result.append(head + name + '/' if child.is_dir else head + name)
+        return result
@@ -0,0 +1,325 @@
+import re
+from fnmatch import fnmatchcase
+
+QUANTIFIER = re.compile(r'\{(\d*)(,\d*)?\}')
+# IGNORECASE also matches k, s and i against non-ASCII letters (KELVIN SIGN,
+# LONG S, DOTLESS I), which the ASCII-folded index cannot see.
+FOLD_UNSAFE = re.compile('[^\x00-\x7f]|[kKsSiI]')
+GLOB_MAGIC = re.compile(r'[*?[]')
+
+
+def trigrams(data):
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def _group_end(pattern, i):
+    depth = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            i = _class_end(pattern, i)
+            continue
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _class_end(pattern, i):
+    i += 1
+    if pattern[i:i + 1] == '^':
+        i += 1
+    if pattern[i:i + 1] == ']':
+        i += 1
+    while i < len(pattern) and pattern[i] != ']':
+        i += 2 if pattern[i] == '\\' else 1
+    return i + 1
+
+
+def literal_branches(pattern, ignore_case=False):
+    branches = [[]]
+    run = []
+
+    def flush():
+        if run:
+            branches[-1].append(''.join(run))
+            run.clear()
+
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            escaped = pattern[i + 1:i + 2]
+            i += 2
+            if escaped and not escaped.isalnum():
+                run.append(escaped)
+            else:
+                flush()
+            continue
+        if c in '*?+{':
+            match = QUANTIFIER.match(pattern, i) if c == '{' else None
+            if c == '{' and match is None:
+                run.append(c)
+                i += 1
+                continue
+            optional = c in '*?' or (match is not None and not int(match.group(1) or 0))
+            if optional and run:
+                run.pop()
+            flush()
+            i = match.end() if match else i + 1
+            if pattern[i:i + 1] in ('?', '+'):
+                i += 1
+            continue
+        if c == '|':
+            flush()
+            branches.append([])
+            i += 1
+            continue
+        if c not in '[(.^$':
+            run.append(c)
+            i += 1
+            continue
+        flush()
+        if c == '[':
+            i = _class_end(pattern, i)
+        elif c == '(':
+            i = _group_end(pattern, i)
+        else:
+            i += 1
+    flush()
+    if ignore_case:
+        branches = [[part for piece in runs for part in FOLD_UNSAFE.split(piece) if part] for runs in branches]
+    return branches
+
+
+class TreeIndex:
+    def __init__(self, filesystem):
+        self.filesystem = filesystem
+        self.epoch = None
+        self.version = 0
+        self.lookups = 0
+        self.rebuilds = 0
+        self.reset()
+
+    def reset(self):
+        self.tree = {}
+
+    def rebuild(self):
+        self.epoch = None
+        self.refresh()
+
+    def refresh(self):
+        fs = self.filesystem
+        if fs.epoch != self.epoch or self.version < fs.journal_floor:
+            self.reset()
+            self.epoch = fs.epoch
+            self.rebuilds += 1
+            since = -1
+        elif self.version == fs.version:
+            return
+        else:
+            since = self.version
+            deleted = {path for version, path in fs.journal if version > since}
+            if deleted:
+                self._discard_deleted(deleted)
+        for path, node in fs.changed_nodes(since):
+            self._update(path, node)
+        self.version = fs.version
+
+    def _discard_deleted(self, deleted):
+        stale = []
+        stack = list(deleted)
+        while stack:
+            path = stack.pop()
+            stale.append(path)
+            stack.extend(self.tree.get(path, ()))
+        for path in stale:
+            self._discard(path)
+
+    def _track(self, path):
+        # Index entries bucketed by parent directory, so a deleted
+        # directory's entries are found without scanning the whole index.
+        while path != '/':
+            parent = path.rpartition('/')[0] or '/'
+            children = self.tree.get(parent)
+            if children is not None:
+                children.add(path)
+                return
+            self.tree[parent] = {path}
+            path = parent
+
+    def _untrack(self, path):
+        while path != '/' and path not in self.tree:
+            parent = path.rpartition('/')[0] or '/'
+            children = self.tree.get(parent)
+            if children is None:
+                return
+            children.discard(path)
+            if children:
+                return
+            del self.tree[parent]
+            path = parent
+
+
+class ContentIndex(TreeIndex):
+    max_file_size = 1024 * 1024
+
+    def reset(self):
+        super().reset()
+        self.files = {}
+        self.postings = {}
+        self.unindexed = set()
+        self.symlinks = set()
+
+    def _update(self, path, node):
+        if node.is_dir:
+            return
+        self._discard(path)
+        self._track(path)
+        if node.is_symlink:
+            self.symlinks.add(path)
+        else:
+            self._add(path, node)
+
+    def _add(self, path, node):
+        if node.size > self.max_file_size:
+            self.unindexed.add(path)
+            self.files[path] = frozenset()
+            return
+        grams = trigrams(bytes(node.content).lower())
+        self.files[path] = grams
+        postings = self.postings
+        for gram in grams:
+            paths = postings.get(gram)
+            if paths is None:
+                postings[gram] = {path}
+            else:
+                paths.add(path)
+
+    def _discard(self, path):
+        self._untrack(path)
+        self.symlinks.discard(path)
+        grams = self.files.pop(path, None)
+        if grams is None:
+            return
+        self.unindexed.discard(path)
+        postings = self.postings
+        for gram in grams:
+            paths = postings.get(gram)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del postings[gram]
+
+    def candidates(self, branches):
+        self.lookups += 1
+        result = set()
+        for runs in branches:
+            grams = set()
+            for run in runs:
+                grams |= trigrams(run.encode('utf-8', 'surrogateescape').lower())
+            if not grams:
+                return None
+            sets = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+            if not sets[0]:
+                continue
+            found = set(sets[0])
+            for paths in sets[1:]:
+                found &= paths
+                if not found:
+                    break
+            result |= found
+        return result | self.unindexed
+
+    def search(self, path, branches):
+        found = self.candidates(branches)
+        if found is None:
+            return None
+        prefix = path.rstrip('/') + '/'
+        files = [p for p in found if p == path or p.startswith(prefix)]
+        links = [p for p in self.symlinks if p.startswith(prefix)]
+        return files, links
+
+    def get_stats(self):
+        return {
+            'files': len(self.files),
+            'trigrams': len(self.postings),
+            'unindexed': len(self.unindexed),
+            'lookups': self.lookups,
+            'rebuilds': self.rebuilds,
+        }
+
+
+class NameIndex(TreeIndex):
+    def reset(self):
+        super().reset()
+        self.paths = {}
+        self.names = {}
+        self.suffixes = {}
+
+    def _update(self, path, node):
+        if path == '/' or path in self.paths:
+            return
+        self._track(path)
+        name = path.rpartition('/')[2]
+        self.paths[path] = name
+        paths = self.names.get(name)
+        if paths is None:
+            self.names[name] = {path}
+            if '.' in name:
+                self.suffixes.setdefault(name.rpartition('.')[2].lower(), set()).add(name)
+        else:
+            paths.add(path)
+
+    def _discard(self, path):
+        self._untrack(path)
+        name = self.paths.pop(path, None)
+        if name is None:
+            return
+        paths = self.names[name]
+        paths.discard(path)
+        if not paths:
+            del self.names[name]
+            if '.' in name:
+                suffix = name.rpartition('.')[2].lower()
+                self.suffixes[suffix].discard(name)
+                if not self.suffixes[suffix]:
+                    del self.suffixes[suffix]
+
+    def matching_names(self, pattern, ignore_case=False):
+        self.lookups += 1
+        if not ignore_case and not GLOB_MAGIC.search(pattern):
+            return [pattern] if pattern in self.names else []
+        tail = pattern.rpartition('*')[2]
+        if '*' in pattern and '.' in tail and not GLOB_MAGIC.search(tail):
+            names = self.suffixes.get(tail.rpartition('.')[2].lower(), ())
+        else:
+            names = self.names
+        if ignore_case:
+            pattern = pattern.lower()
+            return [name for name in names if fnmatchcase(name.lower(), pattern)]
+        return [name for name in names if fnmatchcase(name, pattern)]
+
+    def search(self, path, patterns):
+        names = None
+        for pattern, ignore_case in patterns:
+            found = set(self.matching_names(pattern, ignore_case))
+            names = found if names is None else names & found
+        prefix = path.rstrip('/') + '/'
+        return [p for name in names or () for p in self.names[name] if p == path or p.startswith(prefix)]
+
+    def get_stats(self):
+        return {
+            'paths': len(self.paths),
+            'names': len(self.names),
+            'suffixes': len(self.suffixes),
+            'lookups': self.lookups,
+            'rebuilds': self.rebuilds,
+        }
@@ -22,9 +22,9 @@ class DeviceManager:
 
     def read_device(self, name, size=1):
         if name == 'null':
-            return ''
+            return b''
         elif name == 'zero':
-            return '\x00' * size
+            return bytes(size)
         elif name in ['random', 'urandom']:
-            return bytes(random.getrandbits(8) for _ in range(size)).decode('latin-1')
+            return random.getrandbits(8 * size).to_bytes(size, 'little') if size > 0 else b''
         return None
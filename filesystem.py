@@ -1,28 +1,94 @@
+import copy
+import errno
+import os
+import secrets
+import sys
+import threading
 import time
+from collections import OrderedDict
+from functools import lru_cache
 
+from content_index import ContentIndex, NameIndex
 
-class FileNode:
-    def __init__(self, name, is_dir=False, content='', permissions=0o644, owner='root', group='root'):
+
+def encode_content(content):
+    if isinstance(content, str):
+        return content.encode('utf-8', 'surrogateescape')
+    if isinstance(content, bytes):
+        return content
+    return bytes(content)
+
+
+def decode_content(data):
+    return str(data, 'utf-8', 'surrogateescape')
+
+
+class FileSystemError(OSError):
+    def __str__(self):
+        return f"{self.filename}: {self.strerror}"
+
+
+class QuotaExceeded(FileSystemError):
+    pass
+
+
+class Node:
+    __slots__ = ('name', 'inode', 'links', 'permissions', 'owner', 'group', 'created', 'modified',
+                 'accessed', 'shared', 'generation', 'parent')
+    is_dir = False
+    is_symlink = False
+    children = None
+    content = b''
+    symlink_target = None
+
+    def __init__(self, name, permissions, owner, group, now):
+        if now is None:
+            now = time.time()
         self.name = name
-        self.is_dir = is_dir
-        self.content = content
-        self.permissions = permissions if not is_dir else 0o755
-        self.owner = owner
-        self.group = group
-        self.children = {} if is_dir else None
-        self.created = time.time()
-        self.modified = time.time()
-        self.accessed = time.time()
-        self.size = len(content) if content else 0
-        self.inode = id(self) % 1000000
+        self.inode = 0
         self.links = 1
-        self.symlink_target = None
+        self.permissions = permissions
+        self.owner = sys.intern(owner)
+        self.group = sys.intern(group)
+        self.created = now
+        self.modified = now
+        self.accessed = now
+        self.shared = False
+        self.generation = 0
+        self.parent = None
 
-    def to_dict(self):
-        data = {
+    @property
+    def size(self):
+        return len(self.content)
+
+    @property
+    def total_bytes(self):
+        return self.size
+
+    total_inodes = 1
+
+    def path(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return '/' + '/'.join(reversed(parts))
+
+    def clone(self):
+        node = copy.copy(self)
+        node.shared = False
+        return node
+
+    def freeze(self):
+        self.shared = True
+        self.generation = 0
+
+    def to_record(self):
+        return {
             'name': self.name,
             'is_dir': self.is_dir,
-            'content': self.content,
+            'content': decode_content(self.content),
             'permissions': self.permissions,
             'owner': self.owner,
             'group': self.group,
@@ -34,39 +100,361 @@ class FileNode:
             'links': self.links,
             'symlink_target': self.symlink_target
         }
-        if self.is_dir and self.children:
-            data['children'] = {k: v.to_dict() for k, v in self.children.items()}
-        return data
+
+    def to_dict(self):
+        return self.to_record()
 
     @classmethod
     def from_dict(cls, data):
-        node = cls(
-            data['name'],
-            data['is_dir'],
-            data.get('content', ''),
-            data.get('permissions', 0o644),
-            data.get('owner', 'root'),
-            data.get('group', 'root')
-        )
-        node.created = data.get('created', time.time())
-        node.modified = data.get('modified', time.time())
-        node.accessed = data.get('accessed', time.time())
-        node.size = data.get('size', 0)
-        node.inode = data.get('inode', id(node) % 1000000)
+        now = data.get('modified') or time.time()
+        if data['is_dir']:
+            node = DirNode(data['name'], data.get('permissions', 0o755),
+                           data.get('owner', 'root'), data.get('group', 'root'), now)
+            for name, child_data in data.get('children', {}).items():
+                child = Node.from_dict(child_data)
+                child.name = name
+                node.add_child(child)
+        elif data.get('symlink_target'):
+            node = SymlinkNode(data['name'], data['symlink_target'], data.get('owner', 'root'),
+                               data.get('group', 'root'), now)
+        else:
+            node = FileNode(data['name'], data.get('content', ''), data.get('permissions', 0o644),
+                            data.get('owner', 'root'), data.get('group', 'root'), now)
+        node.created = data.get('created', now)
+        node.accessed = data.get('accessed', now)
+        node.inode = data.get('inode', 0)
         node.links = data.get('links', 1)
-        node.symlink_target = data.get('symlink_target')
-        if data['is_dir'] and 'children' in data:
-            node.children = {k: cls.from_dict(v) for k, v in data['children'].items()}
         return node
 
 
+class FileNode(Node):
+    __slots__ = ('content',)
+
+    def __init__(self, name, content=b'', permissions=0o644, owner='root', group='root', now=None):
+        super().__init__(name, permissions, owner, group, now)
+        self.content = encode_content(content)
+
+
+class SymlinkNode(Node):
+    __slots__ = ('symlink_target',)
+    is_symlink = True
+
+    def __init__(self, name, target, owner='root', group='root', now=None):
+        super().__init__(name, 0o777, owner, group, now)
+        self.symlink_target = target
+
+    @property
+    def size(self):
+        return len(self.symlink_target)
+
+
+class DirNode(Node):
+    __slots__ = ('children', 'total_bytes', 'total_inodes')
+    is_dir = True
+    size = 4096
+
+    def __init__(self, name, permissions=0o755, owner='root', group='root', now=None):
+        super().__init__(name, permissions, owner, group, now)
+        self.children = {}
+        self.total_bytes = self.size
+        self.total_inodes = 1
+
+    def add_child(self, child):
+        self.children[child.name] = child
+        child.parent = self
+        return child
+
+    def clone(self):
+        node = super().clone()
+        node.children = dict(self.children)
+        return node
+
+    def freeze(self):
+        super().freeze()
+        for child in self.children.values():
+            child.freeze()
+
+    def to_record(self):
+        data = super().to_record()
+        data['total_bytes'] = self.total_bytes
+        data['total_inodes'] = self.total_inodes
+        return data
+
+    def to_dict(self):
+        data = self.to_record()
+        if self.children:
+            data['children'] = {k: v.to_dict() for k, v in self.children.items()}
+        return data
+
+
+@lru_cache(maxsize=4096)
+def normalize_path(cwd, path):
+    if not path.startswith('/'):
+        path = cwd + '/' + path if cwd != '/' else '/' + path
+    resolved = []
+    for part in path.split('/'):
+        if part == '' or part == '.':
+            continue
+        elif part == '..':
+            if resolved:
+                resolved.pop()
+        else:
+            resolved.append(part)
+    return '/' + '/'.join(resolved) if resolved else '/'
+
+
+_base_filesystem = None
+_base_image_lock = threading.Lock()
+
+
+def get_base_filesystem():
+    global _base_filesystem
+    with _base_image_lock:
+        if _base_filesystem is None:
+            builder = FileSystem()
+            builder.populate()
+            builder.root.freeze()
+            _base_filesystem = builder
+    return _base_filesystem
+
+
+def get_base_image():
+    return get_base_filesystem().root
+
+
 class FileSystem:
-    def __init__(self):
-        self.root = FileNode('/', is_dir=True, permissions=0o755)
+    journal_limit = 1024
+    node_cache_size = 4096
+    max_symlinks = 40
+    capacity = 19 * 1024**3
+    inode_capacity = 1245184
+
+    def __init__(self, storage=None, storage_key=None):
+        self.storage = storage
+        self.storage_key = storage_key
+        self.pending = {}
+        self.linked = {}
+        self.hardlinks = {}
+        self.virtual = {}
+        self.flushed_version = 0
+        self.inodes = {}
+        self.base_inodes = {}
+        self.next_inode = 1
+        self.owner_usage = {}
+        self.root = self._register(DirNode('/'))
+        self._charge(self.root.owner, self.root.size, 1)
         self.cwd = '/root'
         self.mounts = {'/': {'device': '/dev/sda1', 'fstype': 'ext4', 'options': 'rw,relatime'}}
+        self.epoch = secrets.token_hex(8)
+        self.version = 0
+        self.journal = []
+        self.journal_floor = 0
+        self.node_cache = OrderedDict()
+        self.user = 'root'
+        self.quota = {'bytes': None, 'inodes': None}
+        self.user_quota = {'bytes': None, 'inodes': None}
+        self.user_quotas = {}
+        self.indexing = False
+        self.content_index = None
+        self.name_index = None
 
     def initialize(self):
+        if self.version == 0:
+            base = get_base_filesystem()
+            self.root = base.root
+            self.inodes = {}
+            self.base_inodes = base.inodes
+            self.next_inode = base.next_inode
+            self.owner_usage = {owner: list(usage) for owner, usage in base.owner_usage.items()}
+            self.node_cache.clear()
+            if self.persistent:
+                self._attach_storage()
+
+    @property
+    def persistent(self):
+        return self.storage is not None and self.storage.persistent
+
+    def _attach_storage(self):
+        meta = self.storage.load_meta(self.storage_key)
+        record = self.storage.load_node(self.storage_key, '/') if meta else None
+        if record is None:
+            return
+        self.epoch = meta['epoch']
+        self.version = self.flushed_version = self.journal_floor = meta['version']
+        self.next_inode = max(self.next_inode, meta['next_inode'])
+        self.owner_usage = {owner: list(usage) for owner, usage in meta['owner_usage'].items()}
+        self.user_quotas.update(meta.get('user_quotas', {}))
+        self.root = self._materialize('/', record, get_base_image())
+
+    def _materialize(self, path, record, base):
+        inode = record.get('inode')
+        if record['is_dir']:
+            node = base.clone() if base is not None and base.is_dir else DirNode(record['name'])
+            node.permissions = record.get('permissions', node.permissions)
+            node.owner = sys.intern(record.get('owner', node.owner))
+            node.group = sys.intern(record.get('group', node.group))
+            node.created = record.get('created', node.created)
+            node.modified = record.get('modified', node.modified)
+            node.accessed = record.get('accessed', node.accessed)
+            node.total_bytes = record.get('total_bytes', node.size)
+            node.total_inodes = record.get('total_inodes', 1)
+            self.pending[id(node)] = (node, path)
+        elif inode in self.linked:
+            return self.linked[inode]
+        else:
+            node = Node.from_dict(record)
+            if node.links > 1:
+                self.linked[inode] = node
+        node.generation = self.flushed_version
+        if inode:
+            self._register(node, inode)
+        return node
+
+    def mount_virtual(self, path, provider):
+        self.virtual[path] = provider
+        self.node_cache.clear()
+
+    def _virtual_node(self, path):
+        for mount, provider in self.virtual.items():
+            if path == mount:
+                return provider, provider.lookup('')
+            if path.startswith(mount) and path[len(mount)] == '/':
+                return provider, provider.lookup(path[len(mount) + 1:])
+        return None, None
+
+    def is_virtual(self, path):
+        return bool(self.virtual) and self._virtual_node(path)[0] is not None
+
+    def _check_writable(self, path):
+        if self.is_virtual(path):
+            raise FileSystemError(errno.EACCES, os.strerror(errno.EACCES), path)
+
+    def _fault(self, node):
+        entry = self.pending.pop(id(node), None)
+        if entry is None:
+            return
+        path = entry[1]
+        base = self._base_node(path)
+        base_children = base.children if base is not None and base.is_dir else {}
+        prefix = path if path != '/' else ''
+        for name, record in self.storage.load_children(self.storage_key, path):
+            if record is None:
+                node.children.pop(name, None)
+                continue
+            child = self._materialize(f"{prefix}/{name}", record, base_children.get(name))
+            child.name = name
+            child.parent = node
+            node.children[name] = child
+            if child.links > 1:
+                self._add_entry(child, node, name)
+
+    def _fault_tree(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.is_dir:
+                self._fault(node)
+                stack.extend(node.children.values())
+
+    def _fault_all(self):
+        while self.pending:
+            for node, path in list(self.pending.values()):
+                self._fault(node)
+
+    def _base_node(self, path):
+        node = get_base_image()
+        for part in path.strip('/').split('/'):
+            if not part:
+                continue
+            node = node.children.get(part) if node.is_dir else None
+            if node is None:
+                return None
+        return node
+
+    def flush(self):
+        if not self.persistent or self.version == self.flushed_version:
+            return False
+        full = self.flushed_version == 0 or self.flushed_version < self.journal_floor
+        if full:
+            self._fault_all()
+        since = 0 if full else self.flushed_version
+        changed = {}
+        missing = []
+        self._collect_changes(self.root, '/', since, get_base_image(), changed, missing)
+        removed = [] if full else [path for v, path in self.journal if v > since]
+        rows = {path: None for path in missing}
+        for path in removed:
+            if path not in changed and self._base_node(path) is not None:
+                rows[path] = None
+        rows.update(changed)
+        meta = {
+            'epoch': self.epoch,
+            'version': self.version,
+            'next_inode': self.next_inode,
+            'owner_usage': self.owner_usage,
+            'user_quotas': self.user_quotas,
+        }
+        self.storage.write_batch(self.storage_key, meta, list(rows.items()), removed, reset=full)
+        self.flushed_version = self.version
+        return True
+
+    def _register(self, node, inode=None):
+        if inode is None:
+            inode = self.next_inode
+        node.inode = inode
+        self.next_inode = max(self.next_inode, inode + 1)
+        self.inodes[inode] = node
+        return node
+
+    def get_inode(self, inode):
+        if inode in self.inodes:
+            return self.inodes[inode]
+        return self.base_inodes.get(inode)
+
+    def _unlink(self, node, parent=None, name=None):
+        stack = [(parent, name, node)]
+        while stack:
+            parent, name, node = stack.pop()
+            if node.links > 1:
+                node.links -= 1
+                self._drop_entry(node, parent, name)
+                continue
+            self._charge(node.owner, -node.size, -1)
+            if self.get_inode(node.inode) is node:
+                self._forget_inode(node.inode)
+            if node.is_dir:
+                stack.extend((node, child_name, child) for child_name, child in node.children.items())
+
+    def _add_entry(self, node, parent, name):
+        entries = self.hardlinks.setdefault(node.inode, [])
+        if not any(entry[0] is parent and entry[1] == name for entry in entries):
+            entries.append((parent, name))
+
+    def _drop_entry(self, node, parent, name):
+        entries = [entry for entry in self.hardlinks.get(node.inode, ())
+                   if entry[0] is not parent or entry[1] != name]
+        if len(entries) > 1:
+            self.hardlinks[node.inode] = entries
+            return
+        self.hardlinks.pop(node.inode, None)
+        if entries:
+            node.parent, node.name = entries[0]
+
+    def _link_chains(self, node):
+        # Every directory entry of a hard-linked inode, as the chain of
+        # directories from the entry's parent up to the root.
+        if self.pending:
+            self._fault_all()
+        chains = []
+        for parent, name in self.hardlinks.get(node.inode, ()):
+            chain = []
+            while parent is not None:
+                chain.append(parent)
+                parent = parent.parent
+            chains.append(chain)
+        return chains
+
+    def populate(self):
         dirs = [
             '/bin', '/sbin', '/usr', '/usr/bin', '/usr/sbin', '/usr/lib',
             '/etc', '/etc/init.d', '/etc/systemd', '/etc/apt',
@@ -77,46 +465,295 @@ class FileSystem:
         for d in dirs:
             self._mkdir_p(d)
         self._create_etc_files()
-        self._create_proc_files()
         self._create_dev_files()
         self._create_bin_files()
         self._create_root_files()
 
-    def _mkdir_p(self, path):
-        parts = path.strip('/').split('/')
-        current = self.root
-        for part in parts:
-            if part not in current.children:
-                current.children[part] = FileNode(part, is_dir=True)
-            current = current.children[part]
+    def _mkdir_p(self, path, chain=None, reserve=False):
+        if chain is None:
+            chain = []
+        if reserve:
+            self._check_writable(path)
+        current = self._get_writable_node('/', chain)
+        now = time.time()
+        for part in path.strip('/').split('/'):
+            if not part:
+                continue
+            if self.pending:
+                self._fault(current)
+            child = current.children.get(part)
+            if child is None:
+                if reserve:
+                    self._reserve(self.user, DirNode.size, 1, path)
+                child = current.add_child(self._register(DirNode(part, owner=self.user, group=self.user, now=now)))
+                self._account(chain, child.total_bytes, child.total_inodes)
+                self._charge(child.owner, child.size, 1)
+            elif not child.is_dir:
+                return None
+            elif child.shared:
+                child = current.add_child(child.clone())
+                self.inodes[child.inode] = child
+                self.node_cache.clear()
+            child.generation = self.version
+            chain.append(child)
+            current = child
+        return current
 
     def _create_file(self, path, content, permissions=0o644):
         parts = path.strip('/').split('/')
         filename = parts[-1]
         dirpath = '/' + '/'.join(parts[:-1]) if len(parts) > 1 else '/'
-        self._mkdir_p(dirpath)
-        parent = self._get_node(dirpath)
+        chain = []
+        parent = self._mkdir_p(dirpath, chain)
         if parent and parent.is_dir:
-            node = FileNode(filename, is_dir=False, content=content, permissions=permissions)
-            parent.children[filename] = node
+            node = self._register(FileNode(filename, content, permissions))
+            node.generation = self.version
+            self._attach(chain, parent, filename, node)
+            self.node_cache.pop(path, None)
+
+    def _account(self, chain, nbytes, ninodes):
+        for node in chain:
+            if node.is_dir:
+                node.total_bytes += nbytes
+                node.total_inodes += ninodes
+
+    def _attach(self, chain, parent, name, node, charge=True):
+        old = parent.children.get(name)
+        nbytes = node.total_bytes
+        ninodes = node.total_inodes
+        if old is not None:
+            nbytes -= old.total_bytes
+            ninodes -= old.total_inodes
+            self._unlink(old, parent, name)
+        if name == node.name:
+            parent.add_child(node)
+        else:
+            parent.children[name] = node
+        if node.links > 1:
+            self._add_entry(node, parent, name)
+        self._account(chain, nbytes, ninodes)
+        if charge:
+            self._charge(node.owner, node.size, 1)
+
+    def _resize(self, node, chain, nbytes):
+        if node.links > 1:
+            for entry_chain in self._link_chains(node):
+                self._account(entry_chain, nbytes, 0)
+        else:
+            self._account(chain, nbytes, 0)
+        self._charge(node.owner, nbytes, 0)
+
+    def _charge(self, owner, nbytes, ninodes):
+        usage = self.owner_usage.get(owner)
+        if usage is None:
+            usage = self.owner_usage[owner] = [0, 0]
+        usage[0] += nbytes
+        usage[1] += ninodes
+
+    def _set_owner(self, node, owner):
+        owner = sys.intern(owner)
+        if owner != node.owner:
+            self._charge(node.owner, -node.size, -1)
+            self._charge(owner, node.size, 1)
+            node.owner = owner
+
+    def _recount(self, root):
+        self.owner_usage = {}
+        order = []
+        seen = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.links > 1:
+                if id(node) in seen:
+                    continue
+                seen.add(id(node))
+            self._charge(node.owner, node.size, 1)
+            if node.is_dir:
+                order.append(node)
+                stack.extend(node.children.values())
+        for node in reversed(order):
+            node.total_bytes = node.size + sum(child.total_bytes for child in node.children.values())
+            node.total_inodes = 1 + sum(child.total_inodes for child in node.children.values())
+
+    def limits(self):
+        limit = self.quota.get('bytes') or self.capacity
+        inode_limit = self.quota.get('inodes') or self.inode_capacity
+        return min(limit, self.capacity), min(inode_limit, self.inode_capacity)
+
+    def user_limits(self, owner):
+        quota = self.user_quotas.get(owner)
+        if quota is None:
+            quota = self.user_quota if owner != 'root' else {}
+        return quota.get('bytes') or None, quota.get('inodes') or None
+
+    def _reserve(self, owner, nbytes, ninodes, path):
+        if nbytes <= 0 and ninodes <= 0:
+            return
+        limit, inode_limit = self.limits()
+        if (nbytes > 0 and self.root.total_bytes + nbytes > limit) or \
+                (ninodes > 0 and self.root.total_inodes + ninodes > inode_limit):
+            raise QuotaExceeded(errno.ENOSPC, os.strerror(errno.ENOSPC), path)
+        limit, inode_limit = self.user_limits(owner)
+        used, inodes_used = self.owner_usage.get(owner, (0, 0))
+        if (nbytes > 0 and limit is not None and used + nbytes > limit) or \
+                (ninodes > 0 and inode_limit is not None and inodes_used + ninodes > inode_limit):
+            raise QuotaExceeded(errno.EDQUOT, os.strerror(errno.EDQUOT), path)
+
+    def usage(self):
+        limit, inode_limit = self.limits()
+        used = self.root.total_bytes
+        inodes_used = self.root.total_inodes
+        return {
+            'total': limit,
+            'used': used,
+            'free': max(limit - used, 0),
+            'percent': used * 100.0 / limit if limit else 0.0,
+            'inodes': inode_limit,
+            'inodes_used': inodes_used,
+            'inodes_free': max(inode_limit - inodes_used, 0),
+        }
+
+    def user_usage(self, owner):
+        limit, inode_limit = self.user_limits(owner)
+        used, inodes_used = self.owner_usage.get(owner, (0, 0))
+        return {
+            'user': owner,
+            'used': used,
+            'limit': limit,
+            'inodes_used': inodes_used,
+            'inode_limit': inode_limit,
+        }
 
     def _get_node(self, path):
         if path == '/':
             return self.root
-        parts = path.strip('/').split('/')
+        node = self.node_cache.get(path)
+        if node is not None:
+            return node
+        if self.virtual:
+            provider, node = self._virtual_node(path)
+            if provider is not None:
+                return node
         current = self.root
-        for part in parts:
+        for part in path.split('/'):
             if not part:
                 continue
+            if self.pending:
+                self._fault(current)
             if current.children and part in current.children:
                 current = current.children[part]
+                if current.is_symlink:
+                    return self._lookup(path)[0]
             else:
                 return None
+        if self.pending:
+            self._fault(current)
+        return self._cache_node(path, current)
+
+    def _cache_node(self, path, node):
+        if node is None:
+            return None
+        self.node_cache[path] = node
+        if len(self.node_cache) > self.node_cache_size:
+            self.node_cache.popitem(last=False)
+        return node
+
+    def _lookup(self, path, follow=True):
+        pending = [part for part in reversed(path.split('/')) if part]
+        nodes = [self.root]
+        names = []
+        hops = 0
+        while pending:
+            part = pending.pop()
+            if part == '.':
+                continue
+            if part == '..':
+                if names:
+                    nodes.pop()
+                    names.pop()
+                continue
+            current = nodes[-1]
+            if self.pending:
+                self._fault(current)
+            if not current.is_dir or part not in current.children:
+                return None, None
+            child = current.children[part]
+            if child.is_symlink and (pending or follow):
+                hops += 1
+                if hops > self.max_symlinks:
+                    return None, None
+                target = child.symlink_target
+                if target.startswith('/'):
+                    nodes = [self.root]
+                    names = []
+                pending.extend(part for part in reversed(target.split('/')) if part)
+                continue
+            nodes.append(child)
+            names.append(part)
+            if self.virtual:
+                real = '/' + '/'.join(names)
+                if real in self.virtual:
+                    real = normalize_path(real, '/'.join(reversed(pending)))
+                    provider, node = self._virtual_node(real)
+                    if provider is None:
+                        return self._lookup(real, follow)
+                    return node, real
+        if self.pending:
+            self._fault(nodes[-1])
+        return nodes[-1], '/' + '/'.join(names)
+
+    def realpath(self, path):
+        return self._lookup(self.resolve_path(path))[1]
+
+    def _get_writable_node(self, path, chain=None):
+        if self.virtual:
+            self._check_writable(path)
+        if self._get_node(path) is None:
+            return None
+        self.version += 1
+        if self.root.shared:
+            self.root = self.root.clone()
+            self.inodes[self.root.inode] = self.root
+            self.node_cache.clear()
+        current = self.root
+        current.generation = self.version
+        if chain is not None:
+            chain.append(current)
+        for part in path.strip('/').split('/'):
+            if not part:
+                continue
+            if self.pending:
+                self._fault(current)
+            if not current.is_dir or part not in current.children:
+                return None
+            child = current.children[part]
+            if child.is_symlink:
+                real = self._lookup(path)[1]
+                if real is None:
+                    return None
+                if chain is not None:
+                    chain.clear()
+                return self._get_writable_node(real, chain)
+            if child.shared:
+                # Children of a clone stay shared and keep their base parent,
+                # which sits at the same path, so path() is unaffected.
+                child = current.add_child(child.clone())
+                self.inodes[child.inode] = child
+                self.node_cache.clear()
+            child.generation = self.version
+            if chain is not None:
+                chain.append(child)
+            current = child
+        if self.pending:
+            self._fault(current)
+        if current.links > 1:
+            for entry_chain in self._link_chains(current):
+                for directory in entry_chain:
+                    directory.generation = self.version
         return current
 
     def _create_etc_files(self):
-        import psutil
-        
         self._create_file('/etc/hostname', 'localhost\n')
         self._create_file('/etc/hosts', '127.0.0.1\tlocalhost\n::1\tlocalhost\n')
         
@@ -152,24 +789,6 @@ class FileSystem:
             'export PATH="/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"\n'
         )
 
-    def _create_proc_files(self):
-        import psutil
-        
-        mem = psutil.virtual_memory()
-        
-        self._create_file('/proc/version', f'Linux version 6.1.0-pylinux\n')
-        
-        cpuinfo = ""
-        for i in range(psutil.cpu_count() or 1):
-            cpuinfo += f'processor\t: {i}\nmodel name\t: Virtual CPU\ncpu MHz\t\t: 2400.000\n\n'
-        self._create_file('/proc/cpuinfo', cpuinfo)
-        
-        meminfo = f'MemTotal:       {mem.total // 1024} kB\nMemFree:        {mem.free // 1024} kB\nMemAvailable:   {mem.available // 1024} kB\n'
-        self._create_file('/proc/meminfo', meminfo)
-        
-        self._create_file('/proc/loadavg', '0.00 0.00 0.00 1/100 1234\n')
-        self._create_file('/proc/uptime', f'{time.time() - psutil.boot_time():.2f} 0.00\n')
-
     def _create_dev_files(self):
         devices = ['null', 'zero', 'random', 'urandom', 'tty', 'console', 'sda', 'sda1']
         for dev in devices:
@@ -203,19 +822,65 @@ class FileSystem:
             return self.cwd
         if path.startswith('~'):
             path = '/root' + path[1:]
-        if not path.startswith('/'):
-            path = self.cwd + '/' + path if self.cwd != '/' else '/' + path
-        parts = path.split('/')
-        resolved = []
-        for part in parts:
-            if part == '' or part == '.':
+        return normalize_path(self.cwd, path)
+
+    def get_node(self, path, follow=True):
+        if follow:
+            return self._get_node(self.resolve_path(path))
+        return self._lookup(self.resolve_path(path), follow=False)[0]
+
+    def iter_dir(self, node):
+        if node is None or not node.is_dir:
+            return iter(())
+        if self.pending:
+            self._fault(node)
+        return iter(node.children.items())
+
+    def walk(self, path, max_depth=None):
+        resolved = self.resolve_path(path)
+        node = self._get_node(resolved)
+        if node is None:
+            return
+        stack = [(resolved, node, 0)]
+        while stack:
+            path, node, depth = stack.pop()
+            if self.pending:
+                self._fault(node)
+            yield path, node, depth
+            if node.is_dir and (max_depth is None or depth < max_depth):
+                prefix = path if path != '/' else ''
+                for name, child in reversed(list(node.children.items())):
+                    stack.append((f"{prefix}/{name}", child, depth + 1))
+
+    def changed_nodes(self, since):
+        stack = [('/', self.root)]
+        while stack:
+            path, node = stack.pop()
+            if node.generation <= since:
                 continue
-            elif part == '..':
-                if resolved:
-                    resolved.pop()
-            else:
-                resolved.append(part)
-        return '/' + '/'.join(resolved) if resolved else '/'
+            if self.pending:
+                self._fault(node)
+            yield path, node
+            if node.is_dir:
+                prefix = path if path != '/' else ''
+                for name, child in node.children.items():
+                    stack.append((f"{prefix}/{name}", child))
+
+    def get_content_index(self):
+        if not self.indexing:
+            return None
+        if self.content_index is None:
+            self.content_index = ContentIndex(self)
+        self.content_index.refresh()
+        return self.content_index
+
+    def get_name_index(self):
+        if not self.indexing:
+            return None
+        if self.name_index is None:
+            self.name_index = NameIndex(self)
+        self.name_index.refresh()
+        return self.name_index
 
     def exists(self, path):
         return self._get_node(self.resolve_path(path)) is not None
@@ -231,8 +896,17 @@ class FileSystem:
     def read_file(self, path):
         node = self._get_node(self.resolve_path(path))
         if node and not node.is_dir:
-            node.accessed = time.time()
-            return node.content
+            if not node.shared:
+                node.accessed = time.time()
+            return decode_content(node.content)
+        return None
+
+    def read_bytes(self, path):
+        node = self._get_node(self.resolve_path(path))
+        if node and not node.is_dir:
+            if not node.shared:
+                node.accessed = time.time()
+            return memoryview(node.content).toreadonly()
         return None
 
     def write_file(self, path, content, append=False):
@@ -241,20 +915,33 @@ class FileSystem:
         if node:
             if node.is_dir:
                 return False
+            data = encode_content(content)
+            self._reserve(node.owner, len(data) if append else len(data) - node.size, 0, path)
+            chain = []
+            node = self._get_writable_node(resolved, chain)
+            old_size = node.size
             if append:
-                node.content += content
+                if not isinstance(node.content, bytearray):
+                    node.content = bytearray(node.content)
+                node.content += data
             else:
-                node.content = content
+                node.content = data
             node.modified = time.time()
-            node.size = len(node.content)
+            self._resize(node, chain, node.size - old_size)
             return True
         else:
             parts = resolved.strip('/').split('/')
             filename = parts[-1]
             dirpath = '/' + '/'.join(parts[:-1]) if len(parts) > 1 else '/'
             parent = self._get_node(dirpath)
-            if parent and parent.is_dir:
-                parent.children[filename] = FileNode(filename, is_dir=False, content=content)
+            if parent and parent.is_dir and filename not in parent.children:
+                data = encode_content(content)
+                self._reserve(self.user, len(data), 1, path)
+                chain = []
+                parent = self._get_writable_node(dirpath, chain)
+                node = self._register(FileNode(filename, data, owner=self.user, group=self.user))
+                node.generation = self.version
+                self._attach(chain, parent, filename, node)
                 return True
         return False
 
@@ -262,30 +949,52 @@ class FileSystem:
         resolved = self.resolve_path(path)
         if resolved == '/':
             return False
+        if resolved in self.virtual:
+            raise FileSystemError(errno.EBUSY, os.strerror(errno.EBUSY), path)
         parts = resolved.strip('/').split('/')
         filename = parts[-1]
         dirpath = '/' + '/'.join(parts[:-1]) if len(parts) > 1 else '/'
         parent = self._get_node(dirpath)
         if parent and parent.is_dir and filename in parent.children:
             node = parent.children[filename]
+            if self.pending:
+                self._fault(node)
             if node.is_dir and node.children and not recursive:
                 return False
+            if self.pending:
+                self._fault_tree(node)
+            chain = []
+            parent = self._get_writable_node(dirpath, chain)
             del parent.children[filename]
+            self._account(chain, -node.total_bytes, -node.total_inodes)
+            self._unlink(node, parent, filename)
+            if node.is_dir or node.is_symlink:
+                self.node_cache.clear()
+            else:
+                self.node_cache.pop(resolved, None)
+            self._record_deletion(resolved)
             return True
         return False
 
     def mkdir(self, path, parents=False):
         resolved = self.resolve_path(path)
         if parents:
-            self._mkdir_p(resolved)
-            return True
+            node = self._get_node(resolved)
+            if node is not None:
+                return node.is_dir
+            return self._mkdir_p(resolved, reserve=True) is not None
         parts = resolved.strip('/').split('/')
         dirname = parts[-1]
         parent_path = '/' + '/'.join(parts[:-1]) if len(parts) > 1 else '/'
         parent = self._get_node(parent_path)
         if parent and parent.is_dir:
             if dirname not in parent.children:
-                parent.children[dirname] = FileNode(dirname, is_dir=True)
+                self._reserve(self.user, DirNode.size, 1, path)
+                chain = []
+                parent = self._get_writable_node(parent_path, chain)
+                node = self._register(DirNode(dirname, owner=self.user, group=self.user))
+                node.generation = self.version
+                self._attach(chain, parent, dirname, node)
                 return True
         return False
 
@@ -298,12 +1007,17 @@ class FileSystem:
         return None
 
     def get_file_info(self, path):
-        node = self._get_node(self.resolve_path(path))
+        resolved = self.resolve_path(path)
+        return self.node_info(self._get_node(resolved), resolved.rpartition('/')[2] or '/')
+
+    def node_info(self, node, name=None):
         if node:
             return {
-                'name': node.name,
+                'name': name or node.name,
                 'is_dir': node.is_dir,
-                'size': node.size if not node.is_dir else 4096,
+                'is_symlink': node.is_symlink,
+                'symlink_target': node.symlink_target,
+                'size': node.size,
                 'permissions': node.permissions,
                 'owner': node.owner,
                 'group': node.group,
@@ -314,19 +1028,34 @@ class FileSystem:
         return None
 
     def chmod(self, path, mode):
-        node = self._get_node(self.resolve_path(path))
+        resolved = self.resolve_path(path)
+        node = self._get_node(resolved)
+        if node is not None and node.permissions == mode:
+            return True
+        node = self._get_writable_node(resolved)
         if node:
             node.permissions = mode
             return True
         return False
 
     def chown(self, path, owner=None, group=None):
-        node = self._get_node(self.resolve_path(path))
+        resolved = self.resolve_path(path)
+        node = self._get_node(resolved)
+        if node is not None and (not owner or owner == node.owner) and (not group or group == node.group):
+            return True
+        node = self._get_writable_node(resolved)
         if node:
             if owner:
-                node.owner = owner
+                self._set_owner(node, owner)
             if group:
-                node.group = group
+                node.group = sys.intern(group)
+            return True
+        return False
+
+    def touch(self, path):
+        node = self._get_writable_node(self.resolve_path(path))
+        if node:
+            node.modified = time.time()
             return True
         return False
 
@@ -334,20 +1063,301 @@ class FileSystem:
         src_node = self._get_node(self.resolve_path(src))
         if not src_node or src_node.is_dir:
             return False
+        dst_node = self._get_node(self.resolve_path(dst))
+        if dst_node is not None and not dst_node.is_dir:
+            self._reserve(dst_node.owner, src_node.size - dst_node.size, 0, dst)
+        else:
+            self._reserve(self.user, src_node.size, 1, dst)
+        # Content is immutable and shared by reference until either inode is
+        # rewritten, so a copy costs a new inode rather than a new buffer.
+        # Only an appended-to file owns a bytearray; freeze it before sharing.
+        if isinstance(src_node.content, bytearray):
+            src_node.content = bytes(src_node.content)
         return self.write_file(dst, src_node.content)
 
+    def _split(self, path):
+        resolved = self.resolve_path(path)
+        parts = resolved.strip('/').split('/')
+        return '/' + '/'.join(parts[:-1]) if len(parts) > 1 else '/', parts[-1]
+
+    def link(self, src, dst):
+        src_path = self.realpath(src)
+        if src_path is None or self._get_node(src_path).is_dir:
+            return False
+        dirpath, name = self._split(dst)
+        parent = self._get_node(dirpath)
+        if not parent or not parent.is_dir or name in parent.children:
+            return False
+        self._reserve(self._get_node(src_path).owner, self._get_node(src_path).size, 1, dst)
+        node = self._get_writable_node(src_path)
+        chain = []
+        parent = self._get_writable_node(dirpath, chain)
+        if node.links == 1:
+            self._add_entry(node, node.parent, node.name)
+        node.links += 1
+        self._attach(chain, parent, name, node, charge=False)
+        return True
+
+    def symlink(self, target, dst):
+        dirpath, name = self._split(dst)
+        parent = self._get_node(dirpath)
+        if not parent or not parent.is_dir or name in parent.children:
+            return False
+        self._reserve(self.user, len(target), 1, dst)
+        chain = []
+        parent = self._get_writable_node(dirpath, chain)
+        node = self._register(SymlinkNode(name, target, owner=self.user, group=self.user))
+        node.generation = self.version
+        self._attach(chain, parent, name, node)
+        return True
+
+    def readlink(self, path):
+        node = self.get_node(path, follow=False)
+        if node is None or not node.is_symlink:
+            return None
+        return node.symlink_target
+
     def move(self, src, dst):
-        if self.copy(src, dst):
-            return self.delete(src)
-        return False
+        src_dir, src_name = self._split(src)
+        src_path = self.realpath(src_dir)
+        if src_path is None or src_name == '':
+            return False
+        src_path = normalize_path(src_path, src_name)
+        if src_path in self.virtual:
+            raise FileSystemError(errno.EBUSY, os.strerror(errno.EBUSY), src)
+        node = self.get_node(src_path, follow=False)
+        if node is None:
+            return False
+        dst_path = self.resolve_path(dst)
+        target = self._get_node(dst_path)
+        if target is not None and target.is_dir:
+            dst_path = normalize_path(dst_path, src_name)
+        dst_dir, dst_name = self._split(dst_path)
+        dst_parent_path = self.realpath(dst_dir)
+        if dst_parent_path is None or not self.is_dir(dst_parent_path):
+            return False
+        if node.is_dir and (dst_parent_path == src_path or dst_parent_path.startswith(src_path.rstrip('/') + '/')):
+            return False
+        dst_path = normalize_path(dst_parent_path, dst_name)
+        if dst_path == src_path:
+            return True
+        old = self.get_node(dst_path, follow=False)
+        if old is node:
+            return True
+        if old is not None and (old.is_dir != node.is_dir or (old.is_dir and old.children)):
+            return False
+        self.node_cache.clear()
+        src_dir = src_path.rpartition('/')[0] or '/'
+        src_chain = []
+        src_parent = self._get_writable_node(src_dir, src_chain)
+        node = src_parent.children[src_name]
+        del src_parent.children[src_name]
+        self._account(src_chain, -node.total_bytes, -node.total_inodes)
+        dst_chain = []
+        dst_parent = self._get_writable_node(dst_parent_path, dst_chain)
+        if old is not None:
+            del dst_parent.children[dst_name]
+            self._account(dst_chain, -old.total_bytes, -old.total_inodes)
+            self._unlink(old, dst_parent, dst_name)
+            self._record_deletion(dst_path)
+        if node.shared:
+            node = node.clone()
+            self.inodes[node.inode] = node
+        if node.links > 1:
+            self._move_entry(node, src_parent, src_name, dst_parent, dst_name)
+        node.name = dst_name
+        dst_parent.add_child(node)
+        self._account(dst_chain, node.total_bytes, node.total_inodes)
+        self._own_tree(node)
+        self._record_deletion(src_path)
+        return True
+
+    def _move_entry(self, node, old_parent, old_name, parent, name):
+        self.hardlinks[node.inode] = [(parent, name) if entry[0] is old_parent and entry[1] == old_name else entry
+                                      for entry in self.hardlinks.get(node.inode, ())]
+
+    def _own_tree(self, node):
+        # A renamed subtree appears under new paths, so every node in it is
+        # restamped; shared base nodes are cloned first.
+        if self.pending:
+            self._fault_tree(node)
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            node.generation = self.version
+            if not node.is_dir:
+                continue
+            for name, child in list(node.children.items()):
+                if child.shared:
+                    child = child.clone()
+                    child.parent = node
+                    node.children[name] = child
+                    self.inodes[child.inode] = child
+                stack.append(child)
+
+    def _record_deletion(self, path):
+        self.journal.append((self.version, path))
+        if len(self.journal) > self.journal_limit:
+            dropped = self.journal[:len(self.journal) // 2]
+            self.journal = self.journal[len(dropped):]
+            self.journal_floor = dropped[-1][0]
+
+    def changes_since(self, version=0, epoch=None):
+        full = epoch != self.epoch or version < self.journal_floor
+        if full and self.pending:
+            return self._stored_changes()
+        since = 0 if full else version
+        changed = {}
+        deleted = []
+        base = get_base_image() if full else None
+        self._collect_changes(self.root, '/', since, base, changed, deleted if full else None)
+        if not full:
+            deleted = [path for v, path in self.journal if v > since]
+        return {
+            'epoch': self.epoch,
+            'version': self.version,
+            'next_inode': self.next_inode,
+            'full': full,
+            'changed': changed,
+            'deleted': deleted,
+        }
+
+    def _stored_changes(self):
+        self.flush()
+        changed = {}
+        deleted = []
+        for path, record in self.storage.iter_rows(self.storage_key):
+            if record is None:
+                deleted.append(path)
+            else:
+                changed[path] = record
+        return {
+            'epoch': self.epoch,
+            'version': self.version,
+            'next_inode': self.next_inode,
+            'full': True,
+            'changed': changed,
+            'deleted': deleted,
+        }
+
+    def _collect_changes(self, node, path, since, base, changed, deleted):
+        if node.generation <= since:
+            return
+        changed[path] = node.to_record()
+        if not node.is_dir:
+            return
+        base_children = base.children if base is not None and base.is_dir else {}
+        prefix = path if path != '/' else ''
+        if deleted is not None:
+            for name in base_children:
+                if name not in node.children:
+                    deleted.append(f"{prefix}/{name}")
+        for name, child in node.children.items():
+            self._collect_changes(child, f"{prefix}/{name}", since, base_children.get(name), changed, deleted)
+
+    def apply_delta(self, delta):
+        for path in delta.get('deleted', []):
+            self.delete(path, recursive=True)
+        trusted = 'next_inode' in delta
+        linked = {}
+        changed = delta.get('changed', {})
+        for path in sorted(changed, key=lambda p: p.count('/')):
+            record = changed[path]
+            inode = record.get('inode') if trusted else None
+            if record['is_dir']:
+                node = self._mkdir_p(path)
+                if node is None:
+                    continue
+                node.permissions = record.get('permissions', node.permissions)
+                self._set_owner(node, record.get('owner', node.owner))
+                node.group = sys.intern(record.get('group', node.group))
+                node.created = record.get('created', node.created)
+                node.modified = record.get('modified', node.modified)
+                if inode and node.inode != inode:
+                    self._forget_inode(node.inode)
+                    self._register(node, inode)
+                continue
+            dirpath, name = self._split(path)
+            chain = []
+            parent = self._mkdir_p(dirpath, chain)
+            if parent is None:
+                continue
+            existing = parent.children.get(name)
+            fresh = inode not in linked
+            if not fresh:
+                node = linked[inode]
+                if record.get('modified', 0) > node.modified:
+                    old_size = node.size
+                    node.content = encode_content(record.get('content', ''))
+                    node.modified = record['modified']
+                    self._resize(node, chain, node.size - old_size)
+            else:
+                node = Node.from_dict(record)
+                node.name = name
+                node.parent = parent
+                node.generation = self.version
+                self._register(node, inode)
+                if inode and node.links > 1:
+                    linked[inode] = node
+            if existing is not node:
+                self._attach(chain, parent, name, node, charge=fresh)
+        if trusted:
+            self.next_inode = max(self.next_inode, delta['next_inode'])
+        self.node_cache.clear()
+
+    def _forget_inode(self, inode):
+        if inode in self.base_inodes:
+            self.inodes[inode] = None
+        else:
+            self.inodes.pop(inode, None)
 
     def to_dict(self):
         return {'root': self.root.to_dict(), 'cwd': self.cwd, 'mounts': self.mounts}
 
     def load_from_dict(self, data):
         if 'root' in data:
-            self.root = FileNode.from_dict(data['root'])
+            self.load_root(Node.from_dict(data['root']))
         if 'cwd' in data:
             self.cwd = data['cwd']
         if 'mounts' in data:
             self.mounts = data['mounts']
+
+    def load_root(self, root):
+        self.root = root
+        self.pending.clear()
+        self.linked.clear()
+        self.node_cache.clear()
+        self._renumber(self.root)
+        self._recount(self.root)
+        self.version += 1
+        self._stamp(self.root, self.version)
+        self.journal = []
+        self.journal_floor = self.version
+
+    def _renumber(self, root):
+        self.inodes = {}
+        self.base_inodes = {}
+        self.hardlinks = {}
+        self._register(root)
+        seen = {}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for name, child in list(node.children.items()):
+                if child.links > 1 and child.inode in seen:
+                    node.children[name] = seen[child.inode]
+                    self._add_entry(seen[child.inode], node, name)
+                    continue
+                old = child.inode
+                self._register(child, self.next_inode)
+                if child.links > 1:
+                    seen[old] = child
+                    self._add_entry(child, node, name)
+                if child.is_dir:
+                    stack.append(child)
+
+    def _stamp(self, node, generation):
+        node.generation = generation
+        if node.is_dir:
+            for child in node.children.values():
+                self._stamp(child, generation)
@@ -0,0 +1,278 @@
+import re
+from functools import lru_cache
+
+CLASSES = {
+    'alpha': 'a-zA-Z',
+    'digit': '0-9',
+    'alnum': 'a-zA-Z0-9',
+    'upper': 'A-Z',
+    'lower': 'a-z',
+    'xdigit': '0-9A-Fa-f',
+    'space': ' \\t\\n\\r\\f\\v',
+    'blank': ' \\t',
+    'punct': ''.join('\\' + c for c in '!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'),
+}
+SEQUENCE = re.compile(r'(-?\d+|[a-zA-Z])\.\.(-?\d+|[a-zA-Z])(?:\.\.(-?\d+))?\Z')
+MAX_BRACE_WORDS = 65536
+
+
+def has_magic(text):
+    i = 0
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+            continue
+        if text[i] in '*?' or (text[i] == '[' and ']' in text[i + 2:]):
+            return True
+        i += 1
+    return False
+
+
+def escape(text):
+    return re.sub(r'([*?[\]\\])', r'\\\1', text)
+
+
+def unescape(text):
+    return re.sub(r'\\(.)', r'\1', text)
+
+
+def _class_item(c):
+    return c if c.isalnum() else '\\' + c
+
+
+def translate(pattern):
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            if not out or out[-1] != '.*':
+                out.append('.*')
+        elif c == '?':
+            out.append('.')
+        elif c == '[':
+            j = i
+            negate = j < n and pattern[j] in '!^'
+            if negate:
+                j += 1
+            items = []
+            first = True
+            while j < n and (pattern[j] != ']' or first):
+                first = False
+                if pattern.startswith('[:', j):
+                    end = pattern.find(':]', j + 2)
+                    if end >= 0 and pattern[j + 2:end] in CLASSES:
+                        items.append(CLASSES[pattern[j + 2:end]])
+                        j = end + 2
+                        continue
+                if pattern[j] == '\\' and j + 1 < n:
+                    items.append(_class_item(pattern[j + 1]))
+                    j += 2
+                elif j + 2 < n and pattern[j + 1] == '-' and pattern[j + 2] != ']':
+                    items.append(_class_item(pattern[j]) + '-' + _class_item(pattern[j + 2]))
+                    j += 3
+                else:
+                    items.append(_class_item(pattern[j]))
+                    j += 1
+            if j >= n:
+                out.append('\\[')
+                continue
+            out.append('[' + ('^' if negate else '') + ''.join(items) + ']')
+            i = j + 1
+        elif c == '\\' and i < n:
+            out.append(re.escape(pattern[i]))
+            i += 1
+        else:
+            out.append(re.escape(c))
+    return '(?s:' + ''.join(out) + ')\\Z'
+
+
+@lru_cache(maxsize=512)
+def compile_pattern(pattern):
+    try:
+        return re.compile(translate(pattern)).match
+    except re.error:
+        literal = unescape(pattern)
+        return lambda name: name == literal
+
+
+def _skip(items, i, opening, closing):
+    depth = 0
+    for j in range(i, len(items)):
+        if items[j] == ('lit', opening):
+            depth += 1
+        elif items[j] == ('lit', closing):
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(items)
+
+
+def _sequence(items):
+    if any(kind != 'lit' for kind, text in items):
+        return None
+    match = SEQUENCE.match(''.join(text for kind, text in items))
+    if match is None:
+        return None
+    start, end, step = match.groups()
+    step = abs(int(step)) if step and int(step) else 1
+    if start.isalpha() != end.isalpha():
+        return None
+    if start.isalpha():
+        first, last = ord(start), ord(end)
+    else:
+        first, last = int(start), int(end)
+    if abs(last - first) // step >= MAX_BRACE_WORDS:
+        return None
+    values = range(first, last + 1, step) if first <= last else range(first, last - 1, -step)
+    if start.isalpha():
+        words = [chr(value) for value in values]
+    else:
+        padded = any(len(s.lstrip('-')) > 1 and s.lstrip('-').startswith('0') for s in (start, end))
+        width = max(len(start), len(end)) if padded else 0
+        words = [f"{value:0{width}d}" for value in values]
+    return [[('lit', c) for c in word] for word in words]
+
+
+def _braces(items):
+    i = 0
+    while i < len(items):
+        item = items[i]
+        if item == ('lit', '$') and i + 1 < len(items) and items[i + 1] in (('lit', '{'), ('lit', '(')):
+            opening = items[i + 1][1]
+            i = _skip(items, i + 1, opening, '}' if opening == '{' else ')') + 1
+            continue
+        if item == ('lit', '`'):
+            i = next((j for j in range(i + 1, len(items)) if items[j] == item), len(items)) + 1
+            continue
+        if item != ('lit', '{'):
+            i += 1
+            continue
+        depth = 0
+        commas = []
+        end = None
+        for j in range(i, len(items)):
+            if items[j] == ('lit', '{'):
+                depth += 1
+            elif items[j] == ('lit', '}'):
+                depth -= 1
+                if depth == 0:
+                    end = j
+                    break
+            elif items[j] == ('lit', ',') and depth == 1:
+                commas.append(j)
+        if end is None:
+            return [items]
+        if commas:
+            bounds = [i] + commas + [end]
+            alternatives = [items[a + 1:b] for a, b in zip(bounds, bounds[1:])]
+        else:
+            alternatives = _sequence(items[i + 1:end])
+            if alternatives is None:
+                i += 1
+                continue
+        prefix, suffix = items[:i], items[end + 1:]
+        words = []
+        for alternative in alternatives:
+            words.extend(_braces(prefix + alternative + suffix))
+            if len(words) > MAX_BRACE_WORDS:
+                return [items]
+        return words
+    return [items]
+
+
+def expand_braces(word):
+    items = []
+    for kind, text in word:
+        if kind == 'lit':
+            items.extend(('lit', c) for c in text)
+        else:
+            items.append((kind, text))
+    words = []
+    for variant in _braces(items):
+        parts = []
+        for kind, text in variant:
+            if kind == 'lit' and parts and parts[-1][0] == 'lit':
+                parts[-1] = ('lit', parts[-1][1] + text)
+            else:
+                parts.append((kind, text))
+        words.append(tuple(parts))
+    return words
+
+
+class Globber:
+    def __init__(self, filesystem):
+        self.filesystem = filesystem
+        self.version = None
+        self.listings = {}
+
+    def clear(self):
+        self.version = None
+        self.listings = {}
+
+    def listing(self, path):
+        fs = self.filesystem
+        if fs.version != self.version:
+            self.listings = {}
+            self.version = fs.version
+        entries = self.listings.get(path)
+        if entries is None:
+            node = fs.get_node(path)
+            entries = list(fs.iter_dir(node)) if node is not None and node.is_dir else []
+            self.listings[path] = entries
+        return entries
+
+    def _recurse(self, display, path, everything):
+        if not everything:
+            yield display, path
+        stack = [(display, path)]
+        while stack:
+            display, path = stack.pop()
+            for name, node in self.listing(path):
+                if name.startswith('.'):
+                    continue
+                child = (_join(display, name), _join(path, name))
+                if everything or (node.is_dir and not node.is_symlink):
+                    yield child
+                if node.is_dir and not node.is_symlink:
+                    stack.append(child)
+
+    def expand(self, pattern):
+        fs = self.filesystem
+        components = [c for c in pattern.split('/') if c]
+        if not components:
+            return []
+        absolute = pattern.startswith('/')
+        matches = [('/', '/')] if absolute else [('', fs.cwd)]
+        for index, component in enumerate(components):
+            last = index == len(components) - 1
+            step = []
+            if component == '**':
+                for display, path in matches:
+                    step.extend(self._recurse(display, path, last))
+            elif not has_magic(component):
+                name = unescape(component)
+                for display, path in matches:
+                    node = fs.get_node(_join(path, name))
+                    if node is not None and (last or node.is_dir):
+                        step.append((_join(display, name), _join(path, name)))
+            else:
+                match = compile_pattern(component)
+                hidden = component.startswith('.')
+                for display, path in matches:
+                    for name, node in self.listing(path):
+                        if (hidden or not name.startswith('.')) and match(name):
+                            step.append((_join(display, name), _join(path, name)))
+            matches = step
+            if not matches:
+                return []
+        if pattern.endswith('/'):
+            return sorted(display + '/' for display, path in matches if fs.is_dir(path))
+        return sorted(display for display, path in matches)
+
+
+def _join(base, name):
+    if not base:
+        return name
+    return base + name if base.endswith('/') else base + '/' + name
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import psutil
+
+
+class HostMetrics:
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.snapshot = None
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def current(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self.start()
+        return snapshot
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                psutil.cpu_percent(interval=None)
+                self.refresh()
+                self._thread = threading.Thread(target=self._run, name='pylinux-metrics', daemon=True)
+                self._thread.start()
+        return self.snapshot
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception:
+                pass
+
+    def refresh(self):
+        mem = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        try:
+            load = psutil.getloadavg()
+        except (AttributeError, OSError):
+            load = (0.0, 0.0, 0.0)
+        try:
+            disk = psutil.disk_usage('/')
+            disk = {'total': disk.total, 'used': disk.used, 'free': disk.free, 'percent': disk.percent}
+        except OSError:
+            disk = {'total': 0, 'used': 0, 'free': 0, 'percent': 0.0}
+        freq = psutil.cpu_freq()
+        self.snapshot = {
+            'timestamp': time.time(),
+            'memory': {
+                'total': mem.total,
+                'available': mem.available,
+                'used': mem.used,
+                'free': mem.free,
+                'percent': mem.percent,
+                'buffers': getattr(mem, 'buffers', 0),
+                'cached': getattr(mem, 'cached', 0),
+                'shared': getattr(mem, 'shared', 0),
+                'active': getattr(mem, 'active', 0),
+                'inactive': getattr(mem, 'inactive', 0),
+                'swap_total': swap.total,
+                'swap_used': swap.used,
+                'swap_free': swap.free,
+                'swap_percent': swap.percent
+            },
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'cpu_count': psutil.cpu_count() or 1,
+            'cpu_freq': freq.current if freq else 2400.0,
+            'load': tuple(load),
+            'disk': disk,
+            'boot_time': psutil.boot_time(),
+        }
+        self.samples += 1
+
+
+host_metrics = HostMetrics()
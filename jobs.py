@@ -0,0 +1,313 @@
+import threading
+from contextlib import contextmanager
+from cancellation import CancelToken
+
+SIGNALS = {'HUP': 1, 'INT': 2, 'QUIT': 3, 'KILL': 9, 'TERM': 15, 'CONT': 18, 'STOP': 19, 'TSTP': 20}
+SIGNAL_STATUS = {1: 'Hangup', 2: 'Interrupt', 3: 'Quit', 9: 'Killed', 15: 'Terminated'}
+
+
+class FairLock:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+
+    def acquire(self):
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while self.serving != ticket:
+                self.condition.wait()
+
+    def release(self):
+        with self.condition:
+            self.serving += 1
+            self.condition.notify_all()
+
+    def contended(self):
+        return self.next_ticket - self.serving > 1
+
+
+class Foreground:
+    def __init__(self, lock):
+        self.lock = lock
+        self.held = False
+        self.output = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.held = True
+        return self
+
+    def __exit__(self, *exc):
+        self.held = False
+        self.lock.release()
+
+    @contextmanager
+    def idle(self):
+        if self.output is not None:
+            self.output.flush()
+        if not self.held:
+            yield
+            return
+        self.held = False
+        self.lock.release()
+        try:
+            yield
+        finally:
+            self.lock.acquire()
+            self.held = True
+
+    def preempt(self):
+        if self.output is not None:
+            self.output.poll()
+        if not self.held or not self.lock.contended():
+            return
+        self.held = False
+        self.lock.release()
+        self.lock.acquire()
+        self.held = True
+
+
+class Job:
+    def __init__(self, scheduler, number, node, text):
+        self.scheduler = scheduler
+        self.number = number
+        self.node = node
+        self.text = text
+        self.shell = None
+        self.token = None
+        self.pid = None
+        self.state = None
+        self.status = 'Running'
+        self.exit_code = None
+        self.signal = None
+        self.output = ''
+        self.foreground = False
+        self.done = threading.Event()
+        self.resume = threading.Event()
+        self.resume.set()
+
+    def swap(self):
+        system = self.scheduler.system
+        fs = system.filesystem
+        current = (system.environment, system.aliases, system.last_exit_code, fs.cwd)
+        system.environment, system.aliases, system.last_exit_code, fs.cwd = self.state
+        self.state = current
+
+    def set_process_state(self, state):
+        process = self.scheduler.system.process_manager.get_process(self.pid)
+        if process is not None:
+            process.state = state
+
+    def enter(self):
+        self.scheduler.lock.acquire()
+        self.swap()
+        self.set_process_state('R')
+
+    def leave(self):
+        self.set_process_state('T' if not self.resume.is_set() else 'S')
+        self.swap()
+        self.scheduler.lock.release()
+
+    @contextmanager
+    def idle(self):
+        self.leave()
+        try:
+            yield
+        finally:
+            self.enter()
+
+    def preempt(self):
+        if self.resume.is_set() and not self.scheduler.lock.contended():
+            return
+        self.leave()
+        try:
+            self.resume.wait()
+        finally:
+            self.enter()
+
+    def run(self):
+        output = ''
+        self.enter()
+        try:
+            output = self.shell.run_detached(self.node, self.token)
+        finally:
+            code = self.scheduler.system.last_exit_code
+            self.leave()
+            self.scheduler.finish(self, output, code)
+
+    def stop(self):
+        if not self.done.is_set() and self.resume.is_set():
+            self.resume.clear()
+            self.status = 'Stopped'
+            self.scheduler.stopped(self)
+
+    def cont(self):
+        if not self.done.is_set():
+            self.status = 'Running'
+            self.resume.set()
+
+    def kill(self, signal=15):
+        if self.done.is_set():
+            return
+        self.signal = signal
+        self.token.cancel()
+        self.resume.set()
+
+    def send(self, signal):
+        if signal in (SIGNALS['STOP'], SIGNALS['TSTP']):
+            self.stop()
+        elif signal == SIGNALS['CONT']:
+            self.cont()
+        elif signal:
+            self.kill(signal)
+
+
+class JobScheduler:
+    max_jobs = 16
+    time_limit = 600
+    status_history = 64
+
+    def __init__(self, system):
+        self.system = system
+        self.lock = FairLock()
+        self.foreground = Foreground(self.lock)
+        self.mutex = threading.Lock()
+        self.jobs = {}
+        self.order = []
+        self.statuses = {}
+        self.listener = None
+        self.pending = []
+        self.last_pid = None
+
+    def spawn(self, shell, node, text):
+        system = self.system
+        with self.mutex:
+            if len(self.jobs) >= self.max_jobs:
+                return None
+            number = max(self.jobs, default=0) + 1
+            job = Job(self, number, node, text)
+            self.jobs[number] = job
+            self.order.append(number)
+        job.shell = shell.fork(job)
+        job.token = CancelToken(self.time_limit, system.limits.get('iterations'))
+        job.token.scheduler = job
+        job.state = (dict(system.environment), dict(system.aliases), 0, system.filesystem.cwd)
+        name = text.split(None, 1)[0] if text.strip() else 'bash'
+        job.pid = system.process_manager.create_process(name, system.current_user or 'root', text, ppid=109)
+        self.last_pid = job.pid
+        system.pin()
+        threading.Thread(target=job.run, name=f'pylinux-job-{number}', daemon=True).start()
+        return job
+
+    def finish(self, job, output, code):
+        system = self.system
+        if job.signal is not None:
+            job.exit_code = 128 + job.signal
+            job.status = SIGNAL_STATUS.get(job.signal, f'Signal {job.signal}')
+        else:
+            job.exit_code = code or 0
+            job.status = 'Done' if not job.exit_code else f'Exit {job.exit_code}'
+        job.output = output
+        system.process_manager.kill_process(job.pid)
+        with self.mutex:
+            mark = self.mark(job.number)
+            self.remove(job)
+            foreground = job.foreground
+        job.done.set()
+        system.unpin()
+        if not foreground:
+            self.deliver(output + self.format(job, mark) + '\n')
+
+    def remove(self, job):
+        self.jobs.pop(job.number, None)
+        if job.number in self.order:
+            self.order.remove(job.number)
+        self.statuses[job.pid] = job.exit_code
+        while len(self.statuses) > self.status_history:
+            del self.statuses[next(iter(self.statuses))]
+
+    def deliver(self, text):
+        listener = self.listener
+        if listener is not None:
+            listener(text)
+        else:
+            with self.mutex:
+                self.pending.append(text)
+
+    def drain(self):
+        with self.mutex:
+            text = ''.join(self.pending)
+            self.pending = []
+        return text
+
+    def mark(self, number):
+        if self.order and self.order[-1] == number:
+            return '+'
+        if len(self.order) > 1 and self.order[-2] == number:
+            return '-'
+        return ' '
+
+    def format(self, job, mark, pid=False):
+        status = job.status
+        text = job.text + ' &' if status == 'Running' else job.text
+        if pid:
+            return f"[{job.number}]{mark} {job.pid} {status:<24}{text}"
+        return f"[{job.number}]{mark}  {status:<24}{text}"
+
+    def listing(self):
+        with self.mutex:
+            return [(self.jobs[number], self.mark(number)) for number in sorted(self.jobs)]
+
+    def find(self, spec):
+        with self.mutex:
+            if spec in ('%', '%%', '%+', ''):
+                number = self.order[-1] if self.order else None
+            elif spec == '%-':
+                number = self.order[-2] if len(self.order) > 1 else None
+            elif spec.startswith('%') and spec[1:].isdigit():
+                number = int(spec[1:])
+            elif spec.startswith('%'):
+                matches = [n for n in self.order if self.jobs[n].text.startswith(spec[1:])]
+                number = matches[-1] if matches else None
+            else:
+                number = None
+            return self.jobs.get(number)
+
+    def by_pid(self, pid):
+        with self.mutex:
+            for job in self.jobs.values():
+                if job.pid == pid:
+                    return job
+        return None
+
+    def claim(self, job):
+        with self.mutex:
+            if job.number not in self.jobs:
+                return False
+            job.foreground = True
+            self.order.remove(job.number)
+            self.order.append(job.number)
+            return True
+
+    def release(self, job):
+        with self.mutex:
+            if job.number in self.jobs:
+                job.foreground = False
+                return True
+        return False
+
+    def stopped(self, job):
+        with self.mutex:
+            if job.number not in self.order:
+                return
+            self.order.remove(job.number)
+            self.order.append(job.number)
+            foreground = job.foreground
+        if not foreground:
+            self.deliver(self.format(job, '+') + '\n')
+
+    def kill_all(self, signal=9):
+        for job, mark in self.listing():
+            job.kill(signal)
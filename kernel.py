@@ -1,7 +1,7 @@
 import time
 import platform
 import random
-import psutil
+from host_metrics import host_metrics
 
 
 class Kernel:
@@ -27,7 +27,8 @@ class Kernel:
         time.sleep(0.1)
         callback("OK\n")
         callback(f"Detected CPU: {platform.processor() or 'x86_64'}\n")
-        callback(f"Memory Test: {psutil.virtual_memory().total // (1024*1024)} MB OK\n")
+        metrics = host_metrics.current()
+        callback(f"Memory Test: {metrics['memory']['total'] // (1024*1024)} MB OK\n")
         callback("\n")
         
         callback("Loading GRUB 2.06...\n")
@@ -42,11 +43,11 @@ class Kernel:
         callback(self.log(t, "INFO", "kernel", f"Command line: BOOT_IMAGE=/boot/vmlinuz-{self.release} root=/dev/sda1 ro quiet"))
         t += 0.000156
         
-        mem_total = psutil.virtual_memory().total
+        mem_total = metrics['memory']['total']
         callback(self.log(t, "INFO", "kernel", f"Memory: {mem_total // 1024}K available"))
         t += 0.001234
         
-        cpu_count = psutil.cpu_count() or 1
+        cpu_count = metrics['cpu_count']
         callback(self.log(t, "INFO", "kernel", f"smpboot: Allowing {cpu_count} CPUs"))
         t += 0.002341
         
@@ -105,18 +106,15 @@ class Kernel:
         callback("\n")
         
         self.system.current_user = 'root'
+        self.system.filesystem.user = 'root'
         
         callback("Welcome to PyLinux 6.1.0!\n")
         callback(f"  System information as of {time.strftime('%a %b %d %H:%M:%S %Z %Y')}\n")
         callback("\n")
         
-        try:
-            load = psutil.getloadavg()
-            callback(f"  System load:  {load[0]:.2f}\n")
-        except:
-            callback(f"  System load:  0.00\n")
-        
-        callback(f"  Memory usage: {psutil.virtual_memory().percent:.0f}%\n")
+        metrics = host_metrics.current()
+        callback(f"  System load:  {metrics['load'][0]:.2f}\n")
+        callback(f"  Memory usage: {metrics['memory']['percent']:.0f}%\n")
         callback(f"  Processes:    {self.system.process_manager.get_count()}\n")
         callback("\n")
 
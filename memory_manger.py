@@ -1,4 +1,4 @@
-import psutil
+from host_metrics import host_metrics
 
 
 class MemoryManager:
@@ -7,24 +7,7 @@ class MemoryManager:
         self.page_size = 4096
 
     def get_stats(self):
-        mem = psutil.virtual_memory()
-        swap = psutil.swap_memory()
-        return {
-            'total': mem.total,
-            'available': mem.available,
-            'used': mem.used,
-            'free': mem.free,
-            'percent': mem.percent,
-            'buffers': getattr(mem, 'buffers', 0),
-            'cached': getattr(mem, 'cached', 0),
-            'shared': getattr(mem, 'shared', 0),
-            'active': getattr(mem, 'active', 0),
-            'inactive': getattr(mem, 'inactive', 0),
-            'swap_total': swap.total,
-            'swap_used': swap.used,
-            'swap_free': swap.free,
-            'swap_percent': swap.percent
-        }
+        return host_metrics.current()['memory']
 
     def format_free_output(self, human_readable=True):
         stats = self.get_stats()
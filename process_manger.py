@@ -1,7 +1,7 @@
 import time
 import random
 import threading
-import psutil
+from host_metrics import host_metrics
 
 
 class Process:
@@ -114,11 +114,9 @@ class ProcessManager:
 
     def format_top_output(self):
         output = []
-        try:
-            load = psutil.getloadavg()
-            load_str = f"{load[0]:.2f}, {load[1]:.2f}, {load[2]:.2f}"
-        except:
-            load_str = "0.00, 0.00, 0.00"
+        metrics = host_metrics.current()
+        load = metrics['load']
+        load_str = f"{load[0]:.2f}, {load[1]:.2f}, {load[2]:.2f}"
         
         output.append(f"top - {time.strftime('%H:%M:%S')} up 0:00,  1 user,  load average: {load_str}")
         total = len(self.processes)
@@ -126,14 +124,10 @@ class ProcessManager:
         sleeping = len([p for p in self.processes.values() if p.state == 'S'])
         output.append(f"Tasks: {total:>3} total, {running:>3} running, {sleeping:>3} sleeping")
         
-        try:
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            mem = psutil.virtual_memory()
-            output.append(f"%Cpu(s): {cpu_percent:>5.1f} us,  0.0 sy,  0.0 ni, {100-cpu_percent:>5.1f} id")
-            output.append(f"MiB Mem : {mem.total/1024/1024:>9.1f} total, {mem.free/1024/1024:>9.1f} free, {mem.used/1024/1024:>9.1f} used")
-        except:
-            output.append("%Cpu(s):  0.0 us,  0.0 sy,  0.0 ni, 100.0 id")
-            output.append("MiB Mem :   1024.0 total,   512.0 free,   512.0 used")
+        cpu_percent = metrics['cpu_percent']
+        mem = metrics['memory']
+        output.append(f"%Cpu(s): {cpu_percent:>5.1f} us,  0.0 sy,  0.0 ni, {100-cpu_percent:>5.1f} id")
+        output.append(f"MiB Mem : {mem['total']/1024/1024:>9.1f} total, {mem['free']/1024/1024:>9.1f} free, {mem['used']/1024/1024:>9.1f} used")
         
         output.append("")
         output.append(f"{'PID':>7} {'USER':<9} {'PR':>3} {'NI':>3} {'VIRT':>10} {'RES':>8} {'S':>1} {'%CPU':>5} {'%MEM':>5} COMMAND")
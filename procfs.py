@@ -0,0 +1,239 @@
+import time
+
+from filesystem import DirNode, Node
+from host_metrics import host_metrics
+
+
+class VirtualFile(Node):
+    __slots__ = ('provider', 'key')
+
+    def __init__(self, name, provider, key, permissions=0o444):
+        super().__init__(name, permissions, 'root', 'root', provider.mounted)
+        self.provider = provider
+        self.key = key
+        self.inode = provider.inode(key)
+
+    @property
+    def content(self):
+        return self.provider.read(self.key)
+
+    @property
+    def size(self):
+        return 0
+
+
+class VirtualDir(DirNode):
+    __slots__ = ('provider', 'key', 'entries')
+
+    def __init__(self, name, provider, key, entries):
+        Node.__init__(self, name, 0o555, 'root', 'root', provider.mounted)
+        self.provider = provider
+        self.key = key
+        self.entries = entries
+        self.inode = provider.inode(key)
+        self.total_bytes = self.size
+        self.total_inodes = 1
+
+    @property
+    def children(self):
+        entries = self.entries() if isinstance(self.entries, Generated) else self.entries
+        prefix = self.key + '/' if self.key else ''
+        return {name: self.provider.node(name, prefix + name, entry) for name, entry in entries.items()}
+
+
+class Generated:
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self):
+        return self.func()
+
+
+class Cached:
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self):
+        return self.func()
+
+
+class VirtualFS:
+    inode_base = 4026531840
+
+    def __init__(self, entries, ttl=1.0):
+        self.entries = entries
+        self.ttl = ttl
+        self.mounted = time.time()
+        self.cache = {}
+        self.inodes = {}
+        self.next_inode = self.inode_base
+
+    def inode(self, key):
+        inodes = self.inodes.setdefault(key.partition('/')[0], {})
+        number = inodes.get(key)
+        if number is None:
+            number = inodes[key] = self.next_inode
+            self.next_inode += 1
+        return number
+
+    def retain(self, names):
+        for name in [name for name in self.inodes if name and name not in names]:
+            del self.inodes[name]
+
+    def node(self, name, key, entry):
+        if isinstance(entry, (dict, Generated)):
+            return VirtualDir(name, self, key, entry)
+        return VirtualFile(name, self, key)
+
+    def lookup(self, rel):
+        entry = self.entries
+        for part in rel.split('/') if rel else ():
+            if not isinstance(entry, (dict, Generated)):
+                return None
+            if isinstance(entry, Generated):
+                entry = entry()
+            entry = entry.get(part)
+            if entry is None:
+                return None
+        return self.node(rel.rsplit('/', 1)[-1], rel, entry)
+
+    def read(self, key):
+        now = time.monotonic()
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        entry = self.entries
+        for part in key.split('/'):
+            entry = entry() if isinstance(entry, Generated) else entry
+            entry = entry.get(part) if isinstance(entry, dict) else None
+            if entry is None:
+                return b''
+        data = entry().encode('utf-8')
+        if isinstance(entry, Cached):
+            self.cache[key] = (now + self.ttl, data)
+        return data
+
+
+def proc_fs(system, ttl=1.0):
+    kernel = system.kernel
+    processes = system.process_manager
+
+    def cpuinfo():
+        metrics = host_metrics.current()
+        return ''.join(f"processor\t: {i}\nmodel name\t: Virtual CPU\ncpu MHz\t\t: {metrics['cpu_freq']:.3f}\n\n"
+                       for i in range(metrics['cpu_count']))
+
+    def meminfo():
+        return system.memory_manager.get_meminfo() + '\n'
+
+    def loadavg():
+        load = host_metrics.current()['load']
+        return (f"{load[0]:.2f} {load[1]:.2f} {load[2]:.2f} "
+                f"{processes.get_running_count()}/{processes.get_count()} {processes.get_last_pid()}\n")
+
+    def uptime():
+        up = system.get_uptime()
+        return f"{up:.2f} {up * host_metrics.current()['cpu_count'] * 0.9:.2f}\n"
+
+    def mounts():
+        lines = [f"{m['device']} {path} {m['fstype']} {m['options']} 0 0" for path, m in system.filesystem.mounts.items()]
+        lines += ['proc /proc proc rw,nosuid,nodev,noexec,relatime 0 0',
+                  'sysfs /sys sysfs rw,nosuid,nodev,noexec,relatime 0 0']
+        return '\n'.join(lines) + '\n'
+
+    def modules():
+        return ''.join(f"{name} 16384 0 - Live 0x0000000000000000\n" for name in kernel.modules)
+
+    def status(pid):
+        proc = processes.get_process(pid)
+        if proc is None:
+            return ''
+        states = {'R': 'R (running)', 'S': 'S (sleeping)', 'D': 'D (disk sleep)', 'Z': 'Z (zombie)', 'T': 'T (stopped)'}
+        uid = 0 if proc.user == 'root' else system.user_manager.users.get(proc.user, {}).get('uid', 1000)
+        return (f"Name:\t{proc.name[:15]}\nUmask:\t0022\nState:\t{states.get(proc.state, proc.state)}\n"
+                f"Tgid:\t{proc.pid}\nPid:\t{proc.pid}\nPPid:\t{proc.ppid}\n"
+                f"Uid:\t{uid}\t{uid}\t{uid}\t{uid}\nGid:\t{uid}\t{uid}\t{uid}\t{uid}\n"
+                f"VmSize:\t{proc.virtual_mem:>8} kB\nVmRSS:\t{proc.resident_mem:>8} kB\n"
+                f"RssShmem:\t{proc.shared_mem:>8} kB\nThreads:\t{proc.threads}\n")
+
+    def cmdline(pid):
+        proc = processes.get_process(pid)
+        if proc is None or proc.command.startswith('['):
+            return ''
+        return '\0'.join(proc.command.split()) + '\0'
+
+    def comm(pid):
+        proc = processes.get_process(pid)
+        return f"{proc.name[:15]}\n" if proc is not None else ''
+
+    def process_dir(pid):
+        return {
+            'status': lambda: status(pid),
+            'cmdline': lambda: cmdline(pid),
+            'comm': lambda: comm(pid),
+        }
+
+    static = {
+        'version': lambda: f"Linux version {kernel.release} (pylinux@build) #1 SMP PREEMPT_DYNAMIC {kernel.version}\n",
+        'cpuinfo': Cached(cpuinfo),
+        'meminfo': Cached(meminfo),
+        'loadavg': loadavg,
+        'uptime': uptime,
+        'mounts': mounts,
+        'modules': modules,
+        'cmdline': lambda: f"BOOT_IMAGE=/boot/vmlinuz-{kernel.release} root=/dev/sda1 ro quiet\n",
+        'filesystems': lambda: 'nodev\tsysfs\nnodev\tproc\nnodev\ttmpfs\n\text4\n',
+        'sys': {
+            'kernel': {
+                'hostname': lambda: f"{system.hostname}\n",
+                'ostype': lambda: f"{kernel.sysname}\n",
+                'osrelease': lambda: f"{kernel.release}\n",
+                'pid_max': lambda: '4194304\n',
+            },
+        },
+    }
+
+    def root():
+        entries = dict(static)
+        for pid in list(processes.processes):
+            entries[str(pid)] = process_dir(pid)
+        shell = processes.get_processes_by_name('bash')
+        if shell:
+            entries['self'] = process_dir(shell[-1].pid)
+        provider.retain(entries)
+        return entries
+
+    provider = VirtualFS(Generated(root), ttl)
+    return provider
+
+
+def sys_fs(system, ttl=1.0):
+    def net():
+        return {name: {
+            'address': lambda iface=iface: f"{iface.get('mac', '00:00:00:00:00:00')}\n",
+            'mtu': lambda iface=iface: f"{iface.get('mtu', 1500)}\n",
+            'operstate': lambda iface=iface: f"{iface.get('state', 'up').lower()}\n",
+        } for name, iface in system.network_manager.interfaces.items()}
+
+    def cpu_online():
+        count = host_metrics.current()['cpu_count']
+        return f"0-{count - 1}\n" if count > 1 else "0\n"
+
+    return VirtualFS({
+        'block': {
+            'sda': {
+                'size': lambda: f"{system.filesystem.capacity // 512}\n",
+                'ro': lambda: '0\n',
+            },
+        },
+        'class': {
+            'net': Generated(net),
+        },
+        'devices': {
+            'system': {
+                'cpu': {
+                    'online': cpu_online,
+                },
+            },
+        },
+    }, ttl)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from snapshot import MAGIC, dump_session, load_session
+
+
+class SessionManager:
+    def __init__(self, factory, restore, max_sessions=200, idle_timeout=900,
+                 storage_dir=None, hibernate_ttl=7 * 24 * 3600):
+        self.factory = factory
+        self.restore = restore
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.hibernate_ttl = hibernate_ttl
+        self.storage_dir = storage_dir or os.path.join(tempfile.gettempdir(), 'pylinux-sessions')
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self.resident = OrderedDict()
+        self.last_access = {}
+        self.lock = threading.RLock()
+        self.evictions = 0
+        self.hibernations = 0
+        self.rehydrations = 0
+        self._reaper = None
+
+    def _snapshot_path(self, session_id):
+        digest = hashlib.sha1(session_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.storage_dir, f"{digest}.snap")
+
+    def get(self, session_id, pin=False):
+        with self.lock:
+            system = self.resident.get(session_id)
+            if system is None:
+                system = self._rehydrate(session_id)
+                if system is None:
+                    system = self.factory(session_id)
+                self.resident[session_id] = system
+            self.resident.move_to_end(session_id)
+            self.last_access[session_id] = time.time()
+            if pin:
+                system.pin()
+            self._enforce_limit()
+            return system
+
+    def _rehydrate(self, session_id):
+        path = self._snapshot_path(session_id)
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) == MAGIC:
+                    f.seek(0)
+                    data = load_session(f)
+                else:
+                    f.seek(0)
+                    data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except (OSError, ValueError, zlib.error):
+            return None
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self.rehydrations += 1
+        return self.restore(data)
+
+    def _can_evict(self, system):
+        return not system.busy and system.state in ('running', 'off')
+
+    def _evict(self, session_id):
+        system = self.resident.pop(session_id)
+        self.last_access.pop(session_id, None)
+        self.evictions += 1
+        if system.boot_time is None:
+            return
+        state = system.snapshot()
+        path = self._snapshot_path(session_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            dump_session(state, f)
+        os.replace(tmp_path, path)
+        self.hibernations += 1
+
+    def _enforce_limit(self):
+        if len(self.resident) <= self.max_sessions:
+            return
+        for session_id in list(self.resident.keys())[:-1]:
+            if len(self.resident) <= self.max_sessions:
+                break
+            if self._can_evict(self.resident[session_id]):
+                self._evict(session_id)
+
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        with self.lock:
+            for session_id in list(self.resident.keys()):
+                if self.last_access.get(session_id, 0) >= cutoff:
+                    break
+                if self._can_evict(self.resident[session_id]):
+                    self._evict(session_id)
+        self._expire_snapshots()
+
+    def _expire_snapshots(self):
+        cutoff = time.time() - self.hibernate_ttl
+        for name in os.listdir(self.storage_dir):
+            path = os.path.join(self.storage_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def hibernated_count(self):
+        return len([n for n in os.listdir(self.storage_dir) if n.endswith('.snap')])
+
+    def start_reaper(self, interval=60):
+        if self._reaper is not None:
+            return
+
+        def reap():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.evict_idle()
+                except Exception:
+                    pass
+
+        self._reaper = threading.Thread(target=reap, daemon=True)
+        self._reaper.start()
+
+    def get_stats(self):
+        with self.lock:
+            resident = len(self.resident)
+            busy = len([s for s in self.resident.values() if s.busy])
+        return {
+            'resident': resident,
+            'busy': busy,
+            'hibernated': self.hibernated_count(),
+            'max_sessions': self.max_sessions,
+            'idle_timeout': self.idle_timeout,
+            'evictions': self.evictions,
+            'hibernations': self.hibernations,
+            'rehydrations': self.rehydrations,
+        }
@@ -1,189 +1,851 @@
 import shlex
 import re
-import os
-import fnmatch
+import random
+from collections import OrderedDict
+from arithmetic import ExpressionError, evaluate
+from cancellation import CancelToken, CommandCancelled
 from commands import CommandExecutor
+from completion import Completer
+from filesystem import FileSystemError
+from globbing import Globber, compile_pattern, escape, expand_braces, has_magic
+from shell_parser import ParseError, find_closing, parse, parse_script, unparse, word_literal
+
+PARAMETER_RE = re.compile(r'\$\{([^}]+)\}|\$([A-Za-z_][A-Za-z0-9_]*|[0-9?$#@*!])')
+OPERATOR_RE = re.compile(r'([A-Za-z_][A-Za-z0-9_]*|[0-9]+|[?$#@*!])(:?[-=+])(.*)\Z', re.S)
+LITERAL_SPECIAL_RE = re.compile(r'[$`*?[{~\\]')
+COMPOUND_KINDS = ('group', 'if', 'for', 'while', 'case')
+SHELLS = ('bash', 'sh', 'dash')
+
+
+def input_lines(text):
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return iter(lines)
+
+
+def writes_output(redirects):
+    return any(redirect.op != '<' for redirect in redirects)
+
+
+def shebang(source):
+    if not source.startswith('#!'):
+        return None
+    words = source[2:].split('\n', 1)[0].split()
+    if words and words[0].rpartition('/')[2] == 'env':
+        words = words[1:]
+    return words or None
 
 
 class Shell:
+    max_depth = 32
+    max_function_depth = 64
+    script_cache_size = 64
+
     def __init__(self, system):
         self.system = system
-        self.executor = CommandExecutor(system)
+        self.executor = CommandExecutor(system, self)
+        self.globber = Globber(system.filesystem)
+        self.completer = Completer(system, self.executor)
         self.interrupted = False
-        self.pipe_buffer = None
+        self.depth = 0
+        self.job = None
+        self.functions = {}
+        self.positional = []
+        self.script_name = 'bash'
+        self.frames = []
+        self.loop_depth = 0
+        self.script_depth = 0
+        self.control = None
+        self.input = None
+        self.previous_status = 0
+        self.scripts = OrderedDict()
+        self.stdout = None
+        self.terminal = None
+        self.diagnostics = []
 
-    def execute(self, command_line):
-        if not command_line.strip():
-            return ''
-        
-        self.interrupted = False
+    def execute(self, command_line, stdout=None):
         command_line = command_line.strip()
+        if not command_line:
+            return ''
+        if self.depth >= self.max_depth:
+            self.system.last_exit_code = 1
+            return f"-bash: maximum nesting level exceeded ({self.max_depth})\n"
         
-        for alias, expansion in self.system.aliases.items():
-            if command_line == alias or command_line.startswith(alias + ' '):
-                command_line = expansion + command_line[len(alias):]
+        if self.depth == 0:
+            self.interrupted = False
+            limits = self.system.limits
+            self.executor.token = CancelToken(limits.get('time'), limits.get('iterations'))
+            self.executor.token.scheduler = self.system.jobs.foreground
+            self.globber.clear()
+            self.control = None
+            self.stdout = self.terminal = self.system.jobs.foreground.output = stdout
+            if stdout is not None:
+                stdout.token = self.executor.token
+        self.depth += 1
+        try:
+            output = self.run_line(command_line)
+        except RecursionError:
+            if self.depth > 1:
+                raise
+            output = self.recursion_error()
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.stdout = self.terminal = self.system.jobs.foreground.output = None
+        if self.depth == 0:
+            output += self.drain_diagnostics()
+        return output
+
+    def report(self, message):
+        if self.terminal is not None:
+            self.terminal.write(message)
+        else:
+            self.diagnostics.append(message)
+
+    def drain_diagnostics(self):
+        text = ''.join(self.diagnostics)
+        self.diagnostics = []
+        return text
+
+    def stopped(self):
+        return self.interrupted or self.executor.token.expired()
+
+    def halted(self, name=None):
+        if not self.stopped():
+            return False
+        if not self.interrupted:
+            try:
+                self.executor.token.check(0)
+            except CommandCancelled as e:
+                self.executor._cancelled(name, e)
+        return True
+
+    def fork(self, job):
+        shell = Shell(self.system)
+        shell.job = job
+        shell.functions = dict(self.functions)
+        shell.positional = list(self.positional)
+        shell.script_name = self.script_name
+        shell.executor.max_sleep = None
+        return shell
+
+    def run_detached(self, node, token):
+        self.executor.token = token
+        self.depth += 1
+        try:
+            output = self.run(node)
+        except RecursionError:
+            output = self.recursion_error()
+        finally:
+            self.depth -= 1
+        return output + self.drain_diagnostics()
+
+    def recursion_error(self):
+        self.control = None
+        self.system.last_exit_code = 1
+        return "-bash: maximum recursion depth exceeded\n"
+
+    def run_background(self, node):
+        job = self.system.jobs.spawn(self, node, unparse(node))
+        if job is None:
+            self.system.last_exit_code = 1
+            return "-bash: fork: retry: Resource temporarily unavailable\n"
+        self.system.last_exit_code = 0
+        if self.job is not None or self.script_depth:
+            return ''
+        return f"[{job.number}] {job.pid}\n"
+
+    def run_line(self, command_line):
+        try:
+            tree = parse(command_line)
+        except ParseError as e:
+            self.system.last_exit_code = 2
+            return f"-bash: {e}\n"
+        return self.run(tree)
+
+    def run(self, node):
+        try:
+            if node.kind in COMPOUND_KINDS and node.redirects:
+                return self.emit(self.run_redirected(node))
+            return self.emit(getattr(self, 'run_' + node.kind)(node))
+        except ExpressionError as e:
+            self.system.last_exit_code = 1
+            self.report(f"-bash: {e}\n")
+            return ''
+
+    def emit(self, output):
+        if output and self.stdout is not None:
+            self.stdout.write(output)
+            return ''
+        return output
+
+    def capture(self, runner, *args):
+        saved = self.stdout
+        self.stdout = None
+        try:
+            return runner(*args)
+        finally:
+            self.stdout = saved
+
+    def run_redirected(self, node):
+        stdin_content, error = self.read_input_redirects(node.redirects)
+        if error is not None:
+            self.system.last_exit_code = 1
+            return error
+        runner = getattr(self, 'run_' + node.kind)
+        if writes_output(node.redirects):
+            output = self.capture(self.run_with_input, runner, node, stdin_content)
+        else:
+            output = self.run_with_input(runner, node, stdin_content)
+        return self.apply_output_redirects(node.redirects, output)
+
+    def run_with_input(self, runner, node, stdin_content):
+        if stdin_content is None:
+            return runner(node)
+        saved = self.input
+        self.input = input_lines(stdin_content)
+        try:
+            return runner(node)
+        finally:
+            self.input = saved
+
+    def run_list(self, node):
+        output = []
+        for and_or, background in node.items:
+            output.append(self.emit(self.run_background(and_or)) if background else self.run(and_or))
+            if self.control is not None or self.halted():
                 break
+        return ''.join(output)
+
+    def run_and_or(self, node):
+        output = [self.run(node.first)]
+        for op, pipeline in node.rest:
+            if self.control is not None or self.halted():
+                break
+            if (op == '&&') == (self.system.last_exit_code == 0):
+                output.append(self.run(pipeline))
+        return ''.join(output)
+
+    def run_pipeline(self, node):
+        if len(node.commands) == 1:
+            output = self.run(node.commands[0])
+        else:
+            output = self.execute_pipeline(node.commands)
+        if node.negated:
+            self.system.last_exit_code = 0 if self.system.last_exit_code else 1
+        return output
+
+    def run_subshell(self, node):
+        fs = self.system.filesystem
+        saved = (fs.cwd, dict(self.system.environment), dict(self.system.aliases))
+        try:
+            output = self.capture(self.run, node.body) if writes_output(node.redirects) else self.run(node.body)
+        finally:
+            fs.cwd, self.system.environment, self.system.aliases = saved
+        return self.apply_output_redirects(node.redirects, output)
+
+    def run_group(self, node):
+        return self.run(node.body)
+
+    def run_if(self, node):
+        output = []
+        for condition, body in node.branches:
+            output.append(self.run(condition))
+            if self.control is not None or self.halted():
+                return ''.join(output)
+            if self.system.last_exit_code == 0:
+                output.append(self.run(body))
+                return ''.join(output)
+        if node.otherwise is not None:
+            output.append(self.run(node.otherwise))
+        else:
+            self.system.last_exit_code = 0
+        return ''.join(output)
+
+    def run_case(self, node):
+        word = ''.join(self.expand_word(node.word, split=False))
+        self.system.last_exit_code = 0
+        for patterns, body in node.items:
+            if any(compile_pattern(self.expand_pattern(pattern))(word) for pattern in patterns):
+                return self.run(body)
+        return ''
+
+    def run_for(self, node):
+        if node.words is None:
+            values = list(self.positional)
+        else:
+            values = [field for word in node.words for field in self.expand_word(word)]
+        return self.run_loop(node, 'for', iter(values))
+
+    def run_while(self, node):
+        return self.run_loop(node, 'until' if node.until else 'while', None)
+
+    def run_loop(self, node, keyword, values):
+        output = []
+        status = 0
+        self.loop_depth += 1
+        try:
+            while True:
+                try:
+                    self.executor.tick()
+                except CommandCancelled as e:
+                    output.append(self.executor._cancelled(keyword, e))
+                    return ''.join(output)
+                if values is not None:
+                    value = next(values, None)
+                    if value is None:
+                        break
+                    self.system.environment[node.name] = value
+                else:
+                    output.append(self.run(node.condition))
+                    if self.loop_control(keyword):
+                        return ''.join(output)
+                    if (self.system.last_exit_code == 0) == node.until:
+                        break
+                output.append(self.run(node.body))
+                status = self.system.last_exit_code
+                if self.loop_control(keyword):
+                    if self.control is not None or self.stopped():
+                        return ''.join(output)
+                    status = 0
+                    break
+        finally:
+            self.loop_depth -= 1
+        self.system.last_exit_code = status
+        return ''.join(output)
+
+    def loop_control(self, name):
+        if self.halted(name):
+            return True
+        if self.control is None:
+            return False
+        keyword, count = self.control
+        if keyword not in ('break', 'continue'):
+            return True
+        if count > 1:
+            self.control = (keyword, count - 1)
+            return True
+        self.control = None
+        return keyword == 'break'
+
+    def run_function(self, node):
+        self.functions[node.name] = node.body
+        self.system.last_exit_code = 0
+        return ''
+
+    def call_function(self, name, args, stdin_content=None):
+        if len(self.frames) >= self.max_function_depth:
+            self.system.last_exit_code = 1
+            return f"-bash: {name}: maximum function nesting level exceeded ({self.max_function_depth})\n"
+        saved = self.positional
+        self.positional = list(args)
+        self.frames.append({})
+        try:
+            output = self.run_with_input(self.run, self.functions[name], stdin_content)
+        finally:
+            self.positional = saved
+            self.pop_assignments(self.frames.pop())
+        if self.control is not None and self.control[0] == 'return':
+            self.control = None
+        return output
+
+    def compile_script(self, path, interpreted=True):
+        fs = self.system.filesystem
+        real = fs.realpath(path)
+        node = fs.get_node(real)
+        if node is None or node.is_dir:
+            return None
+        stamp = (node.modified, node.size)
+        cached = self.scripts.get(real)
+        if cached is not None and cached[0] == stamp:
+            self.scripts.move_to_end(real)
+        else:
+            cached = [stamp, shebang(fs.read_file(real)), None]
+            self.scripts[real] = cached
+            if len(self.scripts) > self.script_cache_size:
+                self.scripts.popitem(last=False)
+        interpreter = cached[1]
+        if interpreted and interpreter is not None and interpreter[0].rpartition('/')[2] not in SHELLS:
+            return interpreter, None
+        if cached[2] is None:
+            cached[2] = parse_script(fs.read_file(real))
+        return interpreter, cached[2]
+
+    def run_file(self, path, args, stdin_content=None):
+        node = self.system.filesystem.get_node(path)
+        if node is None:
+            self.system.last_exit_code = 127
+            return f"-bash: {path}: No such file or directory\n"
+        if node.is_dir or not node.permissions & 0o111:
+            self.system.last_exit_code = 126
+            return f"-bash: {path}: {'Is a directory' if node.is_dir else 'Permission denied'}\n"
+        return self.run_script(path, args, stdin_content)
+
+    def run_script(self, path, args, stdin_content=None, interpreted=True):
+        try:
+            compiled = self.compile_script(path, interpreted)
+        except ParseError as e:
+            self.system.last_exit_code = 2
+            return f"{path}: {e}\n"
+        if compiled is None:
+            self.system.last_exit_code = 127
+            return f"{path}: No such file or directory\n"
+        interpreter, tree = compiled
+        if tree is None:
+            name = interpreter[0].rpartition('/')[2]
+            if not self.system.filesystem.exists(interpreter[0]) and not self.executor.get_spec(name):
+                self.system.last_exit_code = 126
+                return f"-bash: {path}: {interpreter[0]}: bad interpreter: No such file or directory\n"
+            return self.executor.execute(name, interpreter[1:] + [path] + list(args), stdin=stdin_content)
+        return self.run_program(tree, path, args, stdin_content)
+
+    def run_string(self, source, name, args, stdin_content=None):
+        try:
+            tree = parse(source)
+        except ParseError as e:
+            self.system.last_exit_code = 2
+            return f"{name}: -c: {e}\n"
+        return self.run_program(tree, name, args, stdin_content)
+
+    def run_program(self, tree, name, args, stdin_content=None):
+        fs = self.system.filesystem
+        saved = (fs.cwd, dict(self.system.environment), dict(self.system.aliases), dict(self.functions),
+                 self.positional, self.script_name, self.loop_depth)
+        self.positional = list(args)
+        self.script_name = name
+        self.loop_depth = 0
+        self.script_depth += 1
+        try:
+            output = self.run_with_input(self.run, tree, stdin_content)
+        finally:
+            self.script_depth -= 1
+            (fs.cwd, self.system.environment, self.system.aliases, self.functions,
+             self.positional, self.script_name, self.loop_depth) = saved
+            self.control = None
+        return output
+
+    def source(self, path, args):
+        try:
+            compiled = self.compile_script(path, interpreted=False)
+        except ParseError as e:
+            self.system.last_exit_code = 2
+            return f"-bash: {path}: {e}\n"
+        if compiled is None:
+            self.system.last_exit_code = 1
+            return f"-bash: {path}: No such file or directory\n"
+        saved = (self.positional, self.loop_depth)
+        if args:
+            self.positional = list(args)
+        self.loop_depth = 0
+        self.script_depth += 1
+        try:
+            output = self.run(compiled[1])
+        finally:
+            self.script_depth -= 1
+            if args:
+                self.positional = saved[0]
+            self.loop_depth = saved[1]
+            self.control = None
+        return output
+
+    def run_simple(self, node):
+        resolved = self.resolve_simple(node)
+        if self.stdout is not None and writes_output(resolved[1]):
+            return self.capture(self.run_resolved, *resolved)
+        return self.run_resolved(*resolved)
+
+    def run_resolved(self, args, redirects, assignments, line):
+        if line is not None:
+            return self.apply_output_redirects(redirects, self.run_line(line))
         
-        command_line = self.expand_variables(command_line)
-        
-        if '|' in command_line:
-            return self.execute_pipeline(command_line)
-        
-        redirect_out = None
-        redirect_in = None
-        append_mode = False
-        
-        if '>>' in command_line:
-            parts = command_line.split('>>')
-            command_line = parts[0].strip()
-            redirect_out = parts[1].strip()
-            append_mode = True
-        elif '>' in command_line:
-            parts = command_line.split('>')
-            command_line = parts[0].strip()
-            redirect_out = parts[1].strip()
-        
-        if '<' in command_line:
-            parts = command_line.split('<')
-            command_line = parts[0].strip()
-            redirect_in = parts[1].strip()
+        if not args:
+            self.system.environment.update(assignments)
+            self.system.last_exit_code = 0
+            return self.apply_output_redirects(redirects, '')
         
-        background = False
-        if command_line.endswith('&'):
-            background = True
-            command_line = command_line[:-1].strip()
+        stdin_content, error = self.read_input_redirects(redirects)
+        if error is not None:
+            self.system.last_exit_code = 1
+            return error
         
+        saved = self.push_assignments(assignments)
         try:
-            parts = shlex.split(command_line)
-        except ValueError:
-            parts = command_line.split()
-        
-        if not parts:
-            return ''
-        
-        parts = self.expand_globs(parts)
+            output = self.run_command(args, stdin_content)
+        finally:
+            self.pop_assignments(saved)
+        return self.apply_output_redirects(redirects, output)
+
+    def run_command(self, args, stdin_content=None):
+        self.previous_status = self.system.last_exit_code
+        self.system.last_exit_code = None
+        output = ''
+        try:
+            if args[0] in self.functions:
+                output = self.call_function(args[0], args[1:], stdin_content)
+            elif '/' in args[0]:
+                output = self.run_file(args[0], args[1:], stdin_content)
+            elif self.stdout is not None and getattr(self.executor.get_spec(args[0]), 'streams', False):
+                output = self.stream_command(args, stdin_content)
+            else:
+                output = self.executor.execute(args[0], args[1:], stdin=stdin_content)
+        finally:
+            if self.system.last_exit_code is None:
+                self.system.last_exit_code = 0 if not output.startswith('-bash:') else 1
+        return output
+
+    def stream_command(self, args, stdin_content=None):
+        stream = self.executor.execute_stream(args[0], args[1:], iter((stdin_content,)) if stdin_content else None,
+                                              bounded=True)
+        first = ''
+        try:
+            for chunk in stream:
+                first = first or chunk
+                self.stdout.write(chunk)
+                if self.stopped():
+                    break
+        finally:
+            stream.close()
+        if self.system.last_exit_code is None and first.startswith('-bash:'):
+            self.system.last_exit_code = 1
+        return ''
+
+    def resolve_simple(self, node):
+        words = node.words
+        redirects = node.redirects
+        if words:
+            name = word_literal(words[0])
+            expansion = self.system.aliases.get(name) if name is not None else None
+            if expansion is not None:
+                inner = self.alias_command(expansion)
+                if inner is None:
+                    rest = [shlex.quote(arg) for word in words[1:] for arg in self.expand_word(word)]
+                    return None, redirects, {}, ' '.join([expansion] + rest)
+                words = inner.words + words[1:]
+                redirects = inner.redirects + redirects
         
-        cmd = parts[0]
-        args = parts[1:]
+        assignments = {}
+        for name, value in node.assignments:
+            assignments[name] = ''.join(self.expand_word(value, split=False))
         
+        args = []
+        for word in words:
+            args.extend(self.expand_word(word))
+        return args, redirects, assignments, None
+
+    def alias_command(self, expansion):
+        try:
+            tree = parse(expansion)
+        except ParseError:
+            return None
+        if len(tree.items) != 1 or tree.items[0][1]:
+            return None
+        and_or = tree.items[0][0]
+        if and_or.rest or len(and_or.first.commands) != 1 or and_or.first.negated:
+            return None
+        command = and_or.first.commands[0]
+        if command.kind != 'simple' or command.assignments:
+            return None
+        return command
+
+    def push_assignments(self, assignments):
+        saved = {name: self.system.environment.get(name) for name in assignments}
+        self.system.environment.update(assignments)
+        return saved
+
+    def pop_assignments(self, saved):
+        for name, value in saved.items():
+            if value is None:
+                self.system.environment.pop(name, None)
+            else:
+                self.system.environment[name] = value
+
+    def redirect_target(self, redirect):
+        return ''.join(self.expand_word(redirect.target, split=False))
+
+    def read_input_redirects(self, redirects):
         stdin_content = None
-        if redirect_in:
-            content = self.system.filesystem.read_file(redirect_in)
+        for redirect in redirects:
+            if redirect.op != '<' or redirect.fd not in (None, 0):
+                continue
+            target = self.redirect_target(redirect)
+            content = self.system.filesystem.read_file(target)
             if content is None:
-                return f"-bash: {redirect_in}: No such file or directory\n"
+                return None, f"-bash: {target}: No such file or directory\n"
             stdin_content = content
+        return stdin_content, None
+
+    def apply_output_redirects(self, redirects, output):
+        try:
+            return self.write_redirects(redirects, output)
+        except FileSystemError as e:
+            self.system.last_exit_code = 1
+            return f"-bash: {e}\n"
+
+    def write_redirects(self, redirects, output):
+        fs = self.system.filesystem
+        targets = []
+        for redirect in redirects:
+            if redirect.op == '<':
+                continue
+            target = self.redirect_target(redirect)
+            if redirect.op == '>&' and (target.isdigit() or target == '-'):
+                continue
+            if redirect.fd == 2:
+                if output.startswith('-bash:'):
+                    if target != '/dev/null':
+                        fs.write_file(target, output, append=redirect.op == '>>')
+                    output = ''
+                elif target != '/dev/null' and (redirect.op == '>' or not fs.exists(target)):
+                    fs.write_file(target, '')
+                continue
+            if redirect.fd not in (None, 1):
+                continue
+            targets.append((target, redirect.op == '>>'))
         
-        if self.pipe_buffer is not None:
-            stdin_content = self.pipe_buffer
-            self.pipe_buffer = None
-        
-        output = self.executor.execute(cmd, args, stdin=stdin_content)
-        
-        self.system.last_exit_code = 0 if not output.startswith('-bash:') else 1
-        
-        if redirect_out:
-            self.system.filesystem.write_file(redirect_out, output, append=append_mode)
-            return ''
+        for index, (target, append) in enumerate(targets):
+            if target == '/dev/null':
+                continue
+            last = index == len(targets) - 1
+            fs.write_file(target, output if last else '', append=append)
+        return '' if targets else output
+
+    def execute_pipeline(self, commands):
+        stream = None
+        stages = []
+        output = []
+        first = ''
+        saved = {}
+        sink, self.stdout = self.stdout, None
+        self.system.last_exit_code = None
+        try:
+            for command in commands:
+                if command.kind != 'simple':
+                    stdin_content = ''.join(stream) if stream is not None else None
+                    stream = iter((self.run_with_input(self.run, command, stdin_content),))
+                    continue
+                args, redirects, assignments, line = self.resolve_simple(command)
+                if line is not None:
+                    stream = iter((self.apply_output_redirects(redirects, self.run_line(line)),))
+                    continue
+                for name in assignments:
+                    saved.setdefault(name, self.system.environment.get(name))
+                self.system.environment.update(assignments)
+                if not args:
+                    stream = iter((self.apply_output_redirects(redirects, ''),))
+                    continue
+                stdin_content, error = self.read_input_redirects(redirects)
+                if error is not None:
+                    stream = iter((error,))
+                    continue
+                if stdin_content is not None:
+                    stream = iter((stdin_content,))
+                if args[0] in self.functions or '/' in args[0]:
+                    stream = iter((self.run_command(args, ''.join(stream) if stream is not None else None),))
+                else:
+                    stream = self.executor.execute_stream(args[0], args[1:], stream)
+                    stages.append(stream)
+                if writes_output(redirects):
+                    stream = iter((self.apply_output_redirects(redirects, ''.join(stream)),))
+            
+            for chunk in stream:
+                if sink is None:
+                    output.append(chunk)
+                else:
+                    first = first or chunk
+                    sink.write(chunk)
+                if self.stopped():
+                    break
+        finally:
+            for stage in reversed(stages):
+                stage.close()
+            self.pop_assignments(saved)
+            self.stdout = sink
         
+        output = ''.join(output)
+        if self.system.last_exit_code is None:
+            self.system.last_exit_code = 0 if not (output or first).startswith('-bash:') else 1
         return output
 
-    def execute_pipeline(self, command_line):
-        commands = [cmd.strip() for cmd in command_line.split('|')]
-        output = ''
-        for i, cmd in enumerate(commands):
-            if i > 0:
-                self.pipe_buffer = output
-            output = self.execute(cmd)
-            if self.interrupted:
-                break
-        self.pipe_buffer = None
-        return output
+    def expand_word(self, word, split=True):
+        if len(word) == 1 and word[0][0] == 'lit' and word[0][1] and not LITERAL_SPECIAL_RE.search(word[0][1]):
+            return [word[0][1]]
+        if split and any(kind == 'lit' and '{' in text for kind, text in word):
+            return [field for variant in expand_braces(word) for field in self.expand_fields(variant)]
+        return self.expand_fields(word, split)
 
-    def expand_variables(self, command_line):
-        def replace_var(match):
-            var_name = match.group(1) or match.group(2)
-            if var_name == '?':
-                return str(self.system.last_exit_code)
-            elif var_name == '$':
-                return str(os.getpid())
-            elif var_name == 'HOME':
-                return self.system.environment.get('HOME', '/root')
-            elif var_name == 'PWD':
-                return self.system.filesystem.cwd
-            elif var_name == 'USER':
-                return self.system.current_user or 'root'
-            elif var_name == 'HOSTNAME':
-                return self.system.hostname
-            return self.system.environment.get(var_name, '')
+    def expand_fields(self, word, split=True):
+        fields = [[[], False, [], False]]
+        for index, (kind, text) in enumerate(word):
+            current = fields[-1]
+            if kind == 'sq':
+                current[0].append(text)
+                current[1] = True
+                current[2].append(escape(text))
+            elif kind == 'dq' and split and text in ('$@', '${@}'):
+                for position, value in enumerate(self.positional):
+                    if position:
+                        current = [[], False, [], False]
+                        fields.append(current)
+                    current[0].append(value)
+                    current[1] = True
+                    current[2].append(escape(value))
+            elif kind == 'dq':
+                expanded = self.expand_variables(text)
+                current[0].append(expanded)
+                current[1] = True
+                current[2].append(escape(expanded))
+            else:
+                if index == 0 and (text == '~' or text.startswith('~/')):
+                    text = self.system.environment.get('HOME', '/root') + text[1:]
+                expanded = self.expand_variables(text)
+                if split and expanded != text:
+                    pieces = re.split(r'[ \t\n]+', expanded)
+                    current[0].append(pieces[0])
+                    current[2].append(pieces[0])
+                    current[3] = current[3] or has_magic(pieces[0])
+                    for piece in pieces[1:]:
+                        fields.append([[piece], False, [piece], has_magic(piece)])
+                else:
+                    current[0].append(expanded)
+                    current[2].append(expanded)
+                    current[3] = current[3] or has_magic(expanded)
         
-        result = re.sub(r'\$\{([^}]+)\}|\$([A-Za-z_][A-Za-z0-9_]*|\?|\$)', replace_var, command_line)
-        result = result.replace('~', self.system.environment.get('HOME', '/root'))
-        return result
-
-    def expand_globs(self, parts):
+        if not split:
+            return [''.join(''.join(parts) for parts, quoted, pattern, magic in fields)]
         result = []
-        for part in parts:
-            if any(c in part for c in ['*', '?', '[']):
-                base_path = self.system.filesystem.cwd
-                matches = self._glob_match(base_path, part)
-                if matches:
-                    result.extend(sorted(matches))
-                else:
-                    result.append(part)
+        for parts, quoted, pattern, magic in fields:
+            if not quoted and not any(parts):
+                continue
+            matches = self.globber.expand(''.join(pattern)) if magic else None
+            if matches:
+                result.extend(matches)
             else:
-                result.append(part)
+                result.append(''.join(parts))
         return result
 
-    def _glob_match(self, base_path, pattern):
-        matches = []
-        files = self.system.filesystem.list_dir(base_path)
-        if files is None:
-            return matches
-        for f in files:
-            if fnmatch.fnmatch(f, pattern):
-                matches.append(f)
-        return matches
-
-    def tab_complete(self, partial):
-        completions = []
-        parts = partial.split()
+    def expand_variables(self, text):
+        if '$' not in text and '`' not in text:
+            return text
+        if '$(' not in text and '`' not in text:
+            return self.expand_parameters(text)
         
-        if not parts or (len(parts) == 1 and not partial.endswith(' ')):
-            prefix = parts[0] if parts else ''
-            builtins = ['cd', 'pwd', 'echo', 'export', 'alias', 'unalias', 'history', 
-                       'exit', 'source', 'set', 'unset', 'type', 'help', 'jobs', 
-                       'fg', 'bg', 'kill', 'test', 'true', 'false']
-            commands = ['ls', 'cat', 'grep', 'find', 'ps', 'top', 'kill', 'mkdir', 
-                       'rm', 'cp', 'mv', 'touch', 'chmod', 'chown', 'df', 'du',
-                       'free', 'uname', 'hostname', 'date', 'cal', 'uptime',
-                       'whoami', 'id', 'who', 'head', 'tail', 'wc', 'sort', 'uniq',
-                       'ifconfig', 'ip', 'ping', 'netstat', 'curl', 'wget',
-                       'apt', 'dpkg', 'systemctl', 'service', 'man', 'clear',
-                       'shutdown', 'reboot', 'poweroff']
-            all_cmds = list(set(builtins + commands + list(self.system.aliases.keys())))
-            for cmd in all_cmds:
-                if cmd.startswith(prefix):
-                    completions.append(cmd)
-        else:
-            path_part = parts[-1] if parts else ''
-            if '/' in path_part:
-                dir_path = '/'.join(path_part.split('/')[:-1]) or '/'
-                prefix = path_part.split('/')[-1]
+        output = []
+        i = 0
+        plain = 0
+        while i < len(text):
+            if text.startswith('$((', i):
+                end = find_closing(text, i + 2, '(', ')')
+                source = text[i + 2:end]
+                if source.endswith(')') and find_closing(source, 1, '(', ')') == len(source) - 1:
+                    output.append(self.expand_parameters(text[plain:i]))
+                    output.append(self.arithmetic(source[1:-1]))
+                    i = plain = end + 1
+                    continue
+            elif text.startswith('$(', i):
+                end = find_closing(text, i + 2, '(', ')')
+                source = text[i + 2:end]
+            elif text[i] == '`':
+                end = text.find('`', i + 1)
+                if end < 0:
+                    break
+                source = text[i + 1:end]
             else:
-                dir_path = self.system.filesystem.cwd
-                prefix = path_part
-            
-            resolved = self.system.filesystem.resolve_path(dir_path)
-            files = self.system.filesystem.list_dir(resolved)
-            if files:
-                for f in files:
-                    if f.startswith(prefix):
-                        if self.system.filesystem.is_dir(f"{resolved}/{f}"):
-                            completions.append(f + '/')
-                        else:
-                            completions.append(f)
+                i += 1
+                continue
+            output.append(self.expand_parameters(text[plain:i]))
+            output.append(self.command_substitution(source))
+            i = plain = end + 1
+        output.append(self.expand_parameters(text[plain:]))
+        return ''.join(output)
+
+    def command_substitution(self, source):
+        if self.depth >= self.max_depth:
+            self.system.last_exit_code = 1
+            return ''
+        try:
+            tree = parse(source)
+        except ParseError:
+            return ''
+        self.depth += 1
+        try:
+            return self.capture(self.run, tree).rstrip('\n')
+        finally:
+            self.depth -= 1
+
+    def arithmetic(self, expression):
+        return str(evaluate(self.expand_parameters(expression), self.parameter))
+
+    def expand_pattern(self, word):
+        pattern = []
+        for kind, text in word:
+            if kind == 'sq':
+                pattern.append(escape(text))
+            elif kind == 'dq':
+                pattern.append(escape(self.expand_variables(text)))
+            else:
+                pattern.append(self.expand_variables(text))
+        return ''.join(pattern)
+
+    def parameter(self, name):
+        if name.isdigit():
+            index = int(name)
+            if index == 0:
+                return self.script_name
+            return self.positional[index - 1] if index <= len(self.positional) else None
+        if name == '#':
+            return str(len(self.positional))
+        if name in ('@', '*'):
+            return ' '.join(self.positional)
+        if name == '?':
+            return str(self.system.last_exit_code)
+        elif name == '!':
+            return str(self.system.jobs.last_pid) if self.system.jobs.last_pid is not None else None
+        elif name == '$':
+            shells = [p.pid for p in self.system.process_manager.get_processes_by_name('bash') if p.command == '-bash']
+            return str(shells[0]) if shells else None
+        elif name == 'HOME':
+            return self.system.environment.get('HOME', '/root')
+        elif name == 'PWD':
+            return self.system.filesystem.cwd
+        elif name == 'USER':
+            return self.system.current_user or 'root'
+        elif name == 'HOSTNAME':
+            return self.system.hostname
+        elif name == 'RANDOM':
+            return str(random.randrange(32768))
+        return self.system.environment.get(name)
+
+    def expand_parameters(self, text):
+        if '$' not in text:
+            return text
         
-        return sorted(set(completions))
+        def replace_var(match):
+            if match.group(2) is not None:
+                return self.parameter(match.group(2)) or ''
+            name = match.group(1)
+            if name.startswith('#') and len(name) > 1:
+                return str(len(self.parameter(name[1:]) or ''))
+            operator = OPERATOR_RE.match(name)
+            if operator is None:
+                return self.parameter(name) or ''
+            name, op, word = operator.groups()
+            value = self.parameter(name)
+            unset = value is None or (op.startswith(':') and not value)
+            if op.endswith('+'):
+                return '' if unset else self.expand_parameters(word)
+            if not unset:
+                return value
+            word = self.expand_parameters(word)
+            if op.endswith('=') and not name.isdigit() and name not in '?$#@*!':
+                self.system.environment[name] = word
+            return word
+        
+        return PARAMETER_RE.sub(replace_var, text)
+
+    def tab_complete(self, partial):
+        return self.completer.complete(partial)
 
     def interrupt(self):
         self.interrupted = True
+        self.executor.token.cancel()
@@ -0,0 +1,606 @@
+import re
+from functools import lru_cache
+
+
+OPERATORS = ('&&', '||', ';;', '>>', '>&', '&>', '|', '&', ';', '(', ')', '<', '>')
+REDIRECT_OPS = ('>', '>>', '<', '>&', '&>')
+META_CHARS = ' \t\n|&;()<>'
+ASSIGNMENT_RE = re.compile(r'^([A-Za-z_][A-Za-z0-9_]*)=')
+NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*\Z')
+COMPOUND_KEYWORDS = {'{': 'group', 'if': 'if', 'for': 'for', 'while': 'while', 'until': 'until', 'case': 'case'}
+
+
+class ParseError(Exception):
+    pass
+
+
+class Token:
+    def __init__(self, kind, value):
+        self.kind = kind
+        self.value = value
+
+    def is_op(self, *ops):
+        return self.kind == 'op' and self.value in ops
+
+    def literal(self):
+        if self.kind == 'word' and len(self.value) == 1 and self.value[0][0] == 'lit':
+            return self.value[0][1]
+        return None
+
+    def text(self):
+        if self.kind == 'word':
+            return ''.join(text for kind, text in self.value)
+        if self.kind == 'newline':
+            return 'newline'
+        return str(self.value)
+
+
+class Redirect:
+    def __init__(self, op, target, fd=None):
+        self.op = op
+        self.target = target
+        self.fd = fd
+
+
+class SimpleCommand:
+    kind = 'simple'
+
+    def __init__(self, assignments, words, redirects):
+        self.assignments = assignments
+        self.words = words
+        self.redirects = redirects
+
+
+class Subshell:
+    kind = 'subshell'
+
+    def __init__(self, body, redirects):
+        self.body = body
+        self.redirects = redirects
+
+
+class BraceGroup:
+    kind = 'group'
+
+    def __init__(self, body, redirects=None):
+        self.body = body
+        self.redirects = redirects or []
+
+
+class IfClause:
+    kind = 'if'
+
+    def __init__(self, branches, otherwise, redirects=None):
+        self.branches = branches
+        self.otherwise = otherwise
+        self.redirects = redirects or []
+
+
+class ForLoop:
+    kind = 'for'
+
+    def __init__(self, name, words, body, redirects=None):
+        self.name = name
+        self.words = words
+        self.body = body
+        self.redirects = redirects or []
+
+
+class WhileLoop:
+    kind = 'while'
+
+    def __init__(self, condition, body, until=False, redirects=None):
+        self.condition = condition
+        self.body = body
+        self.until = until
+        self.redirects = redirects or []
+
+
+class CaseClause:
+    kind = 'case'
+
+    def __init__(self, word, items, redirects=None):
+        self.word = word
+        self.items = items
+        self.redirects = redirects or []
+
+
+class FunctionDef:
+    kind = 'function'
+
+    def __init__(self, name, body):
+        self.name = name
+        self.body = body
+
+
+class Pipeline:
+    kind = 'pipeline'
+
+    def __init__(self, commands, negated=False):
+        self.commands = commands
+        self.negated = negated
+
+
+class AndOr:
+    kind = 'and_or'
+
+    def __init__(self, first, rest):
+        self.first = first
+        self.rest = rest
+
+
+class CommandList:
+    kind = 'list'
+
+    def __init__(self, items):
+        self.items = items
+
+
+def word_text(word):
+    out = []
+    for kind, text in word:
+        if kind == 'sq':
+            out.append("'" + text + "'")
+        elif kind == 'dq':
+            out.append('"' + text + '"')
+        else:
+            out.append(text)
+    return ''.join(out)
+
+
+def _redirects_text(redirects):
+    return ''.join(f" {'' if r.fd is None else r.fd}{r.op} {word_text(r.target)}" for r in redirects)
+
+
+def unparse(node):
+    kind = node.kind
+    if kind == 'list':
+        return '; '.join(unparse(command) + (' &' if background else '') for command, background in node.items)
+    if kind == 'and_or':
+        return ' '.join([unparse(node.first)] + [f"{op} {unparse(pipeline)}" for op, pipeline in node.rest])
+    if kind == 'pipeline':
+        return ('! ' if node.negated else '') + ' | '.join(unparse(command) for command in node.commands)
+    if kind == 'simple':
+        words = [f"{name}={word_text(value)}" for name, value in node.assignments]
+        words += [word_text(word) for word in node.words]
+        return ' '.join(words) + _redirects_text(node.redirects)
+    if kind == 'function':
+        return f"{node.name} () {unparse(node.body)}"
+    if kind == 'subshell':
+        text = f"( {unparse(node.body)} )"
+    elif kind == 'group':
+        text = f"{{ {unparse(node.body)}; }}"
+    elif kind == 'if':
+        clauses = [f"if {unparse(node.branches[0][0])}; then {unparse(node.branches[0][1])}"]
+        clauses += [f"elif {unparse(condition)}; then {unparse(body)}" for condition, body in node.branches[1:]]
+        if node.otherwise is not None:
+            clauses.append(f"else {unparse(node.otherwise)}")
+        text = '; '.join(clauses) + '; fi'
+    elif kind == 'for':
+        words = '' if node.words is None else ' in ' + ' '.join(word_text(word) for word in node.words)
+        text = f"for {node.name}{words}; do {unparse(node.body)}; done"
+    elif kind == 'while':
+        text = f"{'until' if node.until else 'while'} {unparse(node.condition)}; do {unparse(node.body)}; done"
+    else:
+        items = ' '.join(f"{'|'.join(word_text(p) for p in patterns)}) {unparse(body)};;" for patterns, body in node.items)
+        text = f"case {word_text(node.word)} in {items} esac"
+    return text + _redirects_text(node.redirects)
+
+
+def word_literal(word):
+    if len(word) == 1 and word[0][0] == 'lit':
+        return word[0][1]
+    return None
+
+
+def find_closing(source, i, open_ch, close_ch):
+    depth = 1
+    n = len(source)
+    while i < n:
+        ch = source[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == "'":
+            end = source.find("'", i + 1)
+            if end < 0:
+                break
+            i = end + 1
+            continue
+        if ch == open_ch:
+            depth += 1
+        elif ch == close_ch:
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ParseError(f"unexpected EOF while looking for matching `{close_ch}'")
+
+
+def _read_word(source, i):
+    parts = []
+    buf = []
+    n = len(source)
+
+    def flush(kind='lit'):
+        if buf:
+            parts.append((kind, ''.join(buf)))
+            buf.clear()
+
+    while i < n:
+        ch = source[i]
+        if ch in META_CHARS:
+            break
+        if ch == "'":
+            end = source.find("'", i + 1)
+            if end < 0:
+                raise ParseError("unexpected EOF while looking for matching `''")
+            flush()
+            parts.append(('sq', source[i + 1:end]))
+            i = end + 1
+        elif ch == '"':
+            flush()
+            start = len(parts)
+            i += 1
+            while True:
+                if i >= n:
+                    raise ParseError("unexpected EOF while looking for matching `\"'")
+                ch = source[i]
+                if ch == '"':
+                    i += 1
+                    break
+                if ch == '\\' and i + 1 < n and source[i + 1] in '$`"\\\n':
+                    flush('dq')
+                    if source[i + 1] != '\n':
+                        parts.append(('sq', source[i + 1]))
+                    i += 2
+                elif source.startswith('$(', i):
+                    end = find_closing(source, i + 2, '(', ')')
+                    buf.append(source[i:end + 1])
+                    i = end + 1
+                elif ch == '`':
+                    end = source.find('`', i + 1)
+                    if end < 0:
+                        raise ParseError("unexpected EOF while looking for matching ``'")
+                    buf.append(source[i:end + 1])
+                    i = end + 1
+                else:
+                    buf.append(ch)
+                    i += 1
+            flush('dq')
+            if len(parts) == start:
+                parts.append(('dq', ''))
+        elif ch == '\\':
+            if i + 1 >= n:
+                buf.append(ch)
+                i += 1
+            elif source[i + 1] == '\n':
+                i += 2
+            else:
+                flush()
+                parts.append(('sq', source[i + 1]))
+                i += 2
+        elif source.startswith('$(', i):
+            end = find_closing(source, i + 2, '(', ')')
+            buf.append(source[i:end + 1])
+            i = end + 1
+        elif source.startswith('${', i):
+            end = find_closing(source, i + 2, '{', '}')
+            buf.append(source[i:end + 1])
+            i = end + 1
+        elif ch == '`':
+            end = source.find('`', i + 1)
+            if end < 0:
+                raise ParseError("unexpected EOF while looking for matching ``'")
+            buf.append(source[i:end + 1])
+            i = end + 1
+        else:
+            buf.append(ch)
+            i += 1
+    flush()
+
+    merged = []
+    for kind, text in parts:
+        if merged and merged[-1][0] == kind:
+            merged[-1] = (kind, merged[-1][1] + text)
+        else:
+            merged.append((kind, text))
+    return tuple(merged), i
+
+
+def tokenize(source):
+    tokens = []
+    i = 0
+    n = len(source)
+    while i < n:
+        ch = source[i]
+        if ch in ' \t':
+            i += 1
+        elif ch == '\n':
+            tokens.append(Token('newline', '\n'))
+            i += 1
+        elif ch == '#':
+            end = source.find('\n', i)
+            i = n if end < 0 else end
+        elif source.startswith('\\\n', i):
+            i += 2
+        else:
+            for op in OPERATORS:
+                if source.startswith(op, i):
+                    tokens.append(Token('op', op))
+                    i += len(op)
+                    break
+            else:
+                word, i = _read_word(source, i)
+                literal = word_literal(word)
+                if literal is not None and literal.isdigit() and i < n and source[i] in '<>':
+                    tokens.append(Token('io', int(literal)))
+                else:
+                    tokens.append(Token('word', word))
+    return tokens
+
+
+class Parser:
+    max_depth = 64
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.depth = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def advance(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def error(self, token=None):
+        if token is None:
+            raise ParseError("syntax error: unexpected end of file")
+        raise ParseError(f"syntax error near unexpected token `{token.text()}'")
+
+    def skip_newlines(self):
+        while self.peek() is not None and self.peek().kind == 'newline':
+            self.pos += 1
+
+    def at_terminator(self, terminators):
+        token = self.peek()
+        if token is None:
+            return True
+        if token.kind == 'op':
+            return token.value in terminators
+        return token.literal() in terminators
+
+    def expect_keyword(self, keyword):
+        self.skip_newlines()
+        token = self.peek()
+        if token is None or token.literal() != keyword:
+            self.error(token)
+        self.pos += 1
+
+    def parse_program(self):
+        program = self.parse_list(())
+        if self.peek() is not None:
+            self.error(self.peek())
+        return program
+
+    def parse_list(self, terminators):
+        if self.depth >= self.max_depth:
+            raise ParseError(f"maximum nesting level exceeded ({self.max_depth})")
+        self.depth += 1
+        items = []
+        self.skip_newlines()
+        while not self.at_terminator(terminators):
+            command = self.parse_and_or()
+            background = False
+            token = self.peek()
+            if token is not None and (token.is_op(';', '&') or token.kind == 'newline'):
+                background = token.is_op('&')
+                self.pos += 1
+                items.append((command, background))
+                self.skip_newlines()
+                continue
+            items.append((command, background))
+            break
+        self.depth -= 1
+        return CommandList(items)
+
+    def parse_and_or(self):
+        first = self.parse_pipeline()
+        rest = []
+        while self.peek() is not None and self.peek().is_op('&&', '||'):
+            op = self.advance().value
+            self.skip_newlines()
+            rest.append((op, self.parse_pipeline()))
+        return AndOr(first, rest)
+
+    def parse_pipeline(self):
+        negated = False
+        if self.peek() is not None and self.peek().literal() == '!':
+            self.pos += 1
+            negated = True
+        commands = [self.parse_command()]
+        while self.peek() is not None and self.peek().is_op('|'):
+            self.pos += 1
+            self.skip_newlines()
+            commands.append(self.parse_command())
+        return Pipeline(commands, negated)
+
+    def parse_command(self):
+        token = self.peek()
+        if token is not None and token.is_op('('):
+            self.pos += 1
+            body = self.parse_list((')',))
+            token = self.peek()
+            if token is None or not token.is_op(')'):
+                self.error(token)
+            self.pos += 1
+            return Subshell(body, self.parse_redirects())
+        keyword = token.literal() if token is not None else None
+        if keyword in COMPOUND_KEYWORDS:
+            self.pos += 1
+            command = getattr(self, 'parse_' + COMPOUND_KEYWORDS[keyword])()
+            command.redirects = self.parse_redirects()
+            return command
+        if keyword == 'function':
+            self.pos += 1
+            return self.parse_function()
+        if keyword is not None and NAME_RE.match(keyword) and self.pos + 2 < len(self.tokens) \
+                and self.tokens[self.pos + 1].is_op('(') and self.tokens[self.pos + 2].is_op(')'):
+            return self.parse_function()
+        return self.parse_simple()
+
+    def parse_function(self):
+        token = self.peek()
+        name = token.literal() if token is not None else None
+        if name is None or not NAME_RE.match(name):
+            self.error(token)
+        self.pos += 1
+        if self.peek() is not None and self.peek().is_op('('):
+            self.pos += 1
+            if self.peek() is None or not self.peek().is_op(')'):
+                self.error(self.peek())
+            self.pos += 1
+        self.skip_newlines()
+        return FunctionDef(name, self.parse_command())
+
+    def parse_group(self):
+        body = self.parse_list(('}',))
+        self.expect_keyword('}')
+        return BraceGroup(body)
+
+    def parse_if(self):
+        branches = []
+        otherwise = None
+        while True:
+            condition = self.parse_list(('then',))
+            self.expect_keyword('then')
+            branches.append((condition, self.parse_list(('elif', 'else', 'fi'))))
+            keyword = self.peek().literal() if self.peek() is not None else None
+            if keyword == 'elif':
+                self.pos += 1
+                continue
+            if keyword == 'else':
+                self.pos += 1
+                otherwise = self.parse_list(('fi',))
+            self.expect_keyword('fi')
+            return IfClause(branches, otherwise)
+
+    def parse_for(self):
+        token = self.peek()
+        name = token.literal() if token is not None else None
+        if name is None or not NAME_RE.match(name):
+            self.error(token)
+        self.pos += 1
+        words = None
+        self.skip_newlines()
+        if self.peek() is not None and self.peek().literal() == 'in':
+            self.pos += 1
+            words = []
+            while self.peek() is not None and self.peek().kind == 'word':
+                words.append(self.advance().value)
+        if self.peek() is not None and (self.peek().is_op(';') or self.peek().kind == 'newline'):
+            self.pos += 1
+        self.expect_keyword('do')
+        body = self.parse_list(('done',))
+        self.expect_keyword('done')
+        return ForLoop(name, words, body)
+
+    def parse_while(self, until=False):
+        condition = self.parse_list(('do',))
+        self.expect_keyword('do')
+        body = self.parse_list(('done',))
+        self.expect_keyword('done')
+        return WhileLoop(condition, body, until)
+
+    def parse_until(self):
+        return self.parse_while(until=True)
+
+    def parse_case(self):
+        token = self.peek()
+        if token is None or token.kind != 'word':
+            self.error(token)
+        word = self.advance().value
+        self.expect_keyword('in')
+        items = []
+        self.skip_newlines()
+        while self.peek() is not None and self.peek().literal() != 'esac':
+            if self.peek().is_op('('):
+                self.pos += 1
+            patterns = []
+            while True:
+                token = self.peek()
+                if token is None or token.kind != 'word':
+                    self.error(token)
+                patterns.append(self.advance().value)
+                if self.peek() is None or not self.peek().is_op('|'):
+                    break
+                self.pos += 1
+            token = self.peek()
+            if token is None or not token.is_op(')'):
+                self.error(token)
+            self.pos += 1
+            items.append((patterns, self.parse_list((';;', 'esac'))))
+            if self.peek() is not None and self.peek().is_op(';;'):
+                self.pos += 1
+            self.skip_newlines()
+        self.expect_keyword('esac')
+        return CaseClause(word, items)
+
+    def parse_redirect(self):
+        fd = None
+        if self.peek().kind == 'io':
+            fd = self.advance().value
+        token = self.peek()
+        if token is None or not token.is_op(*REDIRECT_OPS):
+            self.error(token)
+        op = self.advance().value
+        target = self.peek()
+        if target is None or target.kind != 'word':
+            self.error(target)
+        self.pos += 1
+        return Redirect(op, target.value, fd)
+
+    def parse_redirects(self):
+        redirects = []
+        while self.peek() is not None and (self.peek().kind == 'io' or self.peek().is_op(*REDIRECT_OPS)):
+            redirects.append(self.parse_redirect())
+        return redirects
+
+    def parse_simple(self):
+        assignments = []
+        words = []
+        redirects = []
+        while True:
+            token = self.peek()
+            if token is None:
+                break
+            if token.kind == 'io' or token.is_op(*REDIRECT_OPS):
+                redirects.append(self.parse_redirect())
+            elif token.kind == 'word':
+                self.pos += 1
+                word = token.value
+                match = ASSIGNMENT_RE.match(word[0][1]) if not words and word[0][0] == 'lit' else None
+                if match:
+                    value = ((('lit', word[0][1][match.end():]),) if match.end() < len(word[0][1]) else ()) + word[1:]
+                    assignments.append((match.group(1), value))
+                else:
+                    words.append(word)
+            else:
+                break
+        if not assignments and not words and not redirects:
+            self.error(self.peek())
+        return SimpleCommand(assignments, words, redirects)
+
+
+@lru_cache(maxsize=2048)
+def parse(source):
+    return Parser(tokenize(source)).parse_program()
+
+
+def parse_script(source):
+    return Parser(tokenize(source)).parse_program()
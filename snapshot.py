@@ -0,0 +1,424 @@
+import json
+import zlib
+
+from filesystem import DirNode, FileNode, SymlinkNode, decode_content, encode_content
+
+
+MAGIC = b'PLFS'
+VERSION = 1
+COMPRESS_ZLIB = 0x01
+KIND_TREE = b'T'
+KIND_DELTA = b'D'
+KIND_SESSION = b'S'
+
+FILE = 0
+DIR = 1
+SYMLINK = 2
+END = 3
+HAS_PERMISSIONS = 0x04
+HAS_OWNER = 0x08
+HAS_TIMES = 0x10
+HAS_LINKS = 0x20
+HAS_PAYLOAD = 0x40
+REPEAT = 0x80
+
+DEFAULT_PERMISSIONS = {FILE: 0o644, DIR: 0o755, SYMLINK: 0o777}
+CHUNK_SIZE = 65536
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _micros(t):
+    return int(round(t * 1000000))
+
+
+class SnapshotWriter:
+    def __init__(self, out, kind, compress=True, level=6):
+        self.out = out
+        self.compressor = zlib.compressobj(level) if compress else None
+        self.buffer = bytearray()
+        self.strings = {}
+        out.write(MAGIC + bytes([VERSION, COMPRESS_ZLIB if compress else 0]) + kind)
+
+    def _drain(self):
+        chunk = bytes(self.buffer)
+        self.buffer.clear()
+        if self.compressor is not None:
+            chunk = self.compressor.compress(chunk)
+        if chunk:
+            self.out.write(chunk)
+
+    def close(self):
+        self._drain()
+        if self.compressor is not None:
+            self.out.write(self.compressor.flush())
+
+    def byte(self, value):
+        self.buffer.append(value)
+
+    def uint(self, value):
+        buffer = self.buffer
+        while value > 0x7f:
+            buffer.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buffer.append(value)
+
+    def sint(self, value):
+        self.uint(value << 1 if value >= 0 else (~value << 1) | 1)
+
+    def blob(self, data):
+        self.uint(len(data))
+        self.buffer += data
+        if len(self.buffer) >= CHUNK_SIZE:
+            self._drain()
+
+    def string(self, value):
+        index = self.strings.get(value)
+        if index is not None:
+            self.uint(index)
+            return
+        self.uint(0)
+        self.blob(value.encode('utf-8', 'surrogateescape'))
+        self.strings[value] = len(self.strings) + 1
+
+    def node(self, kind, name, inode, links, permissions, owner, group, created, modified, accessed, payload, base):
+        flags = kind
+        if permissions != DEFAULT_PERMISSIONS[kind]:
+            flags |= HAS_PERMISSIONS
+        if owner != 'root' or group != 'root':
+            flags |= HAS_OWNER
+        if created != modified or accessed != modified:
+            flags |= HAS_TIMES
+        if links > 1:
+            flags |= HAS_LINKS
+        if payload:
+            flags |= HAS_PAYLOAD
+        self.byte(flags)
+        self.string(name)
+        self.uint(inode)
+        if flags & HAS_PERMISSIONS:
+            self.uint(permissions)
+        if flags & HAS_OWNER:
+            self.string(owner)
+            self.string(group)
+        modified = _micros(modified)
+        self.sint(modified - base)
+        if flags & HAS_TIMES:
+            self.sint(_micros(created) - modified)
+            self.sint(_micros(accessed) - modified)
+        if flags & HAS_LINKS:
+            self.uint(links)
+        if flags & HAS_PAYLOAD:
+            if kind == SYMLINK:
+                self.string(payload)
+            else:
+                self.blob(payload)
+        if len(self.buffer) >= CHUNK_SIZE:
+            self._drain()
+
+    def repeat(self, name, inode):
+        self.byte(FILE | REPEAT)
+        self.string(name)
+        self.uint(inode)
+
+    def end(self):
+        self.byte(END)
+
+
+class SnapshotReader:
+    def __init__(self, source):
+        self.source = source
+        header = source.read(len(MAGIC) + 3)
+        if len(header) < len(MAGIC) + 3 or header[:len(MAGIC)] != MAGIC:
+            raise SnapshotError('not a PyLinux snapshot')
+        version, flags = header[len(MAGIC)], header[len(MAGIC) + 1]
+        if version > VERSION:
+            raise SnapshotError(f'unsupported snapshot version {version}')
+        self.kind = header[len(MAGIC) + 2:]
+        self.decompressor = zlib.decompressobj() if flags & COMPRESS_ZLIB else None
+        self.buffer = b''
+        self.pos = 0
+        self.strings = [None]
+
+    def _fill(self, size):
+        parts = [self.buffer[self.pos:]]
+        available = len(parts[0])
+        while available < size:
+            chunk = self.source.read(CHUNK_SIZE)
+            if not chunk:
+                if self.decompressor is not None and not self.decompressor.eof:
+                    chunk = self.decompressor.flush()
+                    self.decompressor = None
+                    if chunk:
+                        parts.append(chunk)
+                        available += len(chunk)
+                        continue
+                raise SnapshotError('truncated snapshot')
+            if self.decompressor is not None:
+                chunk = self.decompressor.decompress(chunk)
+            parts.append(chunk)
+            available += len(chunk)
+        self.buffer = b''.join(parts)
+        self.pos = 0
+
+    def byte(self):
+        if self.pos >= len(self.buffer):
+            self._fill(1)
+        value = self.buffer[self.pos]
+        self.pos += 1
+        return value
+
+    def uint(self):
+        result = 0
+        shift = 0
+        while True:
+            value = self.byte()
+            result |= (value & 0x7f) << shift
+            if value < 0x80:
+                return result
+            shift += 7
+
+    def sint(self):
+        value = self.uint()
+        return ~(value >> 1) if value & 1 else value >> 1
+
+    def blob(self):
+        size = self.uint()
+        if self.pos + size > len(self.buffer):
+            self._fill(size)
+        data = self.buffer[self.pos:self.pos + size]
+        self.pos += size
+        return data
+
+    def string(self):
+        index = self.uint()
+        if index:
+            try:
+                return self.strings[index]
+            except IndexError:
+                raise SnapshotError('bad string reference')
+        value = str(self.blob(), 'utf-8', 'surrogateescape')
+        self.strings.append(value)
+        return value
+
+    def node(self, base):
+        flags = self.byte()
+        kind = flags & 0x03
+        if kind == END:
+            return None
+        fields = {'kind': kind, 'name': self.string(), 'inode': self.uint()}
+        if flags & REPEAT:
+            fields['repeat'] = True
+            return fields
+        fields['permissions'] = self.uint() if flags & HAS_PERMISSIONS else DEFAULT_PERMISSIONS[kind]
+        if flags & HAS_OWNER:
+            fields['owner'] = self.string()
+            fields['group'] = self.string()
+        else:
+            fields['owner'] = fields['group'] = 'root'
+        modified = base + self.sint()
+        fields['modified'] = modified / 1000000
+        if flags & HAS_TIMES:
+            fields['created'] = (modified + self.sint()) / 1000000
+            fields['accessed'] = (modified + self.sint()) / 1000000
+        else:
+            fields['created'] = fields['accessed'] = fields['modified']
+        fields['links'] = self.uint() if flags & HAS_LINKS else 1
+        if kind == SYMLINK:
+            fields['payload'] = self.string() if flags & HAS_PAYLOAD else ''
+        else:
+            fields['payload'] = self.blob() if flags & HAS_PAYLOAD else b''
+        return fields
+
+
+def _kind(node):
+    if node.is_dir:
+        return DIR
+    return SYMLINK if node.is_symlink else FILE
+
+
+def _payload(node):
+    if node.is_symlink:
+        return node.symlink_target
+    return bytes(node.content) if not node.is_dir else b''
+
+
+def _build(fields):
+    kind = fields['kind']
+    if kind == DIR:
+        node = DirNode(fields['name'], fields['permissions'], fields['owner'], fields['group'], fields['modified'])
+    elif kind == SYMLINK:
+        node = SymlinkNode(fields['name'], fields['payload'], fields['owner'], fields['group'], fields['modified'])
+    else:
+        node = FileNode(fields['name'], fields['payload'], fields['permissions'], fields['owner'], fields['group'],
+                        fields['modified'])
+    node.created = fields['created']
+    node.accessed = fields['accessed']
+    node.inode = fields['inode']
+    node.links = fields['links']
+    return node
+
+
+def _write_tree(writer, fs):
+    base = _micros(fs.root.modified)
+    writer.uint(base)
+    writer.string(fs.cwd)
+    writer.string(json.dumps(fs.mounts, sort_keys=True))
+    seen = set()
+    stack = [('/', fs.root)]
+    while stack:
+        name, node = stack.pop()
+        if node is None:
+            writer.end()
+            continue
+        if node.links > 1 and not node.is_dir:
+            if node.inode in seen:
+                writer.repeat(name, node.inode)
+                continue
+            seen.add(node.inode)
+        writer.node(_kind(node), name, node.inode, node.links, node.permissions, node.owner, node.group,
+                    node.created, node.modified, node.accessed, _payload(node), base)
+        if node.is_dir:
+            stack.append((None, None))
+            stack.extend(reversed(list(fs.iter_dir(node))))
+
+
+def _read_tree(reader):
+    base = reader.uint()
+    cwd = reader.string()
+    mounts = json.loads(reader.string())
+    root = _build(reader.node(base))
+    linked = {}
+    stack = [root]
+    while stack:
+        fields = reader.node(base)
+        if fields is None:
+            stack.pop()
+            continue
+        if fields.get('repeat'):
+            original = linked.get(fields['inode'])
+            if original is None:
+                raise SnapshotError('hard link to unknown inode')
+            node = original.clone()
+            node.name = fields['name']
+        else:
+            node = _build(fields)
+            if node.links > 1:
+                linked[node.inode] = node
+        stack[-1].add_child(node)
+        if node.is_dir:
+            stack.append(node)
+    return root, cwd, mounts
+
+
+def _write_delta(writer, delta):
+    changed = delta.get('changed', {})
+    base = min((_micros(record.get('modified', 0)) for record in changed.values()), default=0)
+    writer.uint(base)
+    writer.string(delta.get('epoch') or '')
+    writer.uint(delta.get('version', 0))
+    writer.uint(delta.get('next_inode', 0))
+    writer.byte(1 if delta.get('full') else 0)
+    deleted = delta.get('deleted', [])
+    writer.uint(len(deleted))
+    for path in deleted:
+        writer.string(path)
+    for path, record in changed.items():
+        if record['is_dir']:
+            kind, payload = DIR, b''
+        elif record.get('symlink_target'):
+            kind, payload = SYMLINK, record['symlink_target']
+        else:
+            kind, payload = FILE, encode_content(record.get('content', ''))
+        modified = record.get('modified', 0)
+        writer.node(kind, path, record.get('inode', 0), record.get('links', 1),
+                    record.get('permissions', DEFAULT_PERMISSIONS[kind]), record.get('owner', 'root'),
+                    record.get('group', 'root'), record.get('created', modified), modified,
+                    record.get('accessed', modified), payload, base)
+    writer.end()
+
+
+def _read_delta(reader):
+    base = reader.uint()
+    delta = {
+        'epoch': reader.string() or None,
+        'version': reader.uint(),
+        'next_inode': reader.uint(),
+        'full': bool(reader.byte()),
+    }
+    if not delta['next_inode']:
+        del delta['next_inode']
+    delta['deleted'] = [reader.string() for _ in range(reader.uint())]
+    changed = delta['changed'] = {}
+    while True:
+        fields = reader.node(base)
+        if fields is None:
+            break
+        path = fields['name']
+        kind = fields['kind']
+        payload = fields['payload']
+        changed[path] = {
+            'name': path.rsplit('/', 1)[-1] or '/',
+            'is_dir': kind == DIR,
+            'content': decode_content(payload) if kind == FILE else '',
+            'permissions': fields['permissions'],
+            'owner': fields['owner'],
+            'group': fields['group'],
+            'created': fields['created'],
+            'modified': fields['modified'],
+            'accessed': fields['accessed'],
+            'size': 4096 if kind == DIR else len(payload),
+            'inode': fields['inode'],
+            'links': fields['links'],
+            'symlink_target': payload if kind == SYMLINK else None,
+        }
+    return delta
+
+
+def dump_filesystem(fs, out, compress=True):
+    writer = SnapshotWriter(out, KIND_TREE, compress)
+    _write_tree(writer, fs)
+    writer.close()
+
+
+def load_filesystem(fs, source):
+    reader = SnapshotReader(source)
+    if reader.kind != KIND_TREE:
+        raise SnapshotError('not a filesystem snapshot')
+    root, cwd, mounts = _read_tree(reader)
+    fs.load_root(root)
+    fs.cwd = cwd
+    fs.mounts = mounts
+
+
+def dump_delta(delta, out, compress=True):
+    writer = SnapshotWriter(out, KIND_DELTA, compress)
+    _write_delta(writer, delta)
+    writer.close()
+
+
+def load_delta(source):
+    reader = SnapshotReader(source)
+    if reader.kind != KIND_DELTA:
+        raise SnapshotError('not a filesystem delta')
+    return _read_delta(reader)
+
+
+def dump_session(state, out, compress=True):
+    state = dict(state)
+    delta = state.pop('filesystem')
+    writer = SnapshotWriter(out, KIND_SESSION, compress)
+    writer.blob(json.dumps(state).encode('utf-8'))
+    _write_delta(writer, delta)
+    writer.close()
+
+
+def load_session(source):
+    reader = SnapshotReader(source)
+    if reader.kind != KIND_SESSION:
+        raise SnapshotError('not a session snapshot')
+    state = json.loads(reader.blob().decode('utf-8'))
+    state['filesystem'] = _read_delta(reader)
+    return state
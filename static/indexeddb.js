@@ -103,6 +103,34 @@ class FileSystemDB {
         });
     }
 
+    async applyFilesystemDelta(sessionId, delta) {
+        let stored = await this.loadFilesystem(sessionId);
+        if (!stored || stored.root || delta.full || stored.epoch !== delta.epoch) {
+            stored = { epoch: delta.epoch, version: 0, changed: {}, deleted: [] };
+        }
+
+        const deleted = new Set(stored.deleted);
+        for (const path of delta.deleted) {
+            const prefix = path + '/';
+            for (const key of Object.keys(stored.changed)) {
+                if (key === path || key.startsWith(prefix)) {
+                    delete stored.changed[key];
+                }
+            }
+            deleted.add(path);
+        }
+
+        for (const [path, record] of Object.entries(delta.changed)) {
+            stored.changed[path] = record;
+            deleted.delete(path);
+        }
+
+        stored.deleted = Array.from(deleted);
+        stored.version = delta.version;
+        await this.saveFilesystem(sessionId, stored);
+        return stored;
+    }
+
     async saveSession(sessionId, sessionData) {
         return new Promise((resolve, reject) => {
             if (!this.db) {
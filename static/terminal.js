@@ -25,6 +25,8 @@ class Terminal {
         this.completionIndex = -1;
         this.completions = [];
         this.updateInterval = null;
+        this.fsEpoch = null;
+        this.fsVersion = 0;
         
         this.init();
     }
@@ -70,14 +72,20 @@ class Terminal {
             }
         });
 
-        this.socket.on('output', (data) => {
+        this.socket.on('output', (data, ack) => {
             if (data.data) {
                 this.write(data.data);
             }
             if (data.prompt) {
                 this.setPrompt(data.prompt);
+                if (this.isBooted) {
+                    this.saveFilesystem();
+                }
             }
             this.scrollToBottom();
+            if (typeof ack === 'function') {
+                ack();
+            }
         });
 
         this.socket.on('boot_complete', (data) => {
@@ -107,14 +115,14 @@ class Terminal {
         });
 
         this.socket.on('filesystem_data', async (data) => {
-            if (data.filesystem) {
-                await this.db.saveFilesystem(this.sessionId, data.filesystem);
+            if (data.delta) {
+                await this.applyFilesystemDelta(data.delta);
             }
         });
 
         this.socket.on('sync_complete', async (data) => {
-            if (data.filesystem) {
-                await this.db.saveFilesystem(this.sessionId, data.filesystem);
+            if (data.delta) {
+                await this.applyFilesystemDelta(data.delta);
             }
         });
     }
@@ -296,10 +304,21 @@ class Terminal {
 
     saveFilesystem() {
         this.socket.emit('get_fs', {
-            session_id: this.sessionId
+            session_id: this.sessionId,
+            epoch: this.fsEpoch,
+            version: this.fsVersion
         });
     }
 
+    async applyFilesystemDelta(delta) {
+        if (!delta.full && delta.version <= this.fsVersion && delta.epoch === this.fsEpoch) {
+            return;
+        }
+        const stored = await this.db.applyFilesystemDelta(this.sessionId, delta);
+        this.fsEpoch = stored.epoch;
+        this.fsVersion = stored.version;
+    }
+
     clear() {
         this.output.innerHTML = '';
     }
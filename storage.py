@@ -0,0 +1,311 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+def split_path(path):
+    parent, _, name = path.rpartition('/')
+    return parent or '/', name
+
+
+class MemoryStorage:
+    persistent = False
+
+    def load_meta(self, key):
+        return None
+
+    def load_node(self, key, path):
+        return None
+
+    def load_children(self, key, path):
+        return []
+
+    def iter_rows(self, key):
+        return iter(())
+
+    def write_batch(self, key, meta, rows, removed, reset=False):
+        pass
+
+    def drop(self, key):
+        pass
+
+    def get_stats(self):
+        return {'backend': 'memory'}
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    persistent = True
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS nodes (session TEXT, path TEXT, parent TEXT, name TEXT, '
+                          'record TEXT, PRIMARY KEY (session, path)) WITHOUT ROWID')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS nodes_parent ON nodes (session, parent)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (session TEXT PRIMARY KEY, data TEXT)')
+
+    def load_meta(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT data FROM meta WHERE session = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_node(self, key, path):
+        with self.lock:
+            row = self.conn.execute('SELECT record FROM nodes WHERE session = ? AND path = ?', (key, path)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def load_children(self, key, path):
+        with self.lock:
+            rows = self.conn.execute('SELECT name, record FROM nodes WHERE session = ? AND parent = ? AND path != ?',
+                                     (key, path, '/')).fetchall()
+        return [(name, json.loads(record) if record is not None else None) for name, record in rows]
+
+    def iter_rows(self, key):
+        with self.lock:
+            rows = self.conn.execute('SELECT path, record FROM nodes WHERE session = ? ORDER BY path', (key,)).fetchall()
+        for path, record in rows:
+            yield path, json.loads(record) if record is not None else None
+
+    def write_batch(self, key, meta, rows, removed, reset=False):
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                if reset:
+                    self.conn.execute('DELETE FROM nodes WHERE session = ?', (key,))
+                for path in removed:
+                    self.conn.execute('DELETE FROM nodes WHERE session = ? AND (path = ? OR (path >= ? AND path < ?))',
+                                      (key, path, path + '/', path + '0'))
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO nodes (session, path, parent, name, record) VALUES (?, ?, ?, ?, ?)',
+                    [(key, path) + split_path(path) + (json.dumps(record) if record is not None else None,)
+                     for path, record in rows])
+                self.conn.execute('INSERT OR REPLACE INTO meta (session, data) VALUES (?, ?)', (key, json.dumps(meta)))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.batches += 1
+
+    def drop(self, key):
+        with self.lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM nodes WHERE session = ?', (key,))
+                self.conn.execute('DELETE FROM meta WHERE session = ?', (key,))
+
+    def get_stats(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT COUNT(*) FROM nodes').fetchone()[0]
+            sessions = self.conn.execute('SELECT COUNT(*) FROM meta').fetchone()[0]
+        return {'backend': 'sqlite', 'path': self.path, 'sessions': sessions, 'rows': rows, 'batches': self.batches}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class LogStorage:
+    persistent = True
+    compact_threshold = 10000
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.batches = 0
+        self.garbage = 0
+        self._replay()
+        self.writer = open(path, 'ab')
+        self.reader = open(path, 'rb')
+
+    def _session(self, key):
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = {'meta': None, 'rows': {}, 'children': {}}
+        return session
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        batch = []
+        offset = 0
+        end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    break
+                if op[0] == 'commit':
+                    for entry, position in batch:
+                        self._apply(entry, position)
+                    batch = []
+                    end = offset + len(line)
+                else:
+                    batch.append((op, offset))
+                offset += len(line)
+        if end < offset:
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+
+    def _apply(self, op, offset):
+        kind, key = op[0], op[1]
+        session = self._session(key)
+        if kind == 'put':
+            self._put(session, op[2], offset if op[3] is not None else None)
+        elif kind == 'del':
+            self._remove(session, op[2])
+        elif kind == 'meta':
+            session['meta'] = op[2]
+        elif kind == 'reset':
+            self.garbage += len(session['rows'])
+            session['rows'] = {}
+            session['children'] = {}
+        elif kind == 'drop':
+            self.garbage += len(session['rows'])
+            del self.sessions[key]
+
+    def _put(self, session, path, offset):
+        if path in session['rows']:
+            self.garbage += 1
+        session['rows'][path] = offset
+        if path != '/':
+            parent, name = split_path(path)
+            session['children'].setdefault(parent, set()).add(name)
+
+    def _remove(self, session, path):
+        rows = session['rows']
+        children = session['children']
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            if rows.pop(current, False) is not False:
+                self.garbage += 1
+            prefix = current if current != '/' else ''
+            stack.extend(f"{prefix}/{name}" for name in children.pop(current, ()))
+        if path != '/':
+            parent, name = split_path(path)
+            names = children.get(parent)
+            if names is not None:
+                names.discard(name)
+
+    def _read(self, offset):
+        self.reader.seek(offset)
+        return json.loads(self.reader.readline())[3]
+
+    def load_meta(self, key):
+        with self.lock:
+            session = self.sessions.get(key)
+            return session['meta'] if session else None
+
+    def load_node(self, key, path):
+        with self.lock:
+            session = self.sessions.get(key)
+            offset = session['rows'].get(path) if session else None
+            return self._read(offset) if offset is not None else None
+
+    def load_children(self, key, path):
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                return []
+            prefix = path if path != '/' else ''
+            result = []
+            for name in session['children'].get(path, ()):
+                offset = session['rows'][f"{prefix}/{name}"]
+                result.append((name, self._read(offset) if offset is not None else None))
+            return result
+
+    def iter_rows(self, key):
+        with self.lock:
+            session = self.sessions.get(key)
+            rows = sorted(session['rows'].items()) if session else []
+            return [(path, self._read(offset) if offset is not None else None) for path, offset in rows]
+
+    def write_batch(self, key, meta, rows, removed, reset=False):
+        ops = []
+        if reset:
+            ops.append(['reset', key])
+        ops.extend(['del', key, path] for path in removed)
+        ops.extend(['put', key, path, record] for path, record in rows)
+        ops.append(['meta', key, meta])
+        with self.lock:
+            self._append(ops)
+            self.batches += 1
+            live = sum(len(session['rows']) for session in self.sessions.values())
+            if self.garbage > self.compact_threshold and self.garbage > live:
+                self._compact()
+
+    def _append(self, ops):
+        offset = self.writer.tell()
+        data = []
+        for op in ops:
+            line = (json.dumps(op) + '\n').encode('utf-8')
+            self._apply(op, offset)
+            offset += len(line)
+            data.append(line)
+        data.append(b'["commit"]\n')
+        self.writer.write(b''.join(data))
+        self.writer.flush()
+        if self.fsync:
+            os.fsync(self.writer.fileno())
+
+    def _compact(self):
+        snapshot = []
+        for key, session in self.sessions.items():
+            rows = [(path, self._read(offset) if offset is not None else None) for path, offset in session['rows'].items()]
+            snapshot.append((key, session['meta'], rows))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for key, meta, rows in snapshot:
+                for path, record in rows:
+                    f.write((json.dumps(['put', key, path, record]) + '\n').encode('utf-8'))
+                f.write((json.dumps(['meta', key, meta]) + '\n').encode('utf-8'))
+            f.write(b'["commit"]\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.writer.close()
+        self.reader.close()
+        os.replace(tmp_path, self.path)
+        self.sessions = {}
+        self.garbage = 0
+        self._replay()
+        self.writer = open(self.path, 'ab')
+        self.reader = open(self.path, 'rb')
+
+    def drop(self, key):
+        with self.lock:
+            if key in self.sessions:
+                self._append([['drop', key]])
+
+    def get_stats(self):
+        with self.lock:
+            rows = sum(len(session['rows']) for session in self.sessions.values())
+            return {'backend': 'log', 'path': self.path, 'sessions': len(self.sessions), 'rows': rows,
+                    'batches': self.batches, 'garbage': self.garbage}
+
+    def close(self):
+        with self.lock:
+            self.writer.close()
+            self.reader.close()
+
+
+def open_storage(url):
+    if not url or url == 'memory':
+        return MemoryStorage()
+    scheme, _, path = url.partition(':')
+    if path.startswith('//'):
+        path = path[2:]
+    if scheme == 'sqlite':
+        return SQLiteStorage(path)
+    if scheme == 'log':
+        return LogStorage(path)
+    raise ValueError(f"unknown storage backend: {url}")
@@ -0,0 +1,88 @@
+import threading
+import time
+from contextlib import nullcontext
+
+
+class OutputStream:
+    frame_size = 16384
+    interval = 0.02
+    window = 4
+    ack_timeout = 5
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.token = None
+        self.buffer = []
+        self.size = 0
+        self.since = 0.0
+        self.unacked = 0
+        self.mutex = threading.Lock()
+        self.credit = threading.Event()
+        self.credit.set()
+        self.stalled = False
+        self.flushing = False
+
+    def write(self, text):
+        if not text:
+            return
+        if not self.buffer:
+            self.since = time.monotonic()
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= self.frame_size or time.monotonic() - self.since >= self.interval:
+            self.flush()
+
+    def poll(self):
+        if self.buffer and time.monotonic() - self.since >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.flushing or not self.buffer:
+            return
+        self.flushing = True
+        try:
+            text = ''.join(self.buffer)
+            self.buffer = []
+            self.size = 0
+            for start in range(0, len(text), self.frame_size):
+                self.send(text[start:start + self.frame_size])
+        finally:
+            self.flushing = False
+
+    def send(self, frame):
+        if self.stalled:
+            self.emit(frame, None)
+            return
+        self.wait()
+        with self.mutex:
+            self.unacked += 1
+            if self.unacked >= self.window:
+                self.credit.clear()
+        self.emit(frame, self.ack)
+
+    def ack(self, *args):
+        with self.mutex:
+            self.unacked -= 1
+            if self.unacked < self.window:
+                self.credit.set()
+
+    def wait(self):
+        if self.credit.is_set():
+            return
+        token = self.token
+        deadline = time.monotonic() + self.ack_timeout
+        with token.idle() if token is not None else nullcontext():
+            while not self.credit.wait(0.05):
+                if token is not None and token.expired():
+                    return
+                if time.monotonic() > deadline:
+                    self.stalled = True
+                    return
+
+    def close(self):
+        if self.size > self.frame_size:
+            self.flush()
+        text = ''.join(self.buffer)
+        self.buffer = []
+        self.size = 0
+        return text
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='module')
+def system():
+    app = pytest.importorskip('app')
+    system = app.LinuxSystem('test')
+    system.boot(lambda message: None)
+    return system
@@ -0,0 +1,35 @@
+from filesystem import FileSystem
+
+
+def populated():
+    fs = FileSystem()
+    fs.initialize()
+    fs.indexing = True
+    fs.mkdir('/srv/a/b', parents=True)
+    fs.mkdir('/srv/x')
+    for name in ('one', 'two'):
+        fs.write_file(f'/srv/a/b/{name}', f'needle {name}\n')
+        fs.write_file(f'/srv/a/{name}', 'hay\n')
+    fs.write_file('/srv/x/y', 'needle\n')
+    fs.symlink('/srv/x', '/srv/a/link')
+    return fs
+
+
+def buckets(index):
+    return {path: set(children) for path, children in index.tree.items()}
+
+
+def test_deleted_directory_is_dropped_from_indexes():
+    fs = populated()
+    content, names = fs.get_content_index(), fs.get_name_index()
+    assert fs.delete('/srv/a', recursive=True)
+    fs.get_content_index()
+    fs.get_name_index()
+    assert content.search('/srv', [['needle']]) == (['/srv/x/y'], [])
+    assert sorted(names.search('/srv', [('*', False)])) == ['/srv', '/srv/x', '/srv/x/y']
+    assert not any(path.startswith('/srv/a') for path in content.tree)
+    assert not any(path.startswith('/srv/a') for path in names.tree)
+    for index in (content, names):
+        tree = buckets(index)
+        index.rebuild()
+        assert tree == buckets(index)
@@ -0,0 +1,75 @@
+import copy
+
+from filesystem import FileSystem
+
+
+def new_filesystem():
+    fs = FileSystem()
+    fs.initialize()
+    return fs
+
+
+def assert_consistent(fs):
+    totals = (fs.root.total_bytes, fs.root.total_inodes)
+    usage = {owner: used for owner, used in copy.deepcopy(fs.owner_usage).items() if used != [0, 0]}
+    fs._recount(fs.root)
+    assert totals == (fs.root.total_bytes, fs.root.total_inodes)
+    assert usage == {owner: used for owner, used in fs.owner_usage.items() if used != [0, 0]}
+
+
+def test_hard_link_totals_and_usage():
+    fs = new_filesystem()
+    fs.mkdir('/tmp/a')
+    fs.mkdir('/tmp/b')
+    fs.write_file('/tmp/a/f', 'hello\n')
+    before = list(fs.owner_usage['root'])
+    assert fs.link('/tmp/a/f', '/tmp/b/g')
+    assert fs.owner_usage['root'] == before
+    assert_consistent(fs)
+
+    assert fs.write_file('/tmp/b/g', 'more\n', append=True)
+    assert fs.get_node('/tmp/a').total_bytes == fs.get_node('/tmp/b').total_bytes
+    assert fs.owner_usage['root'][0] == before[0] + 5
+    assert_consistent(fs)
+
+    assert fs.delete('/tmp/a/f')
+    assert fs.owner_usage['root'][1] == before[1]
+    assert_consistent(fs)
+
+    assert fs.delete('/tmp/b/g')
+    assert fs.owner_usage['root'] == [before[0] - 6, before[1] - 1]
+    assert_consistent(fs)
+
+
+def test_hard_link_delta_accounting():
+    src = new_filesystem()
+    src.mkdir('/tmp/a')
+    src.write_file('/tmp/a/f', 'one\n')
+    src.link('/tmp/a/f', '/tmp/a/g')
+    dst = new_filesystem()
+    dst.apply_delta(src.changes_since(0, src.epoch))
+    assert_consistent(dst)
+
+    since = src.version
+    src.write_file('/tmp/a/g', 'two\n', append=True)
+    dst.apply_delta(src.changes_since(since, src.epoch))
+    assert dst.read_file('/tmp/a/f') == 'one\ntwo\n'
+    assert dst.get_inode(dst.get_node('/tmp/a/f').inode) is dst.get_node('/tmp/a/f')
+    assert_consistent(dst)
+
+
+def test_version_only_moves_on_mutation():
+    fs = new_filesystem()
+    fs.mkdir('/tmp/a')
+    fs.chmod('/tmp/a', 0o755)
+    version = fs.version
+    assert not fs.chmod('/missing', 0o755)
+    assert not fs.chown('/missing/x', 'root')
+    assert not fs.touch('/missing/x')
+    assert fs.chmod('/tmp/a', 0o755)
+    assert fs.chown('/tmp/a', fs.get_node('/tmp/a').owner)
+    assert fs.mkdir('/tmp/a', parents=True)
+    assert fs.version == version
+
+    assert fs.chmod('/tmp/a', 0o700)
+    assert fs.version > version
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from jobs import FairLock, Foreground
+
+
+def test_fair_lock_serves_waiters_in_order():
+    lock = FairLock()
+    order = []
+    lock.acquire()
+    threads = []
+    for name in 'abc':
+        thread = threading.Thread(target=lambda name=name: (lock.acquire(), order.append(name), lock.release()))
+        thread.start()
+        threads.append(thread)
+        while lock.next_ticket - lock.serving < len(threads) + 1:
+            time.sleep(0.001)
+    assert lock.contended()
+    lock.release()
+    for thread in threads:
+        thread.join(1)
+    assert order == ['a', 'b', 'c']
+    assert not lock.contended()
+
+
+def test_foreground_preempt_hands_over_when_contended():
+    lock = FairLock()
+    foreground = Foreground(lock)
+    entered = threading.Event()
+
+    def waiter():
+        with foreground:
+            entered.set()
+
+    with foreground:
+        foreground.preempt()
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        while not lock.contended():
+            time.sleep(0.001)
+        foreground.preempt()
+        assert entered.is_set()
+        assert foreground.held
+    thread.join(1)
+
+
+def test_background_job_and_wait(system):
+    assert system.execute_command('sleep 0.1 &').startswith('[1] ')
+    pid = system.execute_command('echo $!').strip()
+    assert system.execute_command('jobs') == '[1]+  Running                 sleep 0.1 &\n'
+    assert system.execute_command('jobs -l') == f'[1]+ {pid} Running                 sleep 0.1 &\n'
+    assert system.execute_command('wait %1; echo $?') == '0\n[1]+  Done                    sleep 0.1\n'
+    assert system.execute_command('jobs') == ''
+
+
+def test_kill_job(system):
+    output = system.execute_command('sleep 5 & kill %1; wait %1; echo $?')
+    assert output.endswith('143\n[1]+  Terminated              sleep 5\n')
+    assert system.execute_command('wait %1') == '-bash: wait: %1: no such job\n'
+    assert system.last_exit_code == 127
+
+
+def test_stop_continue_fg_bg(system):
+    system.execute_command('sleep 5 &')
+    assert system.execute_command('kill -STOP %1') == '[1]+  Stopped                 sleep 5\n'
+    assert system.execute_command('jobs') == '[1]+  Stopped                 sleep 5\n'
+    assert system.execute_command('bg %1') == '[1]+ sleep 5 &\n'
+    assert system.execute_command('jobs') == '[1]+  Running                 sleep 5 &\n'
+    assert system.execute_command('kill -STOP %1; kill -CONT %1; jobs') == '[1]+  Running                 sleep 5 &\n[1]+  Stopped                 sleep 5\n'
+    assert system.execute_command('kill -9 %1; wait %1; echo $?') == '137\n[1]+  Killed                  sleep 5\n'
+    system.execute_command('sleep 0.1 &')
+    assert system.execute_command('fg; echo $?') == 'sleep 0.1\n0\n'
+
+
+def test_job_output_is_held_without_listener(system):
+    system.execute_command('(echo out; exit 3) &')
+    time.sleep(0.2)
+    assert system.execute_command('true') == 'out\n[1]+  Exit 3                  ( echo out; exit 3 )\n'
+
+
+def test_job_output_goes_to_listener(system):
+    delivered = []
+    system.jobs.listener = delivered.append
+    try:
+        system.execute_command('(echo hi; sleep 0.05) &')
+        deadline = time.monotonic() + 2
+        while not delivered and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        system.jobs.listener = None
+    assert delivered == ['hi\n[1]+  Done                    ( echo hi; sleep 0.05 )\n']
+    assert system.execute_command('true') == ''
@@ -0,0 +1,70 @@
+def write_script(system, path, *lines, mode='755'):
+    system.execute_command(f'rm -f {path}')
+    for line in lines:
+        system.filesystem.write_file(path, line + '\n', append=True)
+    system.execute_command(f'chmod {mode} {path}')
+
+
+def test_if_elif_else(system):
+    command = 'if [ $x -eq 1 ]; then echo one; elif [ $x -eq 2 ]; then echo two; else echo other; fi'
+    assert system.execute_command('x=2; ' + command) == 'two\n'
+    assert system.execute_command('x=5; ' + command) == 'other\n'
+
+
+def test_loops_with_break_and_continue(system):
+    assert system.execute_command('for x in a b c; do if [ $x = b ]; then continue; fi; echo $x; done') == 'a\nc\n'
+    assert system.execute_command('i=0; while true; do i=$((i+1)); if [ $i -eq 5 ]; then break; fi; done; echo $i') == '5\n'
+    assert system.execute_command('i=0; until [ $i -ge 3 ]; do i=$((i+1)); done; echo $i') == '3\n'
+    assert system.execute_command('for i in 1 2; do for j in a b; do echo $i$j; break 2; done; done') == '1a\n'
+
+
+def test_case_patterns(system):
+    command = 'case $f in *.sh) echo script;; *.txt|*.md) echo text;; *) echo other;; esac'
+    assert system.execute_command('f=notes.md; ' + command) == 'text\n'
+    assert system.execute_command('f=run.sh; ' + command) == 'script\n'
+    assert system.execute_command('f=bin; ' + command) == 'other\n'
+
+
+def test_function_scoping_and_return(system):
+    assert system.execute_command('v=global; f() { local v=inner; echo $v; }; f; echo $v') == 'inner\nglobal\n'
+    assert system.execute_command('f() { w=leaked; return 3; }; f; echo $? $w') == '3 leaked\n'
+
+
+def test_positional_parameters(system):
+    output = system.execute_command('g() { echo $# $1; shift; echo $1; }; g a "b c" d')
+    assert output == '3 a\nb c\n'
+    output = system.execute_command('each() { for a in "$@"; do echo "[$a]"; done; }; each "x y" z')
+    assert output == '[x y]\n[z]\n'
+    assert system.execute_command('echo ${unset_name:-fallback} ${unset_name:+set}') == 'fallback\n'
+
+
+def test_source_sees_edits(system):
+    write_script(system, '/tmp/edit.sh', 'echo aaaa')
+    assert system.execute_command('source /tmp/edit.sh') == 'aaaa\n'
+    write_script(system, '/tmp/edit.sh', 'echo bbbb')
+    assert system.execute_command('source /tmp/edit.sh') == 'bbbb\n'
+    system.filesystem.write_file('/tmp/edit.sh', 'echo c\n', append=True)
+    assert system.execute_command('. /tmp/edit.sh') == 'bbbb\nc\n'
+
+
+def test_exec_script_with_interpreter(system):
+    write_script(system, '/tmp/ok.sh', '#!/bin/bash', 'echo args $# $1', 'exit 7', 'echo never')
+    assert system.execute_command('/tmp/ok.sh one two') == 'args 2 one\n'
+    assert system.last_exit_code == 7
+    assert system.execute_command('cd /tmp && ./ok.sh z') == 'args 1 z\n'
+    assert system.execute_command('bash -c \'echo $0 $1\' name arg') == 'name arg\n'
+
+
+def test_exec_script_with_bad_interpreter(system):
+    write_script(system, '/tmp/bad.sh', '#!/bin/nonexistent', 'echo never')
+    assert system.execute_command('/tmp/bad.sh') == '-bash: /tmp/bad.sh: /bin/nonexistent: bad interpreter: No such file or directory\n'
+    assert system.last_exit_code == 126
+    write_script(system, '/tmp/plain.sh', 'echo never', mode='644')
+    assert system.execute_command('/tmp/plain.sh') == '-bash: /tmp/plain.sh: Permission denied\n'
+    assert system.last_exit_code == 126
+
+
+def test_exit_inside_script(system):
+    write_script(system, '/tmp/exit.sh', 'echo before', 'if true; then exit 4; fi', 'echo after')
+    assert system.execute_command('bash /tmp/exit.sh; echo rc=$?') == 'before\nrc=4\n'
+    assert system.execute_command('source /tmp/exit.sh; echo rc=$?') == 'before\nrc=4\n'
@@ -0,0 +1,89 @@
+import os
+
+
+def test_grep_recursive_invert_with_index(system):
+    system.filesystem.indexing = True
+    system.execute_command('mkdir -p /srv/grep; echo needle > /srv/grep/a; echo hay > /srv/grep/b; echo needle >> /srv/grep/b; echo straw > /srv/grep/c')
+    assert system.execute_command('grep -r needle /srv/grep') == '/srv/grep/a:needle\n/srv/grep/b:needle\n'
+    assert system.execute_command('grep -rv needle /srv/grep') == '/srv/grep/b:hay\n/srv/grep/c:straw\n'
+    assert system.last_exit_code == 0
+    assert system.execute_command('grep -rvc needle /srv/grep') == '/srv/grep/a:0\n/srv/grep/b:1\n/srv/grep/c:1\n'
+
+
+def test_time_budget_expires_inside_loop(system):
+    saved = dict(system.limits)
+    system.limits['time'] = 0.2
+    try:
+        output = system.execute_command('i=0; while true; do i=$((i+1)); done; echo $i')
+    finally:
+        system.limits.update(saved)
+    assert output in ('-bash: time limit exceeded (0.2s)\n', '-bash: while: time limit exceeded (0.2s)\n')
+    assert system.last_exit_code == 124
+
+
+def test_arithmetic_treats_unset_variables_as_zero(system):
+    system.execute_command('unset y n')
+    assert system.execute_command('echo $((y+1))') == '1\n'
+    assert system.execute_command('n=$((n+1)); echo $n') == '1\n'
+    assert system.last_exit_code == 0
+
+
+def test_arithmetic_counter_in_loop(system):
+    output = system.execute_command('unset k; while [ $((k)) -lt 3 ]; do k=$((k+1)); done; echo $k')
+    assert output == '3\n'
+
+
+def test_arithmetic_in_sourced_script(system):
+    system.execute_command("echo 'c=$((c+1))' > /tmp/count.sh; echo 'echo $c $((missing*2))' >> /tmp/count.sh")
+    system.execute_command('unset c')
+    assert system.execute_command('source /tmp/count.sh') == '1 0\n'
+    assert system.last_exit_code == 0
+    assert system.execute_command('. /tmp/count.sh') == '2 0\n'
+
+
+def test_arithmetic_errors_abort_the_command(system):
+    assert system.execute_command('echo $((1/0))') == '-bash: 1/0: division by 0 (error token is "0")\n'
+    assert system.last_exit_code == 1
+    assert system.execute_command('x=$((1/0)) && echo no') == '-bash: 1/0: division by 0 (error token is "0")\n'
+    assert system.execute_command('echo $((a?1:2))') == '-bash: a?1:2: syntax error in expression (unsupported operator: ?:)\n'
+    assert system.execute_command('echo $((i++)); echo $?') == '1\n-bash: i++: syntax error in expression (unsupported operator: ++)\n'
+    assert system.execute_command('echo $((1 - -1)) $((3 <= 4)) $((2 != 2))') == '2 1 0\n'
+
+
+def test_find_order_does_not_depend_on_index(system):
+    fs = system.filesystem
+    saved = fs.indexing
+    system.execute_command('mkdir -p /srv/find/zz /srv/find/aa; touch /srv/find/zz/x.txt /srv/find/b.txt /srv/find/aa/x.txt /srv/find/a.txt')
+    try:
+        fs.indexing = False
+        walked = system.execute_command('find /srv/find -name "*.txt"')
+        fs.indexing = True
+        indexed = system.execute_command('find /srv/find -name "*.txt"')
+    finally:
+        fs.indexing = saved
+    assert walked == '/srv/find/zz/x.txt\n/srv/find/aa/x.txt\n/srv/find/b.txt\n/srv/find/a.txt\n'
+    assert indexed == walked
+
+
+def test_proc_reflects_session_changes(system):
+    saved = system.hostname
+    try:
+        assert system.execute_command('cat /proc/sys/kernel/hostname') == f'{saved}\n'
+        assert system.execute_command('hostname renamed; cat /proc/sys/kernel/hostname') == 'renamed\n'
+    finally:
+        system.hostname = saved
+
+
+def test_proc_forgets_exited_processes(system):
+    provider = system.filesystem.virtual['/proc']
+    system.execute_command('sleep 0.01 & cat /proc/$!/status > /dev/null; wait')
+    pid = str(system.jobs.last_pid)
+    system.execute_command('ls /proc > /dev/null')
+    assert not any(key.partition('/')[0] == pid for key in provider.inodes)
+
+
+def test_shell_pid_is_the_session_shell(system):
+    pid = system.execute_command('echo $$').strip()
+    assert pid != str(os.getpid())
+    assert any(line.split()[1] == pid and line.endswith('-bash') for line in system.execute_command('ps aux').splitlines()[1:])
+    assert pid in system.execute_command('echo $$ & wait').splitlines()
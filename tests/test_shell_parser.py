@@ -0,0 +1,91 @@
+import pytest
+
+from shell_parser import ParseError, Parser, parse, parse_script, unparse
+
+
+def first_command(source):
+    command, background = parse(source).items[0]
+    return command.first.commands[0]
+
+
+def test_quoting_and_escapes():
+    words = first_command('echo \'a b\' "c $x" d\\ e "" \'\'').words
+    assert words == [
+        (('lit', 'echo'),),
+        (('sq', 'a b'),),
+        (('dq', 'c $x'),),
+        (('lit', 'd'), ('sq', ' '), ('lit', 'e')),
+        (('dq', ''),),
+        (('sq', ''),),
+    ]
+    assert first_command('echo "a \\"b\\" \\$c"').words[1] == (('dq', 'a '), ('sq', '"'), ('dq', 'b'), ('sq', '"'), ('dq', ' '), ('sq', '$'), ('dq', 'c'))
+
+
+def test_redirects():
+    command = first_command('cmd > out 2>&1 >> log < in')
+    assert [(r.fd, r.op, r.target) for r in command.redirects] == [
+        (None, '>', (('lit', 'out'),)),
+        (2, '>&', (('lit', '1'),)),
+        (None, '>>', (('lit', 'log'),)),
+        (None, '<', (('lit', 'in'),)),
+    ]
+    assert command.words == [(('lit', 'cmd'),)]
+
+
+def test_list_and_or_precedence():
+    tree = parse('a && b || c; d & e')
+    assert [(unparse(command), background) for command, background in tree.items] == [
+        ('a && b || c', False),
+        ('d', True),
+        ('e', False),
+    ]
+    and_or = tree.items[0][0]
+    assert unparse(and_or.first) == 'a'
+    assert [(op, unparse(pipeline)) for op, pipeline in and_or.rest] == [('&&', 'b'), ('||', 'c')]
+    assert unparse(parse('a | b && ! c | d')) == 'a | b && ! c | d'
+
+
+def test_subshells_and_groups():
+    tree = parse('(cd /tmp; ls) && { echo a; echo b; } > out')
+    and_or = tree.items[0][0]
+    subshell = and_or.first.commands[0]
+    group = and_or.rest[0][1].commands[0]
+    assert subshell.kind == 'subshell'
+    assert unparse(subshell.body) == 'cd /tmp; ls'
+    assert group.kind == 'group'
+    assert unparse(group.body) == 'echo a; echo b'
+    assert [r.op for r in group.redirects] == ['>']
+
+
+def test_comments():
+    assert unparse(parse('echo a # comment\n# whole line\necho b#c')) == 'echo a; echo b#c'
+    assert unparse(parse("echo '# not a comment'")) == "echo '# not a comment'"
+
+
+@pytest.mark.parametrize('source, message', [
+    ("echo 'abc", "unexpected EOF while looking for matching `''"),
+    ('echo "abc', "unexpected EOF while looking for matching `\"'"),
+    ('echo `abc', "unexpected EOF while looking for matching ``'"),
+    ('( echo', 'syntax error: unexpected end of file'),
+    ('a &&', 'syntax error: unexpected end of file'),
+    ('echo ;;', "syntax error near unexpected token `;;'"),
+])
+def test_syntax_errors(source, message):
+    with pytest.raises(ParseError) as error:
+        parse(source)
+    assert str(error.value) == message
+
+
+def test_nesting_limit():
+    depth = Parser.max_depth - 1
+    assert unparse(parse('(' * depth + 'true' + ')' * depth)).count('(') == depth
+    for source in ('(' * Parser.max_depth + 'true' + ')' * Parser.max_depth,
+                   'if true; then ' * Parser.max_depth + 'true' + '; fi' * Parser.max_depth):
+        with pytest.raises(ParseError) as error:
+            parse_script(source)
+        assert str(error.value) == f'maximum nesting level exceeded ({Parser.max_depth})'
+
+
+def test_parse_cache():
+    assert parse('echo cached') is parse('echo cached')
+    assert parse_script('echo fresh') is not parse_script('echo fresh')
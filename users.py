@@ -38,6 +38,7 @@ class UserManager:
         self.filesystem.write_file('/etc/passwd', current + passwd_line)
         
         self.filesystem.mkdir(home, parents=True)
+        self.filesystem.chown(home, username, username)
         return ''
 
     def del_user(self, username, remove_home=False):
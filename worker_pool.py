@@ -0,0 +1,71 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WorkerPool:
+    def __init__(self, max_workers=32, max_session_queue=16, max_pending=1024):
+        self.max_workers = max_workers
+        self.max_session_queue = max_session_queue
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pylinux-worker')
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(self, session_id, func, *args):
+        with self.lock:
+            queue = self.queues.get(session_id)
+            depth = len(queue) if queue is not None else 0
+            if self.pending >= self.max_pending or depth >= self.max_session_queue:
+                self.rejected += 1
+                return False
+            self.pending += 1
+            self.submitted += 1
+            if queue is None:
+                self.queues[session_id] = deque([(func, args)])
+                self.executor.submit(self._run_next, session_id)
+            else:
+                queue.append((func, args))
+        return True
+
+    def _run_next(self, session_id):
+        with self.lock:
+            func, args = self.queues[session_id][0]
+        try:
+            func(*args)
+        except Exception:
+            with self.lock:
+                self.failed += 1
+        with self.lock:
+            queue = self.queues[session_id]
+            queue.popleft()
+            self.pending -= 1
+            self.completed += 1
+            if queue:
+                self.executor.submit(self._run_next, session_id)
+            else:
+                del self.queues[session_id]
+
+    def queue_depth(self, session_id):
+        with self.lock:
+            queue = self.queues.get(session_id)
+            return len(queue) if queue is not None else 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_session_queue': self.max_session_queue,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'active_sessions': len(self.queues),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'failed': self.failed,
+            }